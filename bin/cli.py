@@ -27,6 +27,7 @@ def get_settings_command():
         'AZ_STORAGE_ACCOUNT_NAME',
         'AZ_STORAGE_CONTAINER',
         'AZ_STORAGE_KEY',
+        'MEMCACHED_LOCATION',
     )
     settings_pairs = ['{}={}'.format(k, os.getenv(k)) for k in SETTINGS_KEYS]
     return settings_command + settings_pairs
@@ -52,6 +53,13 @@ def main(check_env, deploying):
         process_migrate = subprocess.check_call(
             ['python', 'manage.py', 'migrate'])
 
+    # Production settings serve fingerprinted files from a manifest, which
+    # only exists once the static files are built.
+    build_static = input("Build the static files? [Y/n]: ")
+    if build_static != 'n':
+        process_build_static = subprocess.check_call(
+            ['python', 'manage.py', 'build_static'])
+
     prepopulate = input("Prepopulate the database? [y/n]: ")
     # TODO: this should be done by default in the migration step
     if prepopulate == 'y':
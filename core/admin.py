@@ -1,22 +1,95 @@
+import datetime
+
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 
-from .models import Item, OrderItem, Order, Payment, Coupon, Refund
+from .exports import parse_export_date
+from .models import Item, OrderItem, Order, Payment, Coupon, Refund, StockReservation
+from .refunds import queue_refunds
+from .reports import sales_report
 
 def accept_refund(modeladmin, request, queryset):
-    queryset.update(refund_requested=False, refund_granted=True)
+    # Refunds go through Stripe, which can take minutes for a large
+    # selection: they are issued in the background and their results logged.
+    # The orders are marked for refund first, so the issue_refunds command
+    # still refunds any the pool loses to a failure or a restart.
+    queryset.filter(refund_granted=False, payment__status=Payment.SUCCEEDED).update(refund_requested=True)
+    order_ids = list(queryset.values_list('pk', flat=True))
+    queue_refunds(order_ids)
+    modeladmin.message_user(request, 'Queued %d orders for refund. Any still marked for refund afterwards, '
+                                     'e.g. after a failure or a restart, are refunded by the issue_refunds '
+                                     'command.' % len(order_ids))
+
+accept_refund.short_description = 'Refund orders through Stripe'
 
-accept_refund.short_description = 'Update orders to refund granted'
+class ItemAdmin(admin.ModelAdmin):
+    list_display = ['title', 'slug', 'price', 'price_discount', 'category', 'label', 'stock', 'reserved', 'modified']
+    list_filter = ['category', 'label']
+    search_fields = ['title', 'slug']
+    prepopulated_fields = {'slug': ['title']}
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['user', 'ordered', 'delivered', 'received', 'refund_requested', 'refund_granted', 'billing_address', 'payment', 'coupon']
-    list_filter = ['ordered', 'delivered', 'received', 'refund_requested', 'refund_granted']
+    list_display = ['user', 'ordered', 'ordered_date', 'total', 'delivered', 'received', 'refund_requested', 'refund_granted', 'billing_address', 'payment', 'coupon']
+    list_filter = ['ordered', 'refund_requested', 'delivered', 'received', 'refund_granted']
     list_display_links = ['billing_address', 'payment', 'coupon']
+    list_select_related = ['user', 'billing_address__user', 'payment__user', 'coupon']
+    date_hierarchy = 'ordered_date'
     search_fields = ['user__username', 'ref_code']
     actions = [accept_refund]
 
-admin.site.register(Item)
-admin.site.register(OrderItem)
+    def get_urls(self):
+        return [
+            path('sales-report/', self.admin_site.admin_view(self.sales_report_view),
+                 name='core_order_sales_report'),
+        ] + super().get_urls()
+
+    def sales_report_view(self, request):
+        today = timezone.localdate()
+        try:
+            start = parse_export_date(request.GET.get('start')) or today - datetime.timedelta(days=29)
+            end = parse_export_date(request.GET.get('end')) or today
+        except ValueError:
+            start, end = today - datetime.timedelta(days=29), today
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Sales report',
+            report=sales_report(start, end),
+        )
+        return TemplateResponse(request, 'admin/core/order/sales_report.html', context)
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'user', 'ordered', 'unit_price', 'unit_price_discount']
+    list_filter = ['ordered']
+    list_select_related = ['item', 'user']
+
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'amount', 'status', 'timestamp', 'attempts', 'stripe_charge_id', 'stripe_refund_id']
+    list_filter = ['status']
+    list_select_related = ['user']
+    date_hierarchy = 'timestamp'
+    search_fields = ['stripe_charge_id', 'stripe_refund_id', 'user__username']
+
+class CouponAdmin(admin.ModelAdmin):
+    list_display = ['code', 'amount', 'valid_from', 'valid_until', 'redemption_count', 'max_redemptions']
+    search_fields = ['code']
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'order', 'expires_at']
+    list_select_related = ['item', 'order__user']
+    search_fields = ['item__slug', 'order__user__username']
+
+class RefundAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'order', 'email', 'accepted']
+    list_filter = ['accepted']
+    list_select_related = ['order__user']
+
+admin.site.register(Item, ItemAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(Payment)
-admin.site.register(Coupon)
-admin.site.register(Refund)
\ No newline at end of file
+admin.site.register(Payment, PaymentAdmin)
+admin.site.register(Coupon, CouponAdmin)
+admin.site.register(StockReservation, StockReservationAdmin)
+admin.site.register(Refund, RefundAdmin)
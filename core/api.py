@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from .cart import EMPTY_CART_SUMMARY, update_cart_summary
+from .catalog import get_item
+from .guest_cart import GuestCart, get_cart, set_guest_cart_cookie
+from .middleware import get_request_stats
+from .models import Item, Order, OrderItem, Payment
+from .services import CartService
+
+MESSAGES = {
+    CartService.ADDED: "This item was added to your cart.",
+    CartService.UPDATED: "This item quantity was updated.",
+    CartService.REMOVED: "This item was removed from your cart.",
+    CartService.NOT_IN_CART: "This item was not in your cart.",
+    CartService.NO_ORDER: "You do not have an order.",
+    CartService.PAYMENT_PENDING: "Your cart cannot be changed while your payment is being processed.",
+}
+
+
+def _line_data(item, order_item):
+    if order_item is None:
+        order_item = OrderItem(item=item, quantity=0)
+    total_price = order_item.get_total_item_price()
+    final_price = order_item.get_final_price()
+    return {
+        'slug': item.slug,
+        'quantity': order_item.quantity,
+        'total_price': total_price,
+        'final_price': final_price,
+        'amount_saved': total_price - final_price,
+    }
+
+
+def _cart_data(request, cart, order):
+    if order is None:
+        return dict(EMPTY_CART_SUMMARY, subtotal=0.0, discount_total=0.0, coupon_discount=0.0)
+    if isinstance(cart, GuestCart):
+        return cart.get_summary()
+    data = update_cart_summary(request.user, order)
+    data.update(
+        subtotal=order.subtotal,
+        discount_total=order.discount_total,
+        coupon_discount=order.coupon_discount,
+    )
+    return data
+
+
+def _cart_response(request, slug, operation):
+    try:
+        item = get_item(slug)
+    except Item.DoesNotExist:
+        raise Http404('No item found matching the query')
+    cart = get_cart(request)
+    result = getattr(cart, operation)(item)
+    if result.status == CartService.PAYMENT_PENDING:
+        return JsonResponse({'status': result.status, 'message': MESSAGES[result.status]}, status=409)
+    return set_guest_cart_cookie(request, JsonResponse({
+        'status': result.status,
+        'message': MESSAGES[result.status],
+        'line': _line_data(item, result.order_item),
+        'cart': _cart_data(request, cart, result.order),
+    }))
+
+
+@require_POST
+def cart_add(request, slug):
+    return _cart_response(request, slug, 'add')
+
+
+@require_POST
+def cart_decrement(request, slug):
+    return _cart_response(request, slug, 'decrement')
+
+
+@require_POST
+def cart_remove(request, slug):
+    return _cart_response(request, slug, 'remove')
+
+
+def payment_status(request, key):
+    """
+    Report the state of a queued payment, polled by the payment status page.
+
+    Once the payment is finished the outcome is also added as a message and
+    the page is told where to go next.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "You need to log in."}, status=403)
+    payment = get_object_or_404(Payment, idempotency_key=key, user=request.user)
+    data = {'status': payment.get_status_display()}
+    if payment.status == Payment.SUCCEEDED and not Order.objects.filter(payment=payment, ordered=True).exists():
+        messages.warning(request, "Your order changed while it was being paid for. The charge will be refunded.")
+        data['redirect'] = reverse('core:order-summary')
+    elif payment.status == Payment.SUCCEEDED:
+        messages.success(request, "Your order was successful.")
+        data['redirect'] = reverse('core:home')
+    elif payment.status == Payment.FAILED:
+        messages.warning(request, payment.error)
+        data['redirect'] = reverse('core:payment', kwargs={'payment_option': 'stripe'})
+    return JsonResponse(data)
+
+
+@staff_member_required
+def request_stats(request):
+    """
+    The views of this process with the worst ``sort`` measurement (one of
+    the fields of ``get_request_stats``, p95 latency by default).
+    """
+    stats = get_request_stats()
+    sort = request.GET.get('sort', 'total_p95')
+    if stats and sort not in stats[0]:
+        return JsonResponse({'error': "Unknown sort field."}, status=400)
+    try:
+        limit = max(1, int(request.GET.get('limit', 10)))
+    except ValueError:
+        limit = 10
+    stats.sort(key=lambda row: row[sort], reverse=True)
+    return JsonResponse({'enabled': settings.REQUEST_STATS_ENABLED, 'views': stats[:limit]})
@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.core.exceptions import ImproperlyConfigured
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .checks import check_shared_cache
+
+        # System checks do not run under the WSGI server, so a production
+        # process refuses to start without a shared cache.
+        errors = check_shared_cache(None)
+        if errors:
+            raise ImproperlyConfigured('%s %s' % (errors[0].msg, errors[0].hint))
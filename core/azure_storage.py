@@ -0,0 +1,26 @@
+"""
+Static files on Azure blob storage (see ``djecommerce/azure.py``).
+
+Blob storage cannot pick an encoding per request, so every text asset is
+linked to its gzip sibling, stored with ``Content-Encoding: gzip``, which
+all browsers accept. Needs django-storages.
+"""
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from storages.backends.azure_storage import AzureStorage
+
+from .staticfiles import COMPRESSIBLE_EXTENSIONS, PrecompressMixin
+
+
+class AzureManifestStorage(PrecompressMixin, ManifestFilesMixin, AzureStorage):
+    precompressed_suffixes = ('.gz',)
+    # Linked to unconditionally, so always written.
+    min_compression_ratio = None
+
+    def url(self, name, force=False):
+        # The blobs are always collected, so link to the fingerprinted names
+        # even when DEBUG is on.
+        url = super().url(name, force=True)
+        if name.endswith(COMPRESSIBLE_EXTENSIONS):
+            path, _, query = url.partition('?')
+            url = path + '.gz' + ('?' + query if query else '')
+        return url
@@ -0,0 +1,237 @@
+"""
+A load generator driving the shop's own URLs.
+
+Every virtual user is a thread with its own ``django.test.Client`` logged
+in as one of the users created by ``seed_data``. Each iteration browses
+two catalog pages and a product, fills a cart, checks out and pays, with
+Stripe replaced by ``StripeStub``. Requests go through the full middleware
+and view stack in-process, so the numbers exclude only the web server.
+
+``run_render_benchmark`` times rendering alone: catalog pages of product
+cards with and without the cached template loader and fragment cache.
+"""
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .middleware import percentile
+from .models import Item
+from .pagination import encode_cursor
+
+CHECKOUT_DATA = {
+    'street_address': '1234 Main St',
+    'apartment_address': '',
+    'country': 'US',
+    'zip': '10001',
+    'payment_option': 'S',
+}
+
+
+def _scenario(rng, slugs, cursors):
+    """The requests of one iteration, as (name, method, url, data)."""
+    product, *cart = rng.sample(slugs, min(len(slugs), 3))
+    steps = [
+        ('home', 'get', reverse('core:home'), None),
+        ('home-page', 'get', reverse('core:home'), {'after': rng.choice(cursors)} if cursors else None),
+        ('product', 'get', reverse('core:product', kwargs={'slug': product}), None),
+    ]
+    steps += [('add-to-cart', 'get', reverse('core:add-to-cart', kwargs={'slug': slug}), None)
+              for slug in cart or [product]]
+    steps += [
+        ('order-summary', 'get', reverse('core:order-summary'), None),
+        ('checkout', 'get', reverse('core:checkout'), None),
+        ('checkout-post', 'post', reverse('core:checkout'), CHECKOUT_DATA),
+        ('payment', 'get', reverse('core:payment', kwargs={'payment_option': 'stripe'}), None),
+        ('payment-post', 'post', reverse('core:payment', kwargs={'payment_option': 'stripe'}),
+         {'stripeToken': 'tok_visa'}),
+    ]
+    return steps
+
+
+class _VirtualUser(threading.Thread):
+    def __init__(self, user, iterations, warmup, slugs, cursors, seed):
+        super().__init__(daemon=True)
+        self.user = user
+        self.iterations = iterations
+        self.warmup = warmup
+        self.slugs = slugs
+        self.cursors = cursors
+        self.rng = random.Random(seed)
+        self.samples = []
+
+    def run(self):
+        client = Client()
+        try:
+            client.force_login(self.user)
+            for iteration in range(self.warmup + self.iterations):
+                for name, method, url, data in _scenario(self.rng, self.slugs, self.cursors):
+                    sample = self.request(client, name, method, url, data)
+                    if iteration >= self.warmup:
+                        self.samples.append(sample)
+        finally:
+            connection.close()
+
+    def request(self, client, name, method, url, data):
+        error = None
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                response = getattr(client, method)(url, data)
+                if response.status_code >= 400:
+                    error = 'HTTP %d' % response.status_code
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+        return name, time.perf_counter() - start, len(queries), error
+
+
+def run_benchmark(users, iterations=5, warmup=1, page_size=10, seed=0):
+    """
+    Run ``iterations`` of the scenario for each of ``users`` concurrently
+    and return the results as a JSON-serializable dict.
+    """
+    slugs = list(Item.objects.values_list('slug', flat=True)[:1000])
+    if not slugs:
+        raise ValueError('The catalog is empty, run seed_data first')
+    cursors = [encode_cursor(item) for item in Item.objects.all()[page_size - 1:page_size * 5:page_size]]
+
+    threads = [
+        _VirtualUser(user, iterations, warmup, slugs, cursors, seed + n)
+        for n, user in enumerate(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    by_route = defaultdict(list)
+    errors = defaultdict(list)
+    for thread in threads:
+        for name, elapsed, queries, error in thread.samples:
+            by_route[name].append((elapsed, queries))
+            if error:
+                errors[name].append(error)
+
+    routes = {}
+    for name, samples in by_route.items():
+        latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+        queries = [count for _, count in samples]
+        routes[name] = {
+            'requests': len(samples),
+            'errors': len(errors[name]),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'created': timezone.now().isoformat(),
+        'users': len(threads),
+        'iterations': iterations,
+        'duration': round(duration, 3),
+        'requests': total,
+        'errors': sum(len(route_errors) for route_errors in errors.values()),
+        'error_samples': sorted({error for route_errors in errors.values() for error in route_errors})[:10],
+        'throughput': round(total / duration, 2) if duration else 0.0,
+        'routes': routes,
+    }
+
+
+def compare(baseline, results, latency_threshold=0.2, query_threshold=0.5):
+    """
+    Return the regressions of ``results`` against ``baseline``: routes whose
+    p95 latency grew by more than ``latency_threshold`` (a fraction), or
+    whose mean query count grew by more than ``query_threshold`` queries,
+    and a throughput drop of more than ``latency_threshold``.
+    """
+    regressions = []
+    for name, route in sorted(results['routes'].items()):
+        base = baseline['routes'].get(name)
+        if base is None:
+            continue
+        if route['p95'] > base['p95'] * (1 + latency_threshold):
+            regressions.append('%s: p95 %.1fms, baseline %.1fms' % (name, route['p95'], base['p95']))
+        if route['queries'] > base['queries'] + query_threshold:
+            regressions.append('%s: %.1f queries, baseline %.1f' % (name, route['queries'], base['queries']))
+    if results['throughput'] < baseline['throughput'] * (1 - latency_threshold):
+        regressions.append('throughput %.1f req/s, baseline %.1f req/s' % (
+            results['throughput'], baseline['throughput']))
+    return regressions
+
+
+# A catalog page reduced to its product cards.
+CARD_PAGE = '{% for item in object_list %}{% include "product_card.html" %}{% endfor %}'
+
+# (name, cached template loader, warm fragment cache)
+RENDER_SCENARIOS = (
+    ('uncached-loader', False, False),
+    ('cached-loader', True, False),
+    ('cached-fragments', True, True),
+)
+
+
+def _template_backend(cached_loader):
+    loaders = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    if cached_loader:
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+    template_settings = settings.TEMPLATES[0]
+    return DjangoTemplates({
+        'NAME': 'render-benchmark',
+        'DIRS': template_settings['DIRS'],
+        'APP_DIRS': False,
+        'OPTIONS': dict(template_settings.get('OPTIONS', {}), loaders=loaders),
+    })
+
+
+def _card_items(count):
+    return [
+        Item(pk=n + 1, title='Item %d' % n, price=10.0 + n, price_discount=5.0 if n % 2 else None,
+             category='S', label='P', slug='render-benchmark-%d' % n, image='12.jpg', image_hash='0' * 64)
+        for n in range(count)
+    ]
+
+
+def run_render_benchmark(sizes=(10, 100), repeat=50):
+    """
+    Render catalog pages of each of ``sizes`` product cards ``repeat`` times
+    in every scenario, and return ``{size: {scenario: median ms}}``.
+
+    Without a warm fragment cache every card misses and is rendered and
+    stored, as on the first view of a page after its items changed.
+    """
+    results = {}
+    for size in sizes:
+        items = _card_items(size)
+        results[size] = {}
+        for name, cached_loader, warm in RENDER_SCENARIOS:
+            backend = _template_backend(cached_loader)
+            timings = []
+            for _ in range(repeat + 1):
+                # A new version per round misses every card, a fixed one hits.
+                version = 'warm' if warm else time.time_ns()
+                for item in items:
+                    item.version = version
+                context = {'object_list': items, 'fragment_timeout': 60}
+                started = time.perf_counter()
+                # The template is fetched on every render, as views do.
+                backend.from_string(CARD_PAGE).render(context)
+                timings.append((time.perf_counter() - started) * 1000)
+            # The first round compiles the templates and fills the caches.
+            results[size][name] = round(statistics.median(timings[1:]), 3)
+    return results
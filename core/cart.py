@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from .models import Order
+
+CART_SUMMARY_KEY = 'cart-summary:{}'
+EMPTY_CART_SUMMARY = {'item_count': 0, 'line_count': 0, 'total': 0.0}
+
+
+def _cache_key(user):
+    return CART_SUMMARY_KEY.format(user.pk)
+
+
+def summarize_order(order):
+    counts = order.items.aggregate(
+        item_count=Sum('quantity'), line_count=Count('id'))
+    return {
+        'item_count': counts['item_count'] or 0,
+        'line_count': counts['line_count'],
+        'total': order.total,
+    }
+
+
+def _build_cart_summary(user):
+    order = Order.objects.filter(user=user, ordered=False).first()
+    if order is None:
+        return dict(EMPTY_CART_SUMMARY)
+    return summarize_order(order)
+
+
+def get_cart_summary(user):
+    """
+    Return the item count, line count and total of the user's open order.
+
+    The summary is kept in the cache, so rendering it on every page (the
+    navbar badge) only hits the database after the cart was changed.
+    """
+    if not user.is_authenticated:
+        return dict(EMPTY_CART_SUMMARY)
+    key = _cache_key(user)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build_cart_summary(user)
+        cache.set(key, summary, settings.CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(user):
+    cache.delete(_cache_key(user))
+
+
+def update_cart_summary(user, order):
+    """
+    Recompute the summary from ``order`` and store it in place, for callers
+    that need the fresh summary right after changing the cart.
+    """
+    summary = summarize_order(order)
+    cache.set(_cache_key(user), summary, settings.CART_SUMMARY_TIMEOUT)
+    return summary
@@ -0,0 +1,93 @@
+"""
+Cache-aside lookups of catalog items by slug.
+
+Every slug has a version number in the cache, and cached items and
+rendered fragments are keyed by ``(slug, version)``. Saving or deleting an
+item bumps its version (see ``core.signals``), so stale entries are never
+read again and simply expire.
+
+The catalog as a whole also has a version, bumped on every item change,
+which listing pages use as their ETag.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Item
+
+ITEM_VERSION_KEY = 'item-version:{}'
+ITEM_KEY = 'item:{}:{}'
+CATALOG_VERSION_KEY = 'catalog-version'
+
+
+def get_item_version(slug):
+    key = ITEM_VERSION_KEY.format(slug)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version that was evicted
+        # from the cache cannot be reissued while entries keyed by it live.
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def set_item_versions(items):
+    """
+    Set ``version`` on each of ``items`` to its current item version, with
+    one cache read for all of them, for templates that cache a fragment
+    per item. Returns ``items``.
+    """
+    keys = {ITEM_VERSION_KEY.format(item.slug): item for item in items}
+    versions = cache.get_many(keys)
+    for key, item in keys.items():
+        item.version = versions[key] if key in versions else get_item_version(item.slug)
+    return items
+
+
+def bump_item_version(slug):
+    try:
+        cache.incr(ITEM_VERSION_KEY.format(slug))
+    except ValueError:
+        cache.set(ITEM_VERSION_KEY.format(slug), time.time_ns(), None)
+
+
+def invalidate_items(slugs):
+    """
+    Retire the cached versions of many items at once, for bulk writes that
+    bypass the signals. The next read starts each at a fresh version.
+    """
+    cache.delete_many([ITEM_VERSION_KEY.format(slug) for slug in slugs])
+
+
+def get_item(slug):
+    """
+    Return the item with ``slug``, from the cache if possible. Raises
+    ``Item.DoesNotExist`` like ``Item.objects.get``.
+    """
+    key = ITEM_KEY.format(slug, get_item_version(slug))
+    item = cache.get(key)
+    if item is None:
+        item = Item.objects.get(slug=slug)
+        cache.set(key, item, settings.CATALOG_CACHE_TIMEOUT)
+    return item
+
+
+def get_catalog_version():
+    """
+    Return ``(version, last modified)`` of the catalog. When the cache has
+    lost them, both start over from the current time, which costs clients
+    one full response but can never claim a stale page is current.
+    """
+    state = cache.get(CATALOG_VERSION_KEY)
+    if state is None:
+        state = (time.time_ns(), timezone.now())
+        if not cache.add(CATALOG_VERSION_KEY, state, None):
+            state = cache.get(CATALOG_VERSION_KEY, state)
+    return state
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, (time.time_ns(), timezone.now()), None)
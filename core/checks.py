@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries are only seen by the process that wrote them.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Guest carts and the versions that invalidate cached items, coupons and
+    pages must be seen by every process, so production needs a shared cache.
+    """
+    if getattr(settings, 'ENVIRONMENT', None) != 'production':
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        'The default cache (%s) is not shared between processes.' % backend,
+        hint='Configure a shared cache such as memcached in CACHES.',
+        id='core.E001',
+    )]
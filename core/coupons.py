@@ -0,0 +1,67 @@
+"""
+A process-local table of the coupons that can currently be redeemed.
+
+Looking up a code costs one cache read (the table's version) and a dict
+lookup; the database is only read when the version changed. The version
+is bumped when a coupon is saved or deleted (see ``core.signals``) and
+when its last redemption is taken or given back, so every process reloads
+its table on its next lookup.
+
+Redemptions themselves are reserved when a payment is created (see
+``core.payments``); the table only knows which coupons still had
+redemptions left when it was loaded.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon
+
+COUPON_VERSION_KEY = 'coupon-version'
+
+# (version, {code: Coupon}), replaced as a whole.
+_table = (None, {})
+_table_lock = threading.Lock()
+
+
+def get_coupon_version():
+    version = cache.get(COUPON_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(COUPON_VERSION_KEY, version, None):
+            version = cache.get(COUPON_VERSION_KEY, version)
+    return version
+
+
+def bump_coupon_version():
+    cache.set(COUPON_VERSION_KEY, time.time_ns(), None)
+
+
+def _load():
+    now = timezone.now()
+    coupons = (Coupon.objects
+               .filter(Q(valid_until__isnull=True) | Q(valid_until__gt=now))
+               .filter(Q(max_redemptions__isnull=True) | Q(redemption_count__lt=F('max_redemptions'))))
+    return {coupon.code: coupon for coupon in coupons}
+
+
+def get_coupon(code):
+    """
+    Return the coupon with ``code`` if it can be redeemed now, else None.
+    """
+    global _table
+    version = get_coupon_version()
+    table_version, coupons = _table
+    if table_version != version:
+        with _table_lock:
+            table_version, coupons = _table
+            if table_version != version:
+                coupons = _load()
+                _table = (version, coupons)
+    coupon = coupons.get(code.strip())
+    if coupon is None or not coupon.is_valid():
+        return None
+    return coupon
@@ -0,0 +1,140 @@
+"""
+Streaming exports of orders, order items, payments and refunds.
+
+Every export is a single ``values_list()`` query whose related columns are
+joined in, iterated in chunks (with a server-side cursor on PostgreSQL),
+so rows are written as they are read and memory use does not depend on
+the number of rows.
+"""
+import csv
+import datetime
+import json
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderItem, Payment, Refund
+
+# For each export: the queryset, the field that dates a row, and the
+# (column, lookup) pairs written for each row.
+EXPORTS = {
+    'orders': (Order.objects.filter(ordered=True), 'ordered_date', (
+        ('id', 'id'),
+        ('ref_code', 'ref_code'),
+        ('ordered_date', 'ordered_date'),
+        ('username', 'user__username'),
+        ('email', 'user__email'),
+        ('subtotal', 'subtotal'),
+        ('discount_total', 'discount_total'),
+        ('coupon', 'coupon__code'),
+        ('coupon_discount', 'coupon_discount'),
+        ('total', 'total'),
+        ('payment_id', 'payment_id'),
+        ('stripe_charge_id', 'payment__stripe_charge_id'),
+        ('street_address', 'billing_address__street_address'),
+        ('apartment_address', 'billing_address__apartment_address'),
+        ('country', 'billing_address__country'),
+        ('zip', 'billing_address__zip'),
+        ('delivered', 'delivered'),
+        ('received', 'received'),
+        ('refund_requested', 'refund_requested'),
+        ('refund_granted', 'refund_granted'),
+    )),
+    'order-items': (OrderItem.objects.filter(order__ordered=True), 'order__ordered_date', (
+        ('order_id', 'order__id'),
+        ('ref_code', 'order__ref_code'),
+        ('ordered_date', 'order__ordered_date'),
+        ('item', 'item__slug'),
+        ('title', 'item__title'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+        ('unit_price_discount', 'unit_price_discount'),
+    )),
+    'payments': (Payment.objects.all(), 'timestamp', (
+        ('id', 'id'),
+        ('timestamp', 'timestamp'),
+        ('idempotency_key', 'idempotency_key'),
+        ('stripe_charge_id', 'stripe_charge_id'),
+        ('stripe_refund_id', 'stripe_refund_id'),
+        ('username', 'user__username'),
+        ('amount_cents', 'amount'),
+        ('status', 'status'),
+        ('attempts', 'attempts'),
+        ('error', 'error'),
+    )),
+    # Refund requests are not dated themselves, so they are selected by the
+    # date of their order.
+    'refunds': (Refund.objects.all(), 'order__ordered_date', (
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('ref_code', 'order__ref_code'),
+        ('ordered_date', 'order__ordered_date'),
+        ('email', 'email'),
+        ('reason', 'reason'),
+        ('accepted', 'accepted'),
+    )),
+}
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+
+
+def parse_export_date(value):
+    """
+    Parse a YYYY-MM-DD export bound; empty means unbounded. Raises
+    ValueError for anything else.
+    """
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise ValueError('Invalid date: %s' % value)
+    return date
+
+
+def day_start(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def export_rows(kind, start=None, end=None):
+    """
+    Return the column names of export ``kind`` and an iterator over its
+    rows dated from ``start`` through ``end`` (dates, both inclusive).
+    """
+    queryset, date_field, columns = EXPORTS[kind]
+    if start:
+        queryset = queryset.filter(**{date_field + '__gte': day_start(start)})
+    if end:
+        queryset = queryset.filter(**{date_field + '__lt': day_start(end + datetime.timedelta(days=1))})
+    queryset = queryset.order_by(date_field, 'pk')
+    names = [name for name, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=CHUNK_SIZE)
+    return names, rows
+
+
+def _value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class _Echo:
+    # A file-like object that hands back what csv.writer writes to it.
+    def write(self, value):
+        return value
+
+
+def stream_export(kind, format='csv', start=None, end=None):
+    """
+    Yield export ``kind`` as lines of CSV (with a header) or JSON Lines.
+    """
+    names, rows = export_rows(kind, start, end)
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow([_value(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(names, map(_value, row)))) + '\n'
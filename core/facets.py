@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import CATEGORY_CHOICES, LABEL_CHOICES, FacetCount, Item
+
+FACETS = {
+    'category': CATEGORY_CHOICES,
+    'label': LABEL_CHOICES,
+}
+FACET_COUNTS_KEY = 'facet-counts'
+
+
+def adjust_facet_count(facet, value, delta):
+    updated = FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+    if not updated:
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(facet=facet, value=value, count=delta)
+        except IntegrityError:
+            # Created concurrently, so the update will find it now.
+            FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+    _invalidate()
+
+
+def _invalidate():
+    # Dropped again on commit, in case a concurrent request re-cached the
+    # counts from before this transaction.
+    cache.delete(FACET_COUNTS_KEY)
+    transaction.on_commit(lambda: cache.delete(FACET_COUNTS_KEY))
+
+
+def get_facet_counts():
+    """
+    Return ``{facet: [(value, display name, count), ...]}`` for every
+    facet, in choice order. Served from the cache, which is dropped
+    whenever a count changes.
+    """
+    facets = cache.get(FACET_COUNTS_KEY)
+    if facets is None:
+        counts = {(row.facet, row.value): row.count for row in FacetCount.objects.all()}
+        facets = {
+            facet: [(value, name, counts.get((facet, value), 0)) for value, name in choices]
+            for facet, choices in FACETS.items()
+        }
+        cache.set(FACET_COUNTS_KEY, facets, None)
+    return facets
+
+
+def get_facet_filters(params):
+    """
+    Return the facet filters selected in ``params`` (e.g. request.GET),
+    ignoring unknown values.
+    """
+    filters = {}
+    for facet, choices in FACETS.items():
+        value = params.get(facet)
+        if value in dict(choices):
+            filters[facet] = value
+    return filters
+
+
+def rebuild_facet_counts():
+    """
+    Recount every facet from the items, for use after bulk writes that
+    bypass the Item signals.
+    """
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        for facet in FACETS:
+            FacetCount.objects.bulk_create(
+                FacetCount(facet=facet, value=row[facet], count=row['count'])
+                for row in Item.objects.order_by().values(facet).annotate(count=Count('id'))
+            )
+    _invalidate()
@@ -0,0 +1,176 @@
+"""
+Carts of anonymous visitors.
+
+A guest cart is a ``{slug: quantity}`` dict in the cache, under a random id
+kept in a signed cookie, and its items are read through the catalog cache,
+so browsing and filling a cart costs no database writes. When the visitor
+logs in, ``merge_guest_cart`` moves the lines into their open order (see
+``core.signals``).
+
+Changes to one guest cart are not serialized: of two concurrent changes,
+the last one wins.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .catalog import get_item
+from .models import Item, Order, OrderItem
+from .services import CartResult, CartService
+
+GUEST_CART_KEY = 'guest-cart:{}'
+GUEST_CART_SALT = 'core.guest_cart'
+
+
+class GuestCart:
+    """
+    The cart of an anonymous visitor, with the same operations and results
+    as ``CartService``. The orders and order items in its results are
+    unsaved.
+    """
+    ADDED = CartService.ADDED
+    UPDATED = CartService.UPDATED
+    REMOVED = CartService.REMOVED
+    NOT_IN_CART = CartService.NOT_IN_CART
+    NO_ORDER = CartService.NO_ORDER
+    PAYMENT_PENDING = CartService.PAYMENT_PENDING
+
+    def __init__(self, cart_id=None):
+        self.is_new = cart_id is None
+        self.cart_id = cart_id or uuid.uuid4().hex
+        self.key = GUEST_CART_KEY.format(self.cart_id)
+        self.needs_cookie = False
+
+    @classmethod
+    def from_request(cls, request):
+        """The visitor's cart, created on first use and kept on the request."""
+        cart = getattr(request, '_guest_cart', None)
+        if cart is None:
+            cart_id = request.get_signed_cookie(settings.GUEST_CART_COOKIE_NAME, None, salt=GUEST_CART_SALT)
+            cart = request._guest_cart = cls(cart_id)
+        return cart
+
+    def get_lines(self):
+        if self.is_new and not self.needs_cookie:
+            return {}
+        return cache.get(self.key) or {}
+
+    def _set_lines(self, lines):
+        if lines:
+            cache.set(self.key, lines, settings.GUEST_CART_TIMEOUT)
+            self.needs_cookie = self.is_new
+        else:
+            cache.delete(self.key)
+
+    def clear(self):
+        cache.delete(self.key)
+
+    def line_count(self):
+        return len(self.get_lines())
+
+    def get_order_items(self, lines=None):
+        """Unsaved order items for the lines whose item still exists."""
+        order_items = []
+        for slug, quantity in (self.get_lines() if lines is None else lines).items():
+            try:
+                order_items.append(OrderItem(item=get_item(slug), quantity=quantity))
+            except Item.DoesNotExist:
+                pass
+        return order_items
+
+    def get_order(self, order_items):
+        """An unsaved order holding the totals of ``order_items``."""
+        subtotal = sum(order_item.get_total_item_price() for order_item in order_items)
+        discount_total = sum(order_item.get_amount_saved() for order_item in order_items
+                             if order_item.price_discount)
+        return Order(subtotal=subtotal, discount_total=discount_total, total=max(0.0, subtotal - discount_total))
+
+    def get_summary(self):
+        """The same summary as ``get_cart_summary``, plus the totals."""
+        order_items = self.get_order_items()
+        order = self.get_order(order_items)
+        return {
+            'item_count': sum(order_item.quantity for order_item in order_items),
+            'line_count': len(order_items),
+            'total': order.total,
+            'subtotal': order.subtotal,
+            'discount_total': order.discount_total,
+            'coupon_discount': order.coupon_discount,
+        }
+
+    def _result(self, status, lines, item):
+        order = self.get_order(self.get_order_items(lines))
+        return CartResult(status, order, OrderItem(item=item, quantity=lines.get(item.slug, 0)))
+
+    def add(self, item, quantity=1):
+        lines = self.get_lines()
+        status = self.UPDATED if item.slug in lines else self.ADDED
+        lines[item.slug] = lines.get(item.slug, 0) + quantity
+        self._set_lines(lines)
+        return self._result(status, lines, item)
+
+    def decrement(self, item):
+        lines = self.get_lines()
+        if not lines:
+            return CartResult(self.NO_ORDER, None, None)
+        if item.slug not in lines:
+            return self._result(self.NOT_IN_CART, lines, item)
+        if lines[item.slug] > 1:
+            lines[item.slug] -= 1
+            status = self.UPDATED
+        else:
+            del lines[item.slug]
+            status = self.REMOVED
+        self._set_lines(lines)
+        return self._result(status, lines, item)
+
+    def remove(self, item):
+        lines = self.get_lines()
+        if not lines:
+            return CartResult(self.NO_ORDER, None, None)
+        if item.slug not in lines:
+            return self._result(self.NOT_IN_CART, lines, item)
+        del lines[item.slug]
+        self._set_lines(lines)
+        return self._result(self.REMOVED, lines, item)
+
+
+def get_cart(request):
+    """The ``CartService`` of a logged-in user, else the visitor's ``GuestCart``."""
+    if request.user.is_authenticated:
+        return CartService(request.user)
+    return GuestCart.from_request(request)
+
+
+def set_guest_cart_cookie(request, response):
+    """Give ``response`` the cookie of a guest cart created by this request."""
+    cart = getattr(request, '_guest_cart', None)
+    if cart is not None and cart.needs_cookie:
+        response.set_signed_cookie(
+            settings.GUEST_CART_COOKIE_NAME, cart.cart_id, salt=GUEST_CART_SALT,
+            max_age=settings.GUEST_CART_TIMEOUT, httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+    return response
+
+
+def merge_guest_cart(request, user):
+    """
+    Add the lines of the visitor's guest cart to ``user``'s open order, in
+    one transaction, and empty the guest cart.
+    """
+    cart = GuestCart.from_request(request)
+    lines = cart.get_lines()
+    if not lines:
+        return
+    items = Item.objects.in_bulk(list(lines), field_name='slug')
+    service = CartService(user)
+    with transaction.atomic():
+        for slug, quantity in lines.items():
+            if slug in items:
+                if service.add(items[slug], quantity).status == CartService.PAYMENT_PENDING:
+                    # Kept for after the payment.
+                    return
+    cart.clear()
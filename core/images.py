@@ -0,0 +1,108 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Pillow format and file extension of every derivative.
+DERIVATIVE_FORMATS = (
+    ('JPEG', 'jpg'),
+    ('WEBP', 'webp'),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='images',
+            )
+        return _executor
+
+
+def derivative_name(digest, width, extension):
+    """
+    Storage name of a derivative. Derivatives are addressed by the hash of
+    the source image's content, so identical uploads share them and a new
+    upload can never be served a stale thumbnail.
+    """
+    return f'{settings.IMAGE_DERIVATIVE_DIR}/{digest[:2]}/{digest}/{width}.{extension}'
+
+
+def generate_derivatives(name):
+    """
+    Write a resized JPEG and WebP copy of the stored image ``name`` for each
+    of ``IMAGE_DERIVATIVE_WIDTHS`` and return the hash they are stored under.
+
+    Images are never upscaled: widths larger than the source get a copy at
+    the source's size. Derivatives that already exist are not regenerated.
+    """
+    with default_storage.open(name) as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    widths = settings.IMAGE_DERIVATIVE_WIDTHS
+    if default_storage.exists(derivative_name(digest, widths[-1], DERIVATIVE_FORMATS[-1][1])):
+        return digest
+
+    source = Image.open(io.BytesIO(data))
+    source = source.convert('RGB')
+    for width in widths:
+        image = source
+        if width < source.width:
+            height = round(source.height * width / source.width)
+            image = source.resize((width, height), Image.LANCZOS)
+        for image_format, extension in DERIVATIVE_FORMATS:
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=settings.IMAGE_DERIVATIVE_QUALITY, optimize=True)
+            target = derivative_name(digest, width, extension)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    return digest
+
+
+def process_item_image(item_id):
+    from .catalog import bump_catalog_version, bump_item_version
+    from .models import Item
+
+    item = Item.objects.filter(pk=item_id).only('image', 'slug').first()
+    if item is None or not item.image:
+        return None
+    digest = generate_derivatives(item.image.name)
+    # modified is bumped too: the product page's Last-Modified comes from it.
+    if Item.objects.filter(pk=item_id, image=item.image.name).update(image_hash=digest, modified=timezone.now()):
+        # Cached pages and fragments of the item still show the old images.
+        bump_catalog_version()
+        bump_item_version(item.slug)
+    return digest
+
+
+def queue_item_image(item_id):
+    if settings.IMAGE_WORKERS:
+        _get_executor().submit(_process_in_worker, item_id)
+    else:
+        process_item_image(item_id)
+
+
+def _process_in_worker(item_id):
+    close_old_connections()
+    try:
+        process_item_image(item_id)
+    except Exception:
+        logger.exception('Generating image derivatives of item %s failed', item_id)
+    finally:
+        close_old_connections()
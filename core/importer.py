@@ -0,0 +1,135 @@
+"""
+Bulk catalog import.
+
+Rows are streamed from a CSV or JSON Lines file and upserted by slug in
+batches: one query finds which slugs exist, then one ``bulk_create`` and
+one ``bulk_update`` write the batch, each batch in its own transaction.
+Memory use depends on the batch size, not on the size of the file.
+
+Bulk writes bypass the ``Item`` signals, so callers must rebuild the
+search index and facet counts afterwards (``import_catalog`` does).
+"""
+import csv
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import invalidate_items
+from .models import Item
+
+FIELDS = ('title', 'price', 'price_discount', 'category', 'label', 'slug', 'description', 'image')
+REQUIRED_FIELDS = ('title', 'price', 'category', 'label', 'slug')
+
+# bulk_update() writes a CASE expression per field with a branch per row,
+# so its cost grows with the square of the batch; keep its batches small.
+UPDATE_BATCH_SIZE = 100
+
+BatchResult = namedtuple('BatchResult', ['created', 'updated', 'errors'])
+
+
+def read_rows(path, format=None):
+    """
+    Yield ``(line number, row dict)`` from a ``.csv`` or ``.jsonl`` file.
+    """
+    format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            # Line 1 is the header.
+            for number, row in enumerate(csv.DictReader(f), 2):
+                yield number, row
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as e:
+                        yield number, {'_error': str(e)}
+
+
+def build_item(row):
+    """
+    Return an unsaved ``Item`` from ``row``, raising ``ValidationError`` if
+    the row is incomplete or invalid.
+    """
+    if '_error' in row:
+        raise ValidationError(row['_error'])
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValidationError('missing %s' % ', '.join(missing))
+    data = {field: row.get(field) for field in FIELDS}
+    try:
+        data['price'] = float(data['price'])
+        data['price_discount'] = float(data['price_discount']) if data['price_discount'] not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValidationError('invalid price')
+    data['description'] = data['description'] or ''
+    data['image'] = data['image'] or ''
+    item = Item(**data)
+    item.clean_fields(exclude=['description', 'image', 'image_hash', 'modified'])
+    return item
+
+
+def _changed_fields(current, item):
+    return {field for field in FIELDS if getattr(current, field) != getattr(item, field)}
+
+
+def import_batch(rows, update=True):
+    """
+    Upsert one batch of ``(line number, row)`` pairs by slug. Later rows
+    win over earlier ones with the same slug, and rows identical to the
+    stored item are not written. Returns a ``BatchResult`` whose
+    ``errors`` are ``(line number, message)`` pairs.
+    """
+    items = {}
+    errors = []
+    for number, row in rows:
+        try:
+            item = build_item(row)
+        except ValidationError as e:
+            errors.append((number, '; '.join(e.messages)))
+            continue
+        items[item.slug] = item
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = Item.objects.in_bulk(list(items), field_name='slug')
+        created = [item for slug, item in items.items() if slug not in existing]
+        updated = []
+        # Only the fields that changed in some row of the batch are written,
+        # which is what bulk_update() spends its time on.
+        fields = {'modified'}
+        if update:
+            for slug, item in items.items():
+                current = existing.get(slug)
+                changed = _changed_fields(current, item) if current is not None else None
+                if changed:
+                    if 'image' in changed:
+                        # The new image still needs its derivatives.
+                        current.image_hash = ''
+                        changed.add('image_hash')
+                    for field in changed:
+                        setattr(current, field, getattr(item, field))
+                    current.modified = now
+                    fields |= changed
+                    updated.append(current)
+        Item.objects.bulk_create(created)
+        if updated:
+            Item.objects.bulk_update(updated, sorted(fields), batch_size=UPDATE_BATCH_SIZE)
+            slugs = [item.slug for item in updated]
+            invalidate_items(slugs)
+            transaction.on_commit(lambda: invalidate_items(slugs))
+    return BatchResult(len(created), len(updated), errors)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,136 @@
+"""
+Stock of items that track it (``Item.stock`` is not null).
+
+Stock is held for an order by reservations, taken at checkout, extended
+at payment and expiring after ``settings.STOCK_RESERVATION_TTL`` seconds,
+and is decremented when the order is finalized. Both go through a single
+conditional ``UPDATE`` per order (``... WHERE stock >= reserved + n`` and
+``... WHERE stock >= n``), so counts stay right under any number of
+concurrent buyers without holding locks across the Stripe call. Every
+function issues a fixed number of queries, independent of the size of
+the order.
+"""
+import datetime
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Item, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+def _per_item(quantities):
+    """An expression for ``quantities[item pk]`` in an UPDATE of items."""
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _tracked_lines(order):
+    return dict(order.items.filter(item__stock__isnull=False).values_list('item_id', 'quantity'))
+
+
+def _release(reservations):
+    """
+    Delete ``reservations`` (a locking queryset) and give their units back.
+    Returns the number of reservations released.
+    """
+    rows = list(reservations.values_list('pk', 'item_id', 'quantity'))
+    if rows:
+        quantities = defaultdict(int)
+        for _, item_id, quantity in rows:
+            quantities[item_id] += quantity
+        Item.objects.filter(pk__in=quantities).update(
+            reserved=Greatest(F('reserved') - _per_item(quantities), Value(0)))
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return len(rows)
+
+
+def reserve_order(order):
+    """
+    Reserve stock for every line of ``order`` whose item tracks stock,
+    replacing the order's earlier reservations. Either every line is
+    reserved or none is: returns the items without enough stock available,
+    an empty list on success.
+    """
+    lines = _tracked_lines(order)
+    expires_at = timezone.now() + datetime.timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        _release(StockReservation.objects.select_for_update().filter(order=order))
+        if not lines:
+            return []
+        quantity = _per_item(lines)
+        reserved = Item.objects.filter(pk__in=lines, stock__gte=F('reserved') + quantity).update(
+            reserved=F('reserved') + quantity)
+        if reserved == len(lines):
+            StockReservation.objects.bulk_create(
+                StockReservation(order=order, item_id=item_id, quantity=quantity, expires_at=expires_at)
+                for item_id, quantity in lines.items())
+            return []
+        # Keep the earlier reservations too.
+        transaction.set_rollback(True)
+    return [item for item in Item.objects.filter(pk__in=lines) if item.available < lines[item.pk]]
+
+
+def extend_reservations(order):
+    """
+    Push back the expiry of ``order``'s reservations, if they still hold
+    every line of the order whose item tracks stock. Returns whether they
+    do; when the cart changed or they expired since they were taken, the
+    order needs ``reserve_order`` again.
+    """
+    lines = _tracked_lines(order)
+    if not lines:
+        return True
+    now = timezone.now()
+    held = Q()
+    for item_id, quantity in lines.items():
+        held |= Q(item_id=item_id, quantity=quantity)
+    extended = StockReservation.objects.filter(held, order=order, expires_at__gt=now).update(
+        expires_at=now + datetime.timedelta(seconds=settings.STOCK_RESERVATION_TTL))
+    return extended == len(lines)
+
+
+def consume_stock(order):
+    """
+    Take the stock of ``order``'s lines and release its reservations, when
+    the order is finalized. The payment has already been taken by then, so
+    lines without enough stock left (their reservation expired and the
+    units were sold) are logged rather than refused.
+    """
+    lines = _tracked_lines(order)
+    with transaction.atomic():
+        _release(StockReservation.objects.select_for_update().filter(order=order))
+        if lines:
+            quantity = _per_item(lines)
+            sold = Item.objects.filter(pk__in=lines, stock__gte=quantity).update(stock=F('stock') - quantity)
+            if sold < len(lines):
+                logger.warning('Order %s was placed with %d lines out of stock', order.pk, len(lines) - sold)
+
+
+def release_expired(batch_size=1000, now=None):
+    """
+    Release expired reservations, ``batch_size`` at a time, each batch in
+    its own transaction. Returns the number released.
+    """
+    now = now or timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    total = 0
+    while True:
+        with transaction.atomic():
+            expired = (StockReservation.objects
+                       .select_for_update(skip_locked=skip_locked)
+                       .filter(expires_at__lte=now)
+                       .order_by('expires_at')[:batch_size])
+            released = _release(expired)
+        total += released
+        if released < batch_size:
+            return total
@@ -0,0 +1,78 @@
+import json
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.benchmark import compare, run_benchmark
+from core.stripe_stub import StripeStub
+
+
+class Command(BaseCommand):
+    help = ('Load tests the shop with concurrent users and compares the results to a baseline. '
+            'On SQLite, concurrent checkouts fail with "database is locked"; use one user there.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8,
+                            help='Number of concurrent users')
+        parser.add_argument('--iterations', type=int, default=5,
+                            help='Number of checkouts per user')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Iterations per user that are not measured')
+        parser.add_argument('--prefix', default='seed',
+                            help='Prefix of the usernames created by seed_data')
+        parser.add_argument('--stripe-latency', type=float, default=0.0,
+                            help='Seconds the stubbed Stripe API takes to answer')
+        parser.add_argument('--save', metavar='PATH',
+                            help='Write the results to PATH as a JSON baseline')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='Fail if the results regress from the baseline at PATH')
+        parser.add_argument('--latency-threshold', type=float, default=0.2,
+                            help='Allowed relative growth of p95 latency (and drop of throughput)')
+        parser.add_argument('--query-threshold', type=float, default=0.5,
+                            help='Allowed growth of the mean number of queries per request')
+
+    def handle(self, *args, **options):
+        users = list(get_user_model().objects
+                     .filter(username__startswith=options['prefix'] + '-user-')
+                     .order_by('pk')[:options['users']])
+        if len(users) < options['users']:
+            raise CommandError('Found %d of %d users, run seed_data with more --users' % (
+                len(users), options['users']))
+
+        # Payments are charged inline so their cost shows up in payment-post.
+        # Failed requests are counted and summarized, not logged one by one.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        with StripeStub(latency=options['stripe_latency']) as stub, override_settings(
+                STRIPE_API_BASE=stub.url, PAYMENT_WORKERS=0, ALLOWED_HOSTS=['testserver']):
+            try:
+                results = run_benchmark(users, options['iterations'], options['warmup'])
+            except ValueError as e:
+                raise CommandError(e)
+
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write('Saved results to %s' % options['save'])
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare(baseline, results, options['latency_threshold'], options['query_threshold'])
+            if regressions:
+                raise CommandError('Regressions from %s:\n  %s' % (options['compare'], '\n  '.join(regressions)))
+            self.stdout.write(self.style.SUCCESS('No regressions from %s' % options['compare']))
+
+    def report(self, results):
+        row = '%-15s %8s %7s %9s %9s %9s %8s'
+        self.stdout.write(row % ('route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for name, route in sorted(results['routes'].items()):
+            self.stdout.write(row % (
+                name, route['requests'], route['errors'],
+                route['p50'], route['p95'], route['p99'], route['queries']))
+        for error in results['error_samples']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            '%d requests in %.1fs: %.1f requests/s, %d errors' % (
+                results['requests'], results['duration'], results['throughput'], results['errors'])))
@@ -0,0 +1,57 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.catalog import bump_catalog_version, bump_item_version
+from core.images import generate_derivatives
+from core.models import Item
+
+
+def _generate(name):
+    try:
+        return name, generate_derivatives(name), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized copies of the item images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes')
+        parser.add_argument('--all', action='store_true',
+                            help='Also process items whose derivatives were already generated')
+
+    def handle(self, *args, **options):
+        items = Item.objects.exclude(image='')
+        if not options['all']:
+            items = items.filter(image_hash='')
+        names = list(items.order_by().values_list('image', flat=True).distinct())
+
+        start = time.monotonic()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for name, digest, error in pool.map(_generate, names, chunksize=4):
+                if error:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (name, error))
+                else:
+                    items = Item.objects.filter(image=name)
+                    slugs = list(items.values_list('slug', flat=True))
+                    items.update(image_hash=digest, modified=timezone.now())
+                    # The update bypasses the signals: cached pages and
+                    # fragments of the items still show the old images.
+                    for slug in slugs:
+                        bump_item_version(slug)
+        if len(names) > failed:
+            bump_catalog_version()
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated derivatives of %d images in %.1fs (%d failed)' % (
+                len(names) - failed, elapsed, failed)))
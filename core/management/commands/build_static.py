@@ -0,0 +1,56 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+try:
+    import sass
+except ImportError:
+    sass = None
+
+
+class Command(BaseCommand):
+    help = ('Compiles the SCSS entry points, then collects the static files '
+            'under fingerprinted names with precompressed siblings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-sass', action='store_true',
+                            help='Use the compiled CSS as it is')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete the previously collected files first')
+
+    def handle(self, *args, **options):
+        if not options['no_sass']:
+            self.compile_scss()
+        call_command('collectstatic', interactive=False, clear=options['clear'],
+                     ignore_patterns=['scss'], verbosity=options['verbosity'] - 1)
+        if isinstance(staticfiles_storage, FileSystemStorage):
+            self.report(staticfiles_storage.location)
+
+    def compile_scss(self):
+        if sass is None:
+            self.stderr.write('libsass is not installed, the SCSS sources were not compiled')
+            return
+        for source, target in settings.SCSS_ENTRY_POINTS.items():
+            css = sass.compile(filename=finders.find(source), output_style='compressed')
+            path = os.path.join(settings.STATIC_BUILD_DIR, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(css)
+            self.stdout.write('Compiled %s to %s' % (source, path))
+
+    def report(self, root):
+        files = original = compressed = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith('.gz'):
+                    files += 1
+                    path = os.path.join(dirpath, filename)
+                    original += os.path.getsize(path[:-len('.gz')])
+                    compressed += os.path.getsize(path)
+        self.stdout.write(self.style.SUCCESS(
+            'Precompressed %d files: %d KB gzipped to %d KB' % (files, original // 1024, compressed // 1024)))
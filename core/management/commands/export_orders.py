@@ -0,0 +1,37 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+
+from core.exports import EXPORTS, FORMATS, parse_export_date, stream_export
+
+
+def _date(value):
+    try:
+        return parse_export_date(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+class Command(BaseCommand):
+    help = 'Writes orders, order items, payments or refunds as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--start', type=_date, help='First day to export, YYYY-MM-DD')
+        parser.add_argument('--end', type=_date, help='Last day to export, YYYY-MM-DD')
+        parser.add_argument('--output', '-o', help='File to write to, standard output by default')
+
+    def handle(self, *args, **options):
+        lines = stream_export(options['kind'], options['format'], options['start'], options['end'])
+        if options['output']:
+            rows = 0
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for rows, line in enumerate(lines, 1):
+                    f.write(line)
+            if options['format'] == 'csv':
+                rows -= 1  # the header
+            self.stderr.write(self.style.SUCCESS('Wrote %d rows to %s' % (max(rows, 0), options['output'])))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
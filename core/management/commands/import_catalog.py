@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import bump_catalog_version
+from core.facets import rebuild_facet_counts
+from core.importer import batches, import_batch, read_rows
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates items, by slug, from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per transaction')
+        parser.add_argument('--no-update', action='store_true',
+                            help='Leave items whose slug already exists unchanged')
+        parser.add_argument('--skip-images', action='store_true',
+                            help='Do not generate the image derivatives')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes generating image derivatives')
+        parser.add_argument('--progress-every', type=int, default=100000,
+                            help='Report progress every this many rows')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError('%s does not exist' % options['path'])
+
+        rows = read_rows(options['path'], options['format'])
+        start = time.monotonic()
+        created = updated = failed = processed = 0
+        next_report = options['progress_every']
+        for batch in batches(rows, options['batch_size']):
+            result = import_batch(batch, update=not options['no_update'])
+            created += result.created
+            updated += result.updated
+            failed += len(result.errors)
+            processed += len(batch)
+            for number, error in result.errors:
+                self.stderr.write('Line %d: %s' % (number, error))
+            if processed >= next_report:
+                next_report += options['progress_every']
+                self.stdout.write('%d rows, %.0f rows/s' % (processed, processed / (time.monotonic() - start)))
+        elapsed = time.monotonic() - start
+
+        # Bulk writes bypass the Item signals that maintain these.
+        rebuild_index()
+        rebuild_facet_counts()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %d rows in %.1fs (%.0f rows/s): %d created, %d updated, %d unchanged, %d skipped' % (
+                processed, elapsed, processed / elapsed if elapsed else 0,
+                created, updated, processed - created - updated - failed, failed)))
+
+        if not options['skip_images']:
+            call_command('build_image_derivatives', workers=options['workers'],
+                         stdout=self.stdout, stderr=self.stderr)
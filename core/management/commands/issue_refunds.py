@@ -0,0 +1,48 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Order
+from core.refunds import FAILED, REFUNDED, issue_refunds
+
+
+class Command(BaseCommand):
+    help = 'Refunds orders through Stripe, by default every order with a pending refund request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ref_codes', nargs='*',
+                            help='Reference codes of the orders to refund')
+        parser.add_argument('--workers', type=int, default=settings.REFUND_WORKERS,
+                            help='Number of refunds issued concurrently')
+        parser.add_argument('--rate', type=float, default=settings.REFUND_RATE_LIMIT,
+                            help='Maximum Stripe requests per second (0 for no limit)')
+        parser.add_argument('--report', help='Write the result of every order to this CSV file')
+
+    def handle(self, *args, **options):
+        if options['ref_codes']:
+            orders = Order.objects.filter(ordered=True, ref_code__in=options['ref_codes'])
+        else:
+            # Includes orders whose charge was not used, see finalize_order.
+            orders = Order.objects.filter(refund_requested=True, refund_granted=False)
+        order_ids = list(orders.order_by('pk').values_list('pk', flat=True))
+
+        started = time.monotonic()
+        results = issue_refunds(order_ids, workers=options['workers'], rate=options['rate'])
+        elapsed = time.monotonic() - started
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['order_id', 'ref_code', 'status', 'message'])
+                writer.writerows(results)
+        for result in results:
+            if result.status == FAILED:
+                self.stderr.write('Order %s: %s' % (result.ref_code or result.order_id, result.message))
+
+        refunded = sum(result.status == REFUNDED for result in results)
+        failed = sum(result.status == FAILED for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            'Processed %d orders in %.1fs: %d refunded, %d skipped, %d failed' % (
+                len(results), elapsed, refunded, len(results) - refunded - failed, failed)))
@@ -0,0 +1,18 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', '..', 'fixtures', 'catalog.jsonl')
+
+
+class Command(BaseCommand):
+    help = 'Loads the sample catalog, or the given CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=os.path.normpath(FIXTURE))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        call_command('import_catalog', options['path'], batch_size=options['batch_size'],
+                     stdout=self.stdout, stderr=self.stderr)
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.models import Payment
+from core.payments import process_payment
+
+
+def _process(payment_id):
+    try:
+        return process_payment(payment_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Charges pending payments, e.g. those queued before a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PAYMENT_WORKERS or 1,
+                            help='Number of payments charged concurrently')
+        parser.add_argument('--older-than', type=int, default=60,
+                            help='Only pick up payments pending for at least this many seconds')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        payment_ids = list(
+            Payment.objects
+            .filter(status=Payment.PENDING, timestamp__lte=cutoff)
+            .values_list('pk', flat=True)
+        )
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            payments = list(executor.map(_process, payment_ids))
+
+        succeeded = sum(payment.status == Payment.SUCCEEDED for payment in payments)
+        self.stdout.write(self.style.SUCCESS(
+            'Processed %d pending payments: %d succeeded, %d failed' % (
+                len(payments), succeeded, len(payments) - succeeded)))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recounts the items per category and per label'
+
+    def handle(self, *args, **options):
+        rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS('Facet counts rebuilt'))
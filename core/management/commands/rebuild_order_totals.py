@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Order
+
+TOTAL_FIELDS = ['subtotal', 'discount_total', 'coupon_discount', 'total']
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored order totals from the order items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only report orders whose stored totals are wrong')
+        parser.add_argument('--all', action='store_true',
+                            help='Also process placed orders. Those placed before line prices were '
+                                 'stored are skipped, as their prices at the time are not known')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of orders loaded and written per batch')
+        parser.add_argument('--tolerance', type=float, default=0.005,
+                            help='Largest difference not reported as a mismatch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        orders = Order.objects.order_by('pk')
+        skipped = 0
+        if options['all']:
+            unpriced = orders.filter(ordered=True, items__unit_price__isnull=True)
+            skipped = unpriced.values('pk').distinct().count()
+            orders = orders.exclude(pk__in=unpriced.values('pk'))
+        else:
+            orders = orders.filter(ordered=False)
+
+        checked = 0
+        mismatched = []
+        last_pk = 0
+        while True:
+            batch = list(
+                orders.filter(pk__gt=last_pk)
+                .select_related('coupon')
+                .prefetch_related('items__item')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            changed = []
+            for order in batch:
+                totals = order.calculate_totals()
+                if any(abs(getattr(order, field) - totals[field]) > options['tolerance']
+                       for field in TOTAL_FIELDS):
+                    mismatched.append(order.pk)
+                    for field in TOTAL_FIELDS:
+                        setattr(order, field, totals[field])
+                    # Retires cached renderings of the cart.
+                    order.version += 1
+                    changed.append(order)
+            if changed and not options['verify']:
+                Order.objects.bulk_update(changed, TOTAL_FIELDS + ['version'])
+            checked += len(batch)
+
+        if skipped:
+            self.stdout.write('Skipped %d placed orders without stored line prices' % skipped)
+        if options['verify']:
+            if mismatched:
+                raise CommandError('%d of %d orders have wrong totals: %s' % (
+                    len(mismatched), checked, ', '.join(map(str, mismatched))))
+            self.stdout.write(self.style.SUCCESS(
+                'All %d orders have correct totals' % checked))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Checked %d orders, rebuilt totals of %d' % (checked, len(mismatched))))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Releases the stock held by expired reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of reservations released per transaction')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Released %d expired reservations' % released))
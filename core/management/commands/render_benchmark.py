@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmark import RENDER_SCENARIOS, run_render_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Times rendering catalog pages of product cards with and without the cached template '
+            'loader and the product card fragment cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100],
+                            help='Numbers of product cards per page')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Renders per page and scenario')
+
+    def handle(self, *args, **options):
+        results = run_render_benchmark(options['sizes'], options['repeat'])
+        names = [name for name, _, _ in RENDER_SCENARIOS]
+        self.stdout.write('%-8s %s' % ('cards', ' '.join('%20s' % name for name in names)))
+        for size, timings in results.items():
+            baseline = timings[names[0]]
+            self.stdout.write('%-8d %s' % (size, ' '.join(
+                '%20s' % ('%.2fms (%.1fx)' % (timings[name], baseline / timings[name] if timings[name] else 0))
+                for name in names)))
+        self.stdout.write(self.style.SUCCESS('Median render time per page, speedup over %s' % names[0]))
@@ -0,0 +1,167 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.catalog import bump_catalog_version
+from core.facets import rebuild_facet_counts
+from core.models import CATEGORY_CHOICES, LABEL_CHOICES, Coupon, Item, Order, OrderItem, Payment
+from core.search import rebuild_index
+from core.services import to_cents
+
+WORDS = (
+    'classic', 'slim', 'cotton', 'linen', 'denim', 'striped', 'summer', 'winter',
+    'running', 'training', 'hooded', 'waterproof', 'casual', 'oxford', 'fleece',
+)
+
+
+def _bulk_create(model, objects, batch_size):
+    """
+    ``bulk_create`` that also sets the primary keys on backends that do not
+    return them (SQLite), by reading back the rows inserted after the
+    current maximum. Only safe while nothing else inserts into the table.
+    """
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        pks = model.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)
+        for obj, pk in zip(objects, pks):
+            obj.pk = pk
+    return objects
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a synthetic catalog, users, coupons and past orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=1000,
+                            help='Number of completed orders')
+        parser.add_argument('--coupons', type=int, default=20)
+        parser.add_argument('--max-lines', type=int, default=5,
+                            help='Maximum number of items in an order')
+        parser.add_argument('--prefix', default='seed',
+                            help='Prefix of the generated slugs, usernames and coupon codes')
+        parser.add_argument('--password', default='benchmark',
+                            help='Password of the generated users')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--random-seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if Item.objects.filter(slug__startswith=prefix + '-').exists():
+            raise CommandError('Items prefixed "%s" already exist, use another --prefix' % prefix)
+        rng = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+
+        with transaction.atomic():
+            items = self.create_items(rng, prefix, options['items'])
+            users = self.create_users(prefix, options['users'], options['password'])
+            coupons = self.create_coupons(rng, prefix, options['coupons'])
+            orders = self.create_orders(rng, options['orders'], options['max_lines'], items, users, coupons)
+
+        # Bulk inserts bypass the Item signals that maintain these.
+        rebuild_index()
+        rebuild_facet_counts()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created %d items, %d users, %d coupons and %d orders' % (
+                len(items), len(users), len(coupons), orders)))
+
+    def create_items(self, rng, prefix, count):
+        items = []
+        for n in range(count):
+            words = rng.sample(WORDS, 2)
+            category, category_name = rng.choice(CATEGORY_CHOICES)
+            price = round(rng.uniform(5, 200), 2)
+            discounted = rng.random() < 0.3
+            items.append(Item(
+                title=' '.join(words + [category_name]).capitalize(),
+                price=price,
+                price_discount=round(price * rng.uniform(0.5, 0.9), 2) if discounted else None,
+                category=category,
+                label=rng.choice(LABEL_CHOICES)[0],
+                slug='%s-item-%d' % (prefix, n),
+                description='A %s %s %s.' % (words[0], words[1], category_name.lower()),
+                image='',
+            ))
+        return _bulk_create(Item, items, self.batch_size)
+
+    def create_users(self, prefix, count, password):
+        # Hashing is deliberately slow, so every user shares one hash.
+        password = make_password(password)
+        users = [
+            get_user_model()(username='%s-user-%d' % (prefix, n),
+                             email='%s-user-%d@example.com' % (prefix, n),
+                             password=password)
+            for n in range(count)
+        ]
+        return _bulk_create(get_user_model(), users, self.batch_size)
+
+    def create_coupons(self, rng, prefix, count):
+        coupons = [
+            Coupon(code=('%s%d' % (prefix, n)).upper()[:15], amount=rng.choice((5.0, 10.0, 20.0)))
+            for n in range(count)
+        ]
+        return _bulk_create(Coupon, coupons, self.batch_size)
+
+    def create_orders(self, rng, count, max_lines, items, users, coupons):
+        if not (items and users):
+            return 0
+        now = timezone.now()
+        created = 0
+        for start in range(0, count, self.batch_size):
+            batch = range(start, min(start + self.batch_size, count))
+            orders, payments, lines = [], [], []
+            for _ in batch:
+                user = rng.choice(users)
+                coupon = rng.choice(coupons) if coupons and rng.random() < 0.2 else None
+                order_lines = [
+                    OrderItem(user=user, item=item, ordered=True, quantity=rng.randint(1, 3),
+                              unit_price=item.price, unit_price_discount=item.price_discount)
+                    for item in rng.sample(items, min(len(items), rng.randint(1, max_lines)))
+                ]
+                subtotal = sum(line.get_total_item_price() for line in order_lines)
+                discount_total = sum(line.get_amount_saved() for line in order_lines if line.price_discount)
+                coupon_discount = coupon.amount if coupon else 0.0
+                total = max(0.0, subtotal - discount_total - coupon_discount)
+                ordered_date = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+                payments.append(Payment(
+                    user=user,
+                    amount=to_cents(total),
+                    status=Payment.SUCCEEDED,
+                    stripe_charge_id='ch_%s' % uuid.uuid4().hex[:24],
+                ))
+                orders.append(Order(
+                    user=user,
+                    ref_code=uuid.uuid4().hex[:20],
+                    ordered_date=ordered_date,
+                    ordered=True,
+                    coupon=coupon,
+                    subtotal=subtotal,
+                    discount_total=discount_total,
+                    coupon_discount=coupon_discount,
+                    total=total,
+                ))
+                lines.append(order_lines)
+
+            _bulk_create(Payment, payments, self.batch_size)
+            for order, payment in zip(orders, payments):
+                order.payment = payment
+            _bulk_create(Order, orders, self.batch_size)
+            _bulk_create(OrderItem, [line for order_lines in lines for line in order_lines], self.batch_size)
+            Order.items.through.objects.bulk_create([
+                Order.items.through(order_id=order.pk, orderitem_id=line.pk)
+                for order, order_lines in zip(orders, lines)
+                for line in order_lines
+            ], batch_size=self.batch_size)
+            created += len(orders)
+        return created
@@ -0,0 +1,116 @@
+"""
+Per-view request statistics.
+
+``RequestStatsMiddleware`` times every request and counts the queries it
+runs, and keeps the last ``REQUEST_STATS_SAMPLES`` measurements of each
+view in memory. Statistics are per process: with several workers, each
+reports on the requests it served. Enable it with ``REQUEST_STATS_ENABLED``.
+"""
+import contextlib
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+Sample = namedtuple('Sample', ['total', 'queries', 'db', 'template'])
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class _RequestTimer:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - start
+
+    def wrap_render(self, render):
+        def timed_render():
+            start = time.perf_counter()
+            try:
+                return render()
+            finally:
+                self.template += time.perf_counter() - start
+        return timed_render
+
+
+class RequestStatsMiddleware:
+    """
+    Records total time, query count, database time and template time of
+    every request, keyed by the name of the view's URL pattern.
+
+    Template time is only measured for views returning a TemplateResponse
+    (the generic views); for views calling ``render()`` it is part of the
+    total. Queries run while rendering are counted either way.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_STATS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = request._request_timer = _RequestTimer()
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        match = request.resolver_match
+        record(match.view_name if match else '<unresolved>',
+               Sample(total, timer.queries, timer.db, timer.template))
+        return response
+
+    def process_template_response(self, request, response):
+        response.render = request._request_timer.wrap_render(response.render)
+        return response
+
+
+def record(view_name, sample):
+    with _samples_lock:
+        samples = _samples.get(view_name)
+        if samples is None:
+            samples = _samples[view_name] = deque(maxlen=settings.REQUEST_STATS_SAMPLES)
+        samples.append(sample)
+
+
+def reset():
+    with _samples_lock:
+        _samples.clear()
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile of already sorted values.
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(index)]
+
+
+def get_request_stats():
+    """
+    Return one dict per view with the number of samples and the 50th, 95th
+    and 99th percentiles of each measurement, in milliseconds.
+    """
+    with _samples_lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+    stats = []
+    for name, samples in snapshot.items():
+        row = {'view': name, 'requests': len(samples)}
+        for field in Sample._fields:
+            scale = 1 if field == 'queries' else 1000
+            values = sorted(getattr(sample, field) * scale for sample in samples)
+            for percent in (50, 95, 99):
+                row['%s_p%d' % (field, percent)] = round(percentile(values, percent), 2)
+        stats.append(row)
+    return stats
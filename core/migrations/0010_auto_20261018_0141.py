@@ -0,0 +1,107 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django_countries.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0009_auto_20191101_0257'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Coupon',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=15)),
+                ('amount', models.FloatField()),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='item',
+            options={'ordering': ['-price']},
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='image',
+            field=models.ImageField(default='', upload_to=''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivered',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='received',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ref_code',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='refund_granted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='refund_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='Refund',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField()),
+                ('accepted', models.BooleanField(default=False)),
+                ('email', models.EmailField(max_length=254)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.Order')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_charge_id', models.CharField(max_length=50)),
+                ('amount', models.FloatField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BillingAddress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('street_address', models.CharField(max_length=100)),
+                ('apartment_address', models.CharField(max_length=100)),
+                ('country', django_countries.fields.CountryField(max_length=2)),
+                ('zip', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='billing_address',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.BillingAddress'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='coupon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.Coupon'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.Payment'),
+        ),
+    ]
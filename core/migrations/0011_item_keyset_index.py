@@ -0,0 +1,21 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_auto_20261018_0141'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='item',
+            options={'ordering': ['-price', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['-price', '-id'], name='item_price_id_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+def populate_totals(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    orders = Order.objects.select_related('coupon').prefetch_related('items__item')
+    for order in orders:
+        subtotal = 0.0
+        discount_total = 0.0
+        for order_item in order.items.all():
+            subtotal += order_item.quantity * order_item.item.price
+            if order_item.item.price_discount:
+                discount_total += order_item.quantity * (order_item.item.price - order_item.item.price_discount)
+        order.subtotal = subtotal
+        order.discount_total = discount_total
+        order.coupon_discount = order.coupon.amount if order.coupon else 0.0
+        order.total = max(0.0, subtotal - discount_total - order.coupon_discount)
+        order.save(update_fields=['subtotal', 'discount_total', 'coupon_discount', 'total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_item_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='coupon_discount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+def merge_open_carts(apps, schema_editor):
+    # Concurrent add-to-cart requests could create a second open order for
+    # a user, or a second open line for the same item. Each user's open
+    # orders are merged into the newest one, and duplicate lines into one
+    # line with their quantities summed, so the new unique constraints can
+    # be added.
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    merged = set()
+    duplicated_users = (Order.objects.filter(ordered=False).values('user')
+                        .annotate(open_orders=models.Count('pk')).filter(open_orders__gt=1))
+    for row in duplicated_users:
+        keep, *others = Order.objects.filter(user_id=row['user'], ordered=False).order_by('-start_date', '-pk')
+        for other in others:
+            keep.items.add(*other.items.all())
+            if keep.coupon_id is None and other.coupon_id is not None:
+                keep.coupon_id = other.coupon_id
+                keep.save(update_fields=['coupon'])
+            other.delete()
+        merged.add(keep.pk)
+
+    # Removing an item from the cart used to only detach its OrderItem from
+    # the order, leaving a stale row behind that would collide with the
+    # new unique constraint.
+    OrderItem.objects.filter(ordered=False, order__isnull=True).delete()
+
+    duplicated_lines = (OrderItem.objects.filter(ordered=False).values('user', 'item')
+                        .annotate(lines=models.Count('pk')).filter(lines__gt=1))
+    for row in duplicated_lines:
+        keep, *others = OrderItem.objects.filter(
+            user_id=row['user'], item_id=row['item'], ordered=False).order_by('-pk')
+        keep.quantity += sum(other.quantity for other in others)
+        keep.save(update_fields=['quantity'])
+        for other in others:
+            merged.update(other.order_set.values_list('pk', flat=True))
+            other.delete()
+        merged.update(keep.order_set.values_list('pk', flat=True))
+
+    orders = Order.objects.filter(pk__in=merged).select_related('coupon').prefetch_related('items__item')
+    for order in orders:
+        subtotal = 0.0
+        discount_total = 0.0
+        for order_item in order.items.all():
+            subtotal += order_item.quantity * order_item.item.price
+            if order_item.item.price_discount:
+                discount_total += order_item.quantity * (order_item.item.price - order_item.item.price_discount)
+        order.subtotal = subtotal
+        order.discount_total = discount_total
+        order.coupon_discount = order.coupon.amount if order.coupon else 0.0
+        order.total = max(0.0, subtotal - discount_total - order.coupon_discount)
+        order.save(update_fields=['subtotal', 'discount_total', 'coupon_discount', 'total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_order_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_open_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(ordered=False), fields=('user',), name='unique_open_order'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(condition=models.Q(ordered=False), fields=('user', 'item'), name='unique_open_order_item'),
+        ),
+    ]
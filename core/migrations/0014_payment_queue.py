@@ -0,0 +1,60 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:46
+
+from django.db import migrations, models
+import uuid
+
+
+def backfill_payments(apps, schema_editor):
+    # Payments created before the queue were charged synchronously, so they
+    # all succeeded; each needs its own idempotency key.
+    Payment = apps.get_model('core', 'Payment')
+    for payment in Payment.objects.all():
+        payment.idempotency_key = uuid.uuid4()
+        payment.status = 'S'
+        payment.save(update_fields=['idempotency_key', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_open_cart_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('P', 'pending'), ('S', 'succeeded'), ('F', 'failed')], default='P', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_token',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_charge_id',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.RunPython(backfill_payments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_payment_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price_discount',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
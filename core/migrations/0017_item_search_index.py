@@ -0,0 +1,43 @@
+from django.db import migrations
+
+CATEGORY_SQL = "CASE category WHEN 'S' THEN 'Shirt' WHEN 'SW' THEN 'Sport wear' WHEN 'OW' THEN 'Outwear' ELSE '' END"
+
+# Must stay identical to core.search.PG_DOCUMENT.
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', %s), 'B') || "
+    "setweight(to_tsvector('english', description), 'C')" % CATEGORY_SQL
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_item_fts USING fts5("
+            "title, category, description, tokenize = 'porter unicode61')")
+        schema_editor.execute(
+            "INSERT INTO core_item_fts (rowid, title, category, description) "
+            "SELECT id, title, %s, description FROM core_item" % CATEGORY_SQL)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX core_item_search_idx ON core_item USING GIN ((%s))" % PG_DOCUMENT)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE core_item_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX core_item_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_item_image_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
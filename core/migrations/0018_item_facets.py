@@ -0,0 +1,46 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_facet_counts(apps, schema_editor):
+    Item = apps.get_model('core', 'Item')
+    FacetCount = apps.get_model('core', 'FacetCount')
+    for facet in ('category', 'label'):
+        FacetCount.objects.bulk_create(
+            FacetCount(facet=facet, value=row[facet], count=row['count'])
+            for row in Item.objects.order_by().values(facet).annotate(count=Count('id'))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=2)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', '-price', '-id'], name='item_category_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['label', '-price', '-id'], name='item_label_price_id_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('facet', 'value')},
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:52
+
+from django.db import migrations, models
+
+
+def dedupe_slugs(apps, schema_editor):
+    # Slugs were never unique, so the detail page of a duplicate raised
+    # MultipleObjectsReturned. The oldest item keeps the slug; the others
+    # get their primary key appended.
+    Item = apps.get_model('core', 'Item')
+    duplicates = (Item.objects.values('slug')
+                  .annotate(n=models.Count('id'))
+                  .filter(n__gt=1)
+                  .values_list('slug', flat=True))
+    for slug in list(duplicates):
+        for item in Item.objects.filter(slug=slug).order_by('id')[1:]:
+            Item.objects.filter(pk=item.pk).update(slug='%s-%d' % (slug, item.pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_item_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='item',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    ]
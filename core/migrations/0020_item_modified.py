@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-18 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_item_slug_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
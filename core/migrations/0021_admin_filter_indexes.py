@@ -0,0 +1,26 @@
+# Generated by Django 2.2.4 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_item_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='refund_requested',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['ordered', '-ordered_date'], name='order_ordered_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'timestamp'], name='payment_status_timestamp_idx'),
+        ),
+    ]
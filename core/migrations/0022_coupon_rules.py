@@ -0,0 +1,54 @@
+# Generated by Django 2.2.4 on 2026-10-18 02:16
+
+from django.db import migrations, models
+
+
+def dedupe_codes(apps, schema_editor):
+    # Codes were never unique and only the first match was ever applied.
+    # The oldest coupon keeps its code; the others get their primary key
+    # appended (within the 15 character limit).
+    Coupon = apps.get_model('core', 'Coupon')
+    duplicates = (Coupon.objects.values('code')
+                  .annotate(n=models.Count('id'))
+                  .filter(n__gt=1)
+                  .values_list('code', flat=True))
+    for code in list(duplicates):
+        for coupon in Coupon.objects.filter(code=code).order_by('id')[1:]:
+            suffix = '-%d' % coupon.pk
+            Coupon.objects.filter(pk=coupon.pk).update(code=code[:15 - len(suffix)] + suffix)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_admin_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='redemption_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='valid_from',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='valid_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(dedupe_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='coupon',
+            name='code',
+            field=models.CharField(max_length=15, unique=True),
+        ),
+    ]
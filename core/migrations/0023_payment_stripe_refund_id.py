@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-18 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_coupon_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='stripe_refund_id',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
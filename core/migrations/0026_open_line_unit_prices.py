@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def populate_open_unit_prices(apps, schema_editor):
+    # Open lines now carry the prices their order's totals are kept with.
+    # Lines added before that get the item's current prices, and the totals
+    # of open orders are recomputed to match.
+    OrderItem = apps.get_model('core', 'OrderItem')
+    Order = apps.get_model('core', 'Order')
+    for order_item in OrderItem.objects.filter(ordered=False, unit_price__isnull=True).select_related('item'):
+        order_item.unit_price = order_item.item.price
+        order_item.unit_price_discount = order_item.item.price_discount
+        order_item.save(update_fields=['unit_price', 'unit_price_discount'])
+    for order in Order.objects.filter(ordered=False).select_related('coupon').prefetch_related('items'):
+        subtotal = 0.0
+        discount_total = 0.0
+        for order_item in order.items.all():
+            subtotal += order_item.quantity * order_item.unit_price
+            if order_item.unit_price_discount:
+                discount_total += order_item.quantity * (order_item.unit_price - order_item.unit_price_discount)
+        coupon_discount = order.coupon.amount if order.coupon else 0.0
+        Order.objects.filter(pk=order.pk).update(
+            subtotal=subtotal,
+            discount_total=discount_total,
+            coupon_discount=coupon_discount,
+            total=max(0.0, subtotal - discount_total - coupon_discount),
+            version=F('version') + 1,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_order_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_open_unit_prices, migrations.RunPython.noop),
+    ]
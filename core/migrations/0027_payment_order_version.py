@@ -0,0 +1,18 @@
+# Generated by Django 2.2.4 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_open_line_unit_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='order_version',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.4 on 2026-10-18 03:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_payment_order_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='coupon',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.Coupon'),
+        ),
+    ]
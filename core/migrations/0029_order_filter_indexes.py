@@ -0,0 +1,28 @@
+# Generated by Django 2.2.4 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_payment_coupon'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='delivered',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='received',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='refund_granted',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -1,6 +1,11 @@
+import uuid
+
 from django.conf import settings
 from django.db import models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
 from django.shortcuts import reverse
+from django.utils import timezone
 from django_countries.fields import CountryField
 
 CATEGORY_CHOICES = (
@@ -22,16 +27,57 @@ class Item(models.Model):
     price_discount = models.FloatField(blank=True, null=True)
     category = models.CharField(choices=CATEGORY_CHOICES, max_length=2)
     label = models.CharField(choices=LABEL_CHOICES, max_length=1)
-    slug = models.SlugField()
+    slug = models.SlugField(unique=True)
     description = models.TextField()
     image = models.ImageField()
+    # Content hash the image's derivatives are stored under, see core.images.
+    image_hash = models.CharField(max_length=64, blank=True, editable=False)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+    # Units in stock (blank for items that are not tracked) and units held
+    # by unexpired reservations, see core.inventory.
+    stock = models.PositiveIntegerField(blank=True, null=True)
+    reserved = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
-        ordering = ['-price']
+        ordering = ['-price', '-id']
+        indexes = [
+            models.Index(fields=['-price', '-id'], name='item_price_id_idx'),
+            models.Index(fields=['category', '-price', '-id'], name='item_category_price_id_idx'),
+            models.Index(fields=['label', '-price', '-id'], name='item_label_price_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the loaded values so signal handlers can tell what changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def available(self):
+        """Units that can still be reserved, None if stock is not tracked."""
+        if self.stock is None:
+            return None
+        return max(0, self.stock - self.reserved)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # The reserved count is only changed with F() updates; never
+            # write back the value this instance happened to load.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reserved'
+            ]
+        super().save(*args, **kwargs)
+        # Later saves of this instance compare against what was just written.
+        self._loaded_values = {
+            field.attname: field.get_prep_value(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+        }
+
     def get_absolute_url(self):
         return reverse('core:product', kwargs={'slug': self.slug})
 
@@ -42,23 +88,64 @@ class Item(models.Model):
         return reverse('core:remove-from-cart', kwargs={'slug': self.slug})
 
 
+class FacetCount(models.Model):
+    """
+    Number of items per category and per label, maintained by the Item
+    signal handlers so the catalog never has to aggregate them.
+    """
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=2)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['facet', 'value']
+
+    def __str__(self):
+        return f'{self.facet}={self.value}: {self.count}'
+
+
 class OrderItem(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     ordered = models.BooleanField(default=False)
+    # Prices of the item when it was added to the cart. The order's totals
+    # are kept with these, so later price changes do not apply to it.
+    unit_price = models.FloatField(blank=True, null=True)
+    unit_price_discount = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'item'],
+                condition=models.Q(ordered=False),
+                name='unique_open_order_item',
+            ),
+        ]
+
+    @property
+    def price(self):
+        if self.unit_price is None:
+            return self.item.price
+        return self.unit_price
+
+    @property
+    def price_discount(self):
+        if self.unit_price is None:
+            return self.item.price_discount
+        return self.unit_price_discount
 
     def get_total_item_price(self):
-        return self.quantity * self.item.price
+        return self.quantity * self.price
 
     def get_total_item_discount_price(self):
-        return self.quantity * self.item.price_discount
+        return self.quantity * self.price_discount
 
     def get_amount_saved(self):
         return self.get_total_item_price() - self.get_total_item_discount_price()
 
     def get_final_price(self):
-        if self.item.price_discount:
+        if self.price_discount:
             return self.get_total_item_discount_price()
         return self.get_total_item_price()
 
@@ -77,18 +164,105 @@ class Order(models.Model):
     payment = models.ForeignKey('Payment', on_delete=models.SET_NULL, blank=True, null=True)
     coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, blank=True, null=True)
 
-    delivered = models.BooleanField(default=False)
-    received = models.BooleanField(default=False)
-    refund_requested = models.BooleanField(default=False)
-    refund_granted = models.BooleanField(default=False)
+    # Indexed for the admin changelist's filters.
+    delivered = models.BooleanField(default=False, db_index=True)
+    received = models.BooleanField(default=False, db_index=True)
+    refund_requested = models.BooleanField(default=False, db_index=True)
+    refund_granted = models.BooleanField(default=False, db_index=True)
+
+    # Denormalized totals, kept up to date by every cart and coupon change
+    # so pages and checkout never have to walk the order items.
+    subtotal = models.FloatField(default=0)
+    discount_total = models.FloatField(default=0)
+    coupon_discount = models.FloatField(default=0)
+    total = models.FloatField(default=0)
+    # Incremented by every change to the lines or the coupon; rendered
+    # cart fragments are keyed by it.
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(ordered=False),
+                name='unique_open_order',
+            ),
+        ]
+        indexes = [
+            # Placed orders by date: the admin changelist and sales report.
+            models.Index(fields=['ordered', '-ordered_date'], name='order_ordered_date_idx'),
+        ]
 
     def get_total_price(self):
-        total = 0.0
+        return self.total
+
+    def calculate_totals(self):
+        """
+        Compute the totals from the order items, ignoring the stored values
+        except for the coupon discount of a placed order, which is the
+        discount it was charged with.
+        """
+        subtotal = 0.0
+        discount_total = 0.0
         for order_item in self.items.all():
-            total += order_item.get_final_price()
-        if self.coupon:
-            total = max(0, total - self.coupon.amount)
-        return total
+            subtotal += order_item.get_total_item_price()
+            if order_item.price_discount:
+                discount_total += order_item.get_amount_saved()
+        if self.ordered:
+            coupon_discount = self.coupon_discount
+        else:
+            coupon_discount = self.coupon.amount if self.coupon else 0.0
+        return {
+            'subtotal': subtotal,
+            'discount_total': discount_total,
+            'coupon_discount': coupon_discount,
+            'total': max(0.0, subtotal - discount_total - coupon_discount),
+        }
+
+    def add_line_totals(self, order_item, quantity):
+        """
+        Adjust the stored totals for ``quantity`` units of ``order_item``
+        being added to (or, when negative, removed from) the order, at the
+        line's unit prices.
+
+        The update is done with ``F()`` expressions so concurrent changes
+        to the same order are not lost.
+        """
+        subtotal = quantity * order_item.price
+        discount = 0.0
+        if order_item.price_discount:
+            discount = quantity * (order_item.price - order_item.price_discount)
+        Order.objects.filter(pk=self.pk).update(
+            subtotal=F('subtotal') + subtotal,
+            discount_total=F('discount_total') + discount,
+            total=Greatest(
+                F('subtotal') + subtotal - F('discount_total') - discount - F('coupon_discount'),
+                Value(0.0),
+                output_field=FloatField(),
+            ),
+            version=F('version') + 1,
+        )
+        self.version += 1
+        self.subtotal += subtotal
+        self.discount_total += discount
+        self.total = max(0.0, self.subtotal - self.discount_total - self.coupon_discount)
+
+    def set_coupon(self, coupon):
+        coupon_discount = coupon.amount if coupon else 0.0
+        Order.objects.filter(pk=self.pk).update(
+            coupon=coupon,
+            coupon_discount=coupon_discount,
+            total=Greatest(
+                F('subtotal') - F('discount_total') - coupon_discount,
+                Value(0.0),
+                output_field=FloatField(),
+            ),
+            version=F('version') + 1,
+        )
+        self.version += 1
+        self.coupon = coupon
+        self.coupon_discount = coupon_discount
+        self.total = max(0.0, self.subtotal - self.discount_total - coupon_discount)
 
     def __str__(self):
         return self.user.username
@@ -105,22 +279,88 @@ class BillingAddress(models.Model):
         return self.user.username
 
 
+PAYMENT_STATUS_CHOICES = (
+    ('P', 'pending'),
+    ('S', 'succeeded'),
+    ('F', 'failed')
+)
+
+
 class Payment(models.Model):
-    stripe_charge_id = models.CharField(max_length=50)
+    PENDING = 'P'
+    SUCCEEDED = 'S'
+    FAILED = 'F'
+
+    stripe_charge_id = models.CharField(max_length=50, blank=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True)
     amount = models.FloatField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Charges are performed by core.payments workers; the key is sent to
+    # Stripe so retrying a charge can never charge the customer twice.
+    status = models.CharField(choices=PAYMENT_STATUS_CHOICES, max_length=1, default=PENDING)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    stripe_token = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    # Order.version the amount was computed for; finalize_order refuses to
+    # place an order that has changed since.
+    order_version = models.PositiveIntegerField(blank=True, null=True)
+    # Set by core.refunds once the charge has been refunded.
+    stripe_refund_id = models.CharField(max_length=50, blank=True)
+    # Coupon whose redemption this payment holds, given back if the charge
+    # fails or is not used.
+    coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Pending payments by age (process_payments) and the admin filter.
+            models.Index(fields=['status', 'timestamp'], name='payment_status_timestamp_idx'),
+        ]
 
     def __str__(self):
         return self.user.username
 
 
 class Coupon(models.Model):
-    code = models.CharField(max_length=15)
+    code = models.CharField(max_length=15, unique=True)
     amount = models.FloatField()
+    # Optional validity window and usage limit. redemption_count is only
+    # changed by redeem_coupon and release_coupon, with conditional UPDATEs.
+    valid_from = models.DateTimeField(blank=True, null=True)
+    valid_until = models.DateTimeField(blank=True, null=True)
+    max_redemptions = models.PositiveIntegerField(blank=True, null=True)
+    redemption_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.code
 
+    def is_valid(self, now=None):
+        now = now or timezone.now()
+        if self.valid_from and now < self.valid_from:
+            return False
+        if self.valid_until and now >= self.valid_until:
+            return False
+        return self.max_redemptions is None or self.redemption_count < self.max_redemptions
+
+
+class StockReservation(models.Model):
+    """
+    Units of an item held for an order between checkout and payment. Expired
+    reservations are released by the release_reservations command.
+    """
+    order = models.ForeignKey('Order', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'item'], name='unique_order_item_reservation'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} of {self.item}'
+
 
 class Refund(models.Model):
     order = models.ForeignKey('Order', on_delete=models.CASCADE)
@@ -0,0 +1,101 @@
+"""
+Full-page cache for catalog pages, with holes for per-visitor content.
+
+A cached page is rendered once with a marker in place of every
+``{% hole %}`` (the navbar's user block and cart badge, the messages and
+the CSRF token), and stored under its path, query string and a version
+that changes with the items it shows. Each request then only renders the
+holes, for its own visitor, into the stored HTML, so the same copy is
+served to anonymous and logged-in visitors alike.
+
+Only query strings made of the catalog's own parameters are cached, so
+arbitrary ones (tracking tags, cache busters) cannot fill the cache with
+copies of the same page.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+
+PAGE_KEY = 'page:{}:{}'
+
+# The templates that may be punched out of a cached page.
+HOLES = ('csrf_meta.html', 'navbar_user.html', 'messages.html')
+HOLE_MARKER = '<!--page-cache-hole:{}-->'
+HOLE_RE = re.compile(r'<!--page-cache-hole:([\w.-]+)-->')
+
+# The query parameters the cached views read: the facets, the search
+# query and the pagination cursors.
+CACHED_PARAMS = frozenset(('category', 'label', 'q', 'after', 'before', 'page'))
+
+
+def is_collecting_holes(request):
+    """Whether ``request`` is rendering a page to be cached."""
+    return getattr(request, '_page_cache_holes', False)
+
+
+def fill_holes(request, page):
+    """Render every hole of ``page`` for ``request``."""
+    rendered = {}
+
+    def render(match):
+        name = match.group(1)
+        if name not in HOLES:
+            return match.group(0)
+        if name not in rendered:
+            rendered[name] = render_to_string(name, request=request)
+        return rendered[name]
+
+    return HOLE_RE.sub(render, page)
+
+
+def _page_key(request, version):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(('%s?%s' % (request.path, query)).encode()).hexdigest()
+    return PAGE_KEY.format(digest, version)
+
+
+def cache_page_with_holes(version_func):
+    """
+    Serve a GET view from the page cache. ``version_func`` takes the view's
+    arguments and returns the version of what the page shows, which is
+    part of the cache key.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not CACHED_PARAMS.issuperset(request.GET):
+                return view_func(request, *args, **kwargs)
+            key = _page_key(request, version_func(request, *args, **kwargs))
+            page = cache.get(key)
+            if page is not None:
+                return HttpResponse(fill_holes(request, page))
+
+            def store(response):
+                request._page_cache_holes = False
+                if response.streaming or 'text/html' not in response.get('Content-Type', ''):
+                    return
+                page = response.content.decode(response.charset)
+                if response.status_code == 200:
+                    cache.set(key, page, settings.PAGE_CACHE_TIMEOUT)
+                response.content = fill_holes(request, page)
+
+            request._page_cache_holes = True
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                request._page_cache_holes = False
+                raise
+            if getattr(response, 'is_rendered', True):
+                store(response)
+            else:
+                # Template responses are rendered later, by the handler.
+                response.add_post_render_callback(store)
+            return response
+        return wrapped
+    return decorator
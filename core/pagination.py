@@ -0,0 +1,93 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.http import Http404
+
+
+def encode_cursor(item):
+    raw = f'{item.price!r}:{item.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        price, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(price), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise Http404('Invalid cursor')
+
+
+class KeysetPage:
+    """
+    A page of items walked on the (price, id) key instead of by offset.
+
+    Exposes the parts of Django's ``Page`` the templates use, plus the
+    cursors of the neighbouring pages. There is no page number or total
+    count since neither is known without scanning the table.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, cursor=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # The cursor this page was requested with, which bounds the
+        # neighbouring pages when this one came back empty.
+        self._cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return encode_cursor(self.object_list[-1]) if self.object_list else self._cursor
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return encode_cursor(self.object_list[0]) if self.object_list else self._cursor
+        return None
+
+
+def paginate_keyset(queryset, page_size, after=None, before=None):
+    """
+    Return the ``KeysetPage`` following ``after`` or preceding ``before``.
+
+    Items are ordered by descending price, ties broken by descending id,
+    which is served by the ``item_price_id_idx`` index. Each page is a
+    single ``LIMIT page_size + 1`` range scan, so deep pages cost the same
+    as the first one.
+    """
+    if before:
+        price, pk = decode_cursor(before)
+        rows = list(
+            queryset
+            .filter(Q(price__gte=price) & (Q(price__gt=price) | Q(pk__gt=pk)))
+            .order_by('price', 'pk')[:page_size + 1]
+        )
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return KeysetPage(rows, has_next=True, has_previous=has_previous, cursor=before)
+
+    if after:
+        price, pk = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(price__lte=price) & (Q(price__lt=price) | Q(pk__lt=pk)))
+    rows = list(queryset.order_by('-price', '-pk')[:page_size + 1])
+    has_next = len(rows) > page_size
+    return KeysetPage(rows[:page_size], has_next=has_next, has_previous=bool(after), cursor=after)
@@ -0,0 +1,158 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .cart import invalidate_cart_summary
+from .models import Order, Payment
+from .services import finalize_order, redeem_coupon, release_coupon, to_cents
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PAYMENT_WORKERS,
+                thread_name_prefix='payment',
+            )
+        return _executor
+
+
+def create_payment(order, user, token):
+    """
+    Record a pending payment for ``order`` and queue its charge.
+
+    If the order already has a payment, it is returned instead, so a retry
+    never creates a second charge: either it is still pending (e.g. the
+    form was submitted twice), or it is a charge the order changed under
+    and that awaits its refund (see ``finalize_order``). The cart cannot
+    change in either case (see ``CartService``).
+
+    A redemption of the order's coupon is taken before anything is charged
+    and held by the payment. If the coupon has none left, it is removed
+    from the order and no payment is created: returns None.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().select_related('payment').get(pk=order.pk)
+        if order.payment and order.payment.status in (Payment.PENDING, Payment.SUCCEEDED):
+            return order.payment
+        if order.coupon_id and not redeem_coupon(order.coupon_id):
+            order.set_coupon(None)
+            invalidate_cart_summary(user)
+            return None
+        payment = Payment.objects.create(
+            user=user,
+            amount=to_cents(order.total),
+            order_version=order.version,
+            coupon_id=order.coupon_id,
+            stripe_token=token or '',
+        )
+        order.payment = payment
+        order.save(update_fields=['payment'])
+        transaction.on_commit(lambda: enqueue_payment(payment.pk))
+    return payment
+
+
+def enqueue_payment(payment_id):
+    if settings.PAYMENT_WORKERS:
+        _get_executor().submit(_process_in_worker, payment_id)
+    else:
+        process_payment(payment_id)
+
+
+def _process_in_worker(payment_id):
+    close_old_connections()
+    try:
+        process_payment(payment_id)
+    except Exception:
+        logger.exception('Processing payment %s failed', payment_id)
+    finally:
+        close_old_connections()
+
+
+def process_payment(payment_id):
+    """
+    Charge a pending payment, retrying rate limit and network errors with
+    exponential backoff, and finalize its order when the charge succeeds.
+
+    Safe to call more than once for the same payment: finished payments are
+    left alone and Stripe deduplicates charges by idempotency key.
+    """
+    payment = Payment.objects.get(pk=payment_id)
+    if payment.status != Payment.PENDING:
+        return payment
+
+    stripe.api_base = settings.STRIPE_API_BASE
+    for attempt in range(settings.PAYMENT_MAX_RETRIES + 1):
+        payment.attempts += 1
+        try:
+            charge = stripe.Charge.create(
+                amount=int(payment.amount),
+                currency="usd",
+                source=payment.stripe_token,
+                api_key=settings.STRIPE_SECRET_KEY,
+                idempotency_key=str(payment.idempotency_key),
+            )
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.PAYMENT_MAX_RETRIES:
+                message = "Rate limit error." if isinstance(e, stripe.error.RateLimitError) else "Network error."
+                return _fail(payment, message)
+            time.sleep(settings.PAYMENT_RETRY_BACKOFF * 2 ** attempt)
+        except stripe.error.CardError as e:
+            # Since it's a decline, stripe.error.CardError will be caught
+            return _fail(payment, e.user_message or "Your card was declined.")
+        except stripe.error.InvalidRequestError:
+            return _fail(payment, "Invalid parameters.")
+        except stripe.error.AuthenticationError:
+            # Authentication with Stripe's API failed
+            # (maybe you changed API keys recently)
+            return _fail(payment, "Authentication error.")
+        except stripe.error.StripeError:
+            return _fail(payment, "Something went wrong. You were not charged. Please try again.")
+        else:
+            return _succeed(payment, charge)
+
+
+def _succeed(payment, charge):
+    with transaction.atomic():
+        updated = Payment.objects.filter(pk=payment.pk, status=Payment.PENDING).update(
+            status=Payment.SUCCEEDED,
+            stripe_charge_id=charge.id,
+            stripe_token='',
+            attempts=payment.attempts,
+        )
+        if updated:
+            order = Order.objects.select_related('user').get(payment=payment)
+            finalize_order(order, payment)
+            transaction.on_commit(lambda: invalidate_cart_summary(order.user))
+    payment.refresh_from_db()
+    return payment
+
+
+def _fail(payment, message):
+    with transaction.atomic():
+        updated = Payment.objects.filter(pk=payment.pk, status=Payment.PENDING).update(
+            status=Payment.FAILED,
+            stripe_token='',
+            attempts=payment.attempts,
+            error=message[:255],
+        )
+        if updated:
+            # Detach the payment so the customer can try again.
+            Order.objects.filter(payment=payment, ordered=False).update(payment=None)
+            if payment.coupon_id:
+                release_coupon(payment.coupon_id)
+    payment.refresh_from_db()
+    return payment
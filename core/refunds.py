@@ -0,0 +1,173 @@
+"""
+Batch refunds through Stripe.
+
+Refunds are issued concurrently on a pool of threads, and every request to
+Stripe first takes a token from a shared ``RateLimiter``, so a batch of
+thousands of orders finishes in minutes without tripping the API rate
+limit. Each refund is sent with an idempotency key derived from the
+payment's, so retrying an order (or running the batch again) never refunds
+a charge twice.
+
+``issue_refunds`` waits for its batch; ``queue_refunds`` hands the orders
+to a long-lived pool shared by the whole process and returns at once, for
+callers like the admin that must not block on Stripe.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Order, Payment, Refund
+from .payments import RETRYABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+REFUNDED = 'refunded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+RefundResult = namedtuple('RefundResult', ['order_id', 'ref_code', 'status', 'message'])
+
+_executor = None
+_limiter = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """The process-wide refund pool and the rate limiter its workers share."""
+    global _executor, _limiter
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REFUND_WORKERS,
+                thread_name_prefix='refund',
+            )
+            _limiter = RateLimiter(settings.REFUND_RATE_LIMIT)
+        return _executor, _limiter
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket allowing ``rate`` calls per second on
+    average and bursts of up to ``burst`` calls. A rate of 0 means no limit.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def refund_idempotency_key(payment):
+    return f'refund-{payment.idempotency_key}'
+
+
+def refund_order(order_id, limiter=None):
+    """
+    Refund the charge of order ``order_id`` in full and mark the order's
+    refund as granted. Returns a ``RefundResult``.
+
+    Orders that were never charged or are already refunded are skipped.
+    """
+    order = Order.objects.select_related('payment').get(pk=order_id)
+    payment = order.payment
+    if payment is None or payment.status != Payment.SUCCEEDED or not payment.stripe_charge_id:
+        return RefundResult(order.pk, order.ref_code, SKIPPED, 'No charge to refund.')
+    if payment.stripe_refund_id:
+        _grant(order, payment)
+        return RefundResult(order.pk, order.ref_code, SKIPPED, 'Already refunded.')
+
+    stripe.api_base = settings.STRIPE_API_BASE
+    for attempt in range(settings.PAYMENT_MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            refund = stripe.Refund.create(
+                charge=payment.stripe_charge_id,
+                api_key=settings.STRIPE_SECRET_KEY,
+                idempotency_key=refund_idempotency_key(payment),
+            )
+        except RETRYABLE_ERRORS as e:
+            if attempt == settings.PAYMENT_MAX_RETRIES:
+                message = "Rate limit error." if isinstance(e, stripe.error.RateLimitError) else "Network error."
+                return RefundResult(order.pk, order.ref_code, FAILED, message)
+            time.sleep(settings.PAYMENT_RETRY_BACKOFF * 2 ** attempt)
+        except stripe.error.StripeError as e:
+            return RefundResult(order.pk, order.ref_code, FAILED, e.user_message or str(e))
+        else:
+            payment.stripe_refund_id = refund.id
+            _grant(order, payment)
+            return RefundResult(order.pk, order.ref_code, REFUNDED, refund.id)
+
+
+def _grant(order, payment):
+    with transaction.atomic():
+        Payment.objects.filter(pk=payment.pk, stripe_refund_id='').update(stripe_refund_id=payment.stripe_refund_id)
+        Order.objects.filter(pk=order.pk, ordered=True).update(refund_requested=False, refund_granted=True)
+        # An order that was never placed (see finalize_order) gets its cart
+        # back, so the customer can pay again.
+        Order.objects.filter(pk=order.pk, ordered=False).update(refund_requested=False, payment=None)
+        Refund.objects.filter(order=order).update(accepted=True)
+
+
+def _refund_in_worker(order_id, limiter):
+    try:
+        return refund_order(order_id, limiter)
+    except Exception as e:
+        logger.exception('Refunding order %s failed', order_id)
+        return RefundResult(order_id, '', FAILED, str(e))
+    finally:
+        close_old_connections()
+
+
+def issue_refunds(order_ids, workers=None, rate=None):
+    """
+    Refund the orders ``order_ids`` on ``workers`` threads, sending at most
+    ``rate`` requests per second to Stripe. Returns a ``RefundResult`` per
+    order, in the order given.
+    """
+    workers = workers or settings.REFUND_WORKERS
+    limiter = RateLimiter(settings.REFUND_RATE_LIMIT if rate is None else rate)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='refund') as executor:
+        return list(executor.map(lambda order_id: _refund_in_worker(order_id, limiter), order_ids))
+
+
+def _queued_refund(order_id, limiter):
+    result = _refund_in_worker(order_id, limiter)
+    if result.status == FAILED:
+        logger.error('Refunding order %s failed: %s', result.ref_code or order_id, result.message)
+    else:
+        logger.info('Order %s: %s (%s)', result.ref_code or order_id, result.status, result.message)
+    return result
+
+
+def queue_refunds(order_ids):
+    """
+    Refund the orders ``order_ids`` in the background and return at once,
+    with a future of each order's ``RefundResult``. Results are logged;
+    orders that failed keep their refund request, so the
+    ``issue_refunds`` command picks them up again.
+    """
+    executor, limiter = _get_executor()
+    return [executor.submit(_queued_refund, order_id, limiter) for order_id in order_ids]
@@ -0,0 +1,77 @@
+"""
+Sales figures for the admin, aggregated by the database.
+
+Each section of the report is one grouped query over placed orders, so the
+cost of the report depends on the number of days, categories and coupons
+shown, not on the number of orders.
+"""
+import datetime
+
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, When
+from django.db.models.functions import TruncDate
+
+from .exports import day_start
+from .models import CATEGORY_CHOICES, Order, OrderItem
+
+
+def _discounted(field):
+    # Like get_final_price(), a discount price of 0 means no discount.
+    return Q(**{'%s__isnull' % field: False}) & ~Q(**{field: 0})
+
+
+# Price a line was sold at: the snapshot taken when the order was placed,
+# or the item's current prices for orders placed before snapshots existed.
+LINE_PRICE = Case(
+    When(_discounted('unit_price_discount') & Q(unit_price__isnull=False), then=F('unit_price_discount')),
+    When(unit_price__isnull=False, then=F('unit_price')),
+    When(_discounted('item__price_discount'), then=F('item__price_discount')),
+    default=F('item__price'),
+    output_field=FloatField(),
+)
+LINE_REVENUE = ExpressionWrapper(F('quantity') * LINE_PRICE, output_field=FloatField())
+
+
+def sales_report(start, end):
+    """
+    Return the totals, revenue per day, revenue per category and coupon use
+    of the orders placed from ``start`` through ``end`` (dates, inclusive).
+    """
+    orders = Order.objects.filter(
+        ordered=True,
+        ordered_date__gte=day_start(start),
+        ordered_date__lt=day_start(end + datetime.timedelta(days=1)),
+    )
+    totals = orders.aggregate(
+        orders=Count('id'),
+        revenue=Sum('total'),
+        discounts=Sum('discount_total'),
+        coupon_discounts=Sum('coupon_discount'),
+    )
+    days = (orders
+            .annotate(day=TruncDate('ordered_date'))
+            .values('day')
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+            .order_by('day'))
+    categories = (OrderItem.objects
+                  .filter(order__in=orders)
+                  .values('item__category')
+                  .annotate(items_sold=Sum('quantity'), revenue=Sum(LINE_REVENUE))
+                  .order_by('-revenue'))
+    coupons = (orders
+               .filter(coupon__isnull=False)
+               .values('coupon__code')
+               .annotate(orders=Count('id'), discount=Sum('coupon_discount'), revenue=Sum('total'))
+               .order_by('-orders', 'coupon__code'))
+
+    category_names = dict(CATEGORY_CHOICES)
+    return {
+        'start': start,
+        'end': end,
+        'totals': totals,
+        'days': list(days),
+        'categories': [
+            dict(row, name=category_names.get(row['item__category'], row['item__category']))
+            for row in categories
+        ],
+        'coupons': list(coupons),
+    }
@@ -0,0 +1,104 @@
+"""
+Full-text search over the catalog.
+
+SQLite uses an FTS5 table, ``core_item_fts``, whose rows share their rowid
+with ``core_item`` and are written by the ``Item`` save/delete signals.
+PostgreSQL uses a GIN index over a weighted ``tsvector`` expression, which
+the database maintains by itself. Other databases fall back to ``LIKE``.
+The FTS table and the GIN index are created by migration 0017.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import CATEGORY_CHOICES, Item
+
+FTS_TABLE = 'core_item_fts'
+PG_INDEX = 'core_item_search_idx'
+
+# Category codes are indexed by their display name, so "shirt" finds them.
+CATEGORY_SQL = 'CASE category %s ELSE \'\' END' % ' '.join(
+    "WHEN '%s' THEN '%s'" % choice for choice in CATEGORY_CHOICES)
+
+# Must stay identical to the expression indexed by migration 0017, or
+# PostgreSQL will not use the index.
+PG_DOCUMENT = (
+    "setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', %s), 'B') || "
+    "setweight(to_tsvector('english', description), 'C')" % CATEGORY_SQL
+)
+
+# bm25() weights of the title, category and description columns.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def index_item(item):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [item.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, category, description) VALUES (%s, %s, %s, %s)",
+            [item.pk, item.title, item.get_category_display(), item.description])
+
+
+def unindex_item(item_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [item_id])
+
+
+def rebuild_index():
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, category, description) "
+                f"SELECT id, title, {CATEGORY_SQL}, description FROM core_item")
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {PG_INDEX}")
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _search_ids(terms, offset, limit):
+    if connection.vendor == 'sqlite':
+        # Each term is quoted (so user input cannot inject FTS syntax) and
+        # matched as a prefix; terms are implicitly ANDed.
+        match = ' '.join('"%s"*' % term for term in terms)
+        sql = (f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+               f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s OFFSET %s")
+        params = [match, *FTS_WEIGHTS, limit, offset]
+    else:
+        sql = (f"SELECT id FROM core_item, plainto_tsquery('english', %s) query "
+               f"WHERE ({PG_DOCUMENT}) @@ query "
+               f"ORDER BY ts_rank(({PG_DOCUMENT}), query) DESC, id LIMIT %s OFFSET %s")
+        params = [' '.join(terms), limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_items(query, offset=0, limit=10):
+    """
+    Return up to ``limit`` items matching ``query``, best matches first,
+    skipping the first ``offset`` matches.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        return list(Item.objects.filter(condition)[offset:offset + limit])
+
+    ids = _search_ids(terms, offset, limit)
+    items = Item.objects.in_bulk(ids)
+    return [items[pk] for pk in ids if pk in items]
@@ -0,0 +1,228 @@
+import logging
+import uuid
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .cart import invalidate_cart_summary
+from .coupons import bump_coupon_version
+from .inventory import consume_stock
+from .models import Coupon, Item, Order, OrderItem, Refund
+
+logger = logging.getLogger(__name__)
+
+CartResult = namedtuple('CartResult', ['status', 'order', 'order_item'])
+
+
+class CartService:
+    """
+    Cart mutations for one user's open order.
+
+    Each operation runs in a single transaction: the open order row is
+    locked first, which serializes concurrent changes to the same cart,
+    and quantities and totals are changed with ``F()`` updates. Partial
+    unique constraints on ``Order`` and ``OrderItem`` guarantee that two
+    concurrent first clicks cannot create two carts or two lines.
+
+    While a payment for the order is pending the cart cannot change, so the
+    charged amount is always the amount of the order that gets placed. An
+    open order only has a payment while it is pending, or while a charge
+    that could not be used awaits its refund (see ``finalize_order``):
+    failed payments are detached and successful ones place the order.
+
+    Every operation issues a fixed number of queries, independent of the
+    size of the cart.
+    """
+    ADDED = 'added'
+    UPDATED = 'updated'
+    REMOVED = 'removed'
+    NOT_IN_CART = 'not-in-cart'
+    NO_ORDER = 'no-order'
+    PAYMENT_PENDING = 'payment-pending'
+
+    def __init__(self, user):
+        self.user = user
+
+    def _get_open_order(self, create=False):
+        orders = Order.objects.select_for_update()
+        if create:
+            order, _ = orders.get_or_create(
+                user=self.user,
+                ordered=False,
+                defaults={'ordered_date': timezone.now()},
+            )
+            return order
+        return orders.filter(user=self.user, ordered=False).first()
+
+    def _get_order_item(self, item):
+        order_item = (OrderItem.objects
+                      .select_for_update()
+                      .filter(item=item, user=self.user, ordered=False)
+                      .first())
+        if order_item is not None:
+            order_item.item = item
+        return order_item
+
+    def _changed(self):
+        # Dropped again on commit, in case a concurrent request re-cached
+        # the summary from before this transaction.
+        invalidate_cart_summary(self.user)
+        transaction.on_commit(lambda: invalidate_cart_summary(self.user))
+
+    def add(self, item, quantity=1):
+        with transaction.atomic():
+            order = self._get_open_order(create=True)
+            if order.payment_id is not None:
+                return CartResult(self.PAYMENT_PENDING, order, None)
+            order_item, created = OrderItem.objects.select_for_update().get_or_create(
+                item=item,
+                user=self.user,
+                ordered=False,
+                defaults={
+                    'quantity': quantity,
+                    'unit_price': item.price,
+                    'unit_price_discount': item.price_discount,
+                },
+            )
+            if created:
+                order.items.add(order_item)
+                status = self.ADDED
+            else:
+                OrderItem.objects.filter(pk=order_item.pk).update(
+                    quantity=F('quantity') + quantity)
+                order_item.quantity += quantity
+                status = self.UPDATED
+            order.add_line_totals(order_item, quantity)
+            self._changed()
+        return CartResult(status, order, order_item)
+
+    def decrement(self, item):
+        with transaction.atomic():
+            order = self._get_open_order()
+            if order is None:
+                return CartResult(self.NO_ORDER, None, None)
+            if order.payment_id is not None:
+                return CartResult(self.PAYMENT_PENDING, order, None)
+            order_item = self._get_order_item(item)
+            if order_item is None:
+                return CartResult(self.NOT_IN_CART, order, None)
+            if order_item.quantity > 1:
+                OrderItem.objects.filter(pk=order_item.pk).update(
+                    quantity=F('quantity') - 1)
+                order_item.quantity -= 1
+                status = self.UPDATED
+            else:
+                order_item.delete()
+                order_item.quantity = 0
+                status = self.REMOVED
+            order.add_line_totals(order_item, -1)
+            self._changed()
+        return CartResult(status, order, order_item)
+
+    def remove(self, item):
+        with transaction.atomic():
+            order = self._get_open_order()
+            if order is None:
+                return CartResult(self.NO_ORDER, None, None)
+            if order.payment_id is not None:
+                return CartResult(self.PAYMENT_PENDING, order, None)
+            order_item = self._get_order_item(item)
+            if order_item is None:
+                return CartResult(self.NOT_IN_CART, order, None)
+            quantity = order_item.quantity
+            order_item.delete()
+            order_item.quantity = 0
+            order.add_line_totals(order_item, -quantity)
+            self._changed()
+        return CartResult(self.REMOVED, order, order_item)
+
+
+def _create_ref_code():
+    return str(uuid.uuid4())
+
+
+def to_cents(amount):
+    """The Stripe amount, in cents, of ``amount`` dollars."""
+    # Rounded, not truncated: 19.99 * 100 is 1998.9999999999998.
+    return int(round(amount * 100))
+
+
+def finalize_order(order, payment):
+    """
+    Mark ``order`` and all of its items as ordered after a successful charge.
+
+    The order must still be what was charged: if its version or total no
+    longer match the payment (it was changed outside of the cart), it is
+    left open and flagged for a refund of the charge instead. Lines get
+    the prices they were charged at; those added before lines carried
+    their prices get the item's current ones, in a single UPDATE, so the
+    number of statements does not depend on the size of the order.
+    Returns whether the order was placed.
+    """
+    item = Item.objects.filter(pk=OuterRef('item_id')).order_by()
+    with transaction.atomic():
+        current = (Order.objects
+                   .select_for_update()
+                   .filter(pk=order.pk, ordered=False)
+                   .values_list('version', 'total')
+                   .first())
+        if current is None:
+            return False
+        version, total = current
+        if ((payment.order_version is not None and version != payment.order_version)
+                or to_cents(total) != int(payment.amount)):
+            _flag_for_refund(order, payment)
+            return False
+        Order.objects.filter(pk=order.pk).update(
+            ordered=True,
+            payment=payment,
+            ref_code=_create_ref_code(),
+            refund_requested=False,
+        )
+        OrderItem.objects.filter(order=order).update(ordered=True)
+        OrderItem.objects.filter(order=order, unit_price__isnull=True).update(
+            unit_price=Subquery(item.values('price')[:1]),
+            unit_price_discount=Subquery(item.values('price_discount')[:1]),
+        )
+        consume_stock(order)
+    return True
+
+
+def _flag_for_refund(order, payment):
+    logger.error('Payment %s no longer matches order %s; the order was not placed', payment.pk, order.pk)
+    Order.objects.filter(pk=order.pk).update(payment=payment, refund_requested=True)
+    if payment.coupon_id:
+        release_coupon(payment.coupon_id)
+    Refund.objects.create(
+        order=order,
+        reason='The order changed while it was being paid for; the charge was not used.',
+        email=order.user.email,
+    )
+
+
+def redeem_coupon(coupon_id):
+    """
+    Take one redemption of a coupon, unless it has none left. When this
+    uses up the last one, coupon tables are reloaded so it stops being
+    offered. Returns whether a redemption was taken.
+    """
+    redeemable = Q(max_redemptions__isnull=True) | Q(redemption_count__lt=F('max_redemptions'))
+    if not Coupon.objects.filter(redeemable, pk=coupon_id).update(redemption_count=F('redemption_count') + 1):
+        return False
+    if Coupon.objects.filter(pk=coupon_id, redemption_count__gte=F('max_redemptions')).exists():
+        _coupons_changed()
+    return True
+
+
+def release_coupon(coupon_id):
+    """Give back a redemption taken by ``redeem_coupon``."""
+    Coupon.objects.filter(pk=coupon_id, redemption_count__gt=0).update(redemption_count=F('redemption_count') - 1)
+    if Coupon.objects.filter(pk=coupon_id, redemption_count=F('max_redemptions') - 1).exists():
+        _coupons_changed()
+
+
+def _coupons_changed():
+    bump_coupon_version()
+    transaction.on_commit(bump_coupon_version)
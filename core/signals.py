@@ -0,0 +1,81 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .catalog import bump_catalog_version, bump_item_version
+from .coupons import bump_coupon_version
+from .facets import FACETS, adjust_facet_count
+from .guest_cart import merge_guest_cart
+from .images import queue_item_image
+from .models import Coupon, Item
+
+
+@receiver(post_save, sender=Item)
+def generate_image_derivatives(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    if instance.image and (created or loaded.get('image') != instance.image.name):
+        transaction.on_commit(lambda: queue_item_image(instance.pk))
+
+
+@receiver(post_save, sender=Item)
+def index_item(sender, instance, **kwargs):
+    search.index_item(instance)
+
+
+@receiver(post_delete, sender=Item)
+def unindex_item(sender, instance, **kwargs):
+    search.unindex_item(instance.pk)
+
+
+@receiver(post_save, sender=Item)
+def update_facet_counts(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    for facet in FACETS:
+        value = getattr(instance, facet)
+        if created:
+            adjust_facet_count(facet, value, 1)
+        elif facet in loaded and loaded[facet] != value:
+            adjust_facet_count(facet, loaded[facet], -1)
+            adjust_facet_count(facet, value, 1)
+
+
+@receiver(post_delete, sender=Item)
+def remove_from_facet_counts(sender, instance, **kwargs):
+    for facet in FACETS:
+        adjust_facet_count(facet, getattr(instance, facet), -1)
+
+
+def _bump_versions(*slugs):
+    bump_catalog_version()
+    for slug in slugs:
+        bump_item_version(slug)
+
+
+@receiver(post_save, sender=Item)
+def invalidate_cached_item(sender, instance, **kwargs):
+    slugs = {instance.slug, getattr(instance, '_loaded_values', {}).get('slug', instance.slug)}
+    _bump_versions(*slugs)
+    # Bumped again on commit, in case a concurrent request cached the item
+    # from before this transaction.
+    transaction.on_commit(lambda: _bump_versions(*slugs))
+
+
+@receiver(post_delete, sender=Item)
+def remove_cached_item(sender, instance, **kwargs):
+    _bump_versions(instance.slug)
+    transaction.on_commit(lambda: _bump_versions(instance.slug))
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupons(sender, **kwargs):
+    bump_coupon_version()
+    transaction.on_commit(bump_coupon_version)
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        merge_guest_cart(request, user)
@@ -0,0 +1,150 @@
+"""
+Fingerprinted, precompressed static files.
+
+``collectstatic`` (run by the ``build_static`` command) copies every asset
+under a name containing a hash of its content, records the names in a
+manifest, and writes a gzip sibling (``app.3f2a1c.css.gz``) and, when the
+``brotli`` package is installed, a brotli one (``.br``) of each text
+asset. Fingerprinted names never change content, so they are served with
+far-future cache headers: by ``serve_static`` when the site serves its own
+files, or by Azure blob storage (see ``djecommerce/azure.py``).
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Assets worth compressing; images and web fonts other than these are
+# compressed already.
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.eot', '.ttf', '.otf')
+# A compressed sibling is only kept if it saves at least this fraction.
+MIN_COMPRESSION_RATIO = 0.95
+
+# (Content-Encoding, file suffix), preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(content, suffixes=('.br', '.gz'), min_ratio=MIN_COMPRESSION_RATIO):
+    """
+    Return ``{suffix: compressed bytes}`` of the encodings worth serving,
+    all of them if ``min_ratio`` is None.
+    """
+    variants = {}
+    if '.gz' in suffixes:
+        variants['.gz'] = gzip.compress(content, compresslevel=9, mtime=0)
+    if '.br' in suffixes and brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {
+        suffix: data for suffix, data in variants.items()
+        if min_ratio is None or len(data) < len(content) * min_ratio
+    }
+
+
+class PrecompressMixin:
+    """
+    Write compressed siblings of the fingerprinted files produced by a
+    ``ManifestFilesMixin`` storage during ``collectstatic``.
+    """
+    precompressed_suffixes = ('.br', '.gz')
+    min_compression_ratio = MIN_COMPRESSION_RATIO
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                with self.open(hashed_name) as f:
+                    content = f.read()
+                variants = compress(content, self.precompressed_suffixes, self.min_compression_ratio)
+                for suffix, data in variants.items():
+                    self.write_variant(hashed_name + suffix, data)
+                    yield hashed_name, hashed_name + suffix, True
+
+    def write_variant(self, name, data):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
+
+
+class CompressedManifestStaticFilesStorage(PrecompressMixin, ManifestStaticFilesStorage):
+    pass
+
+
+# (manifest, its fingerprinted names), rebuilt when the manifest is replaced.
+_fingerprinted = (None, frozenset())
+
+
+def _is_fingerprinted(path):
+    global _fingerprinted
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    manifest, names = _fingerprinted
+    if manifest is not hashed_files:
+        names = frozenset(hashed_files.values()) if hashed_files else frozenset()
+        _fingerprinted = (hashed_files, names)
+    return path in names
+
+
+def _choose_encoding(accept_encoding, available):
+    """
+    The coding of ``available`` (in order of preference) that the client
+    likes best according to its ``Accept-Encoding`` header, None if it
+    accepts none of them.
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def serve_static(request, path):
+    """
+    Serve ``path`` from ``STATIC_ROOT``, using its precompressed sibling when
+    the client accepts it. Fingerprinted files may be cached forever.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = safe_join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404('Static file not found')
+
+    variants = {coding: suffix for coding, suffix in ENCODINGS if os.path.isfile(fullpath + suffix)}
+    encoding = _choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), list(variants))
+    if encoding:
+        fullpath += variants[encoding]
+
+    content_type, _ = mimetypes.guess_type(path)
+    response = FileResponse(open(fullpath, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if _is_fingerprinted(path):
+        patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=60)
+    return response
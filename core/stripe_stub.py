@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StripeStub:
+    """
+    A local stand-in for the parts of the Stripe API the shop uses.
+
+    Serves ``POST /v1/charges`` and ``POST /v1/refunds`` on a free local
+    port, honouring ``Idempotency-Key`` the way Stripe does. Point
+    ``settings.STRIPE_API_BASE`` at ``stub.url`` to use it::
+
+        with StripeStub() as stub, override_settings(STRIPE_API_BASE=stub.url):
+            ...
+
+    Charges with a token in ``decline_tokens`` are declined, the first
+    ``rate_limit_failures`` requests are answered with a 429, and every
+    response is delayed by ``latency`` seconds.
+    """
+
+    def __init__(self, decline_tokens=('tok_chargeDeclined',), rate_limit_failures=0, latency=0):
+        self.decline_tokens = set(decline_tokens)
+        self.rate_limit_failures = rate_limit_failures
+        self.latency = latency
+        self.requests = []
+        self.charges = {}
+        self.refunds = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                status, body = stub.handle(self.path, params, self.headers.get('Idempotency-Key'))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, path, params, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append((path, params, idempotency_key))
+            if self.rate_limit_failures > 0:
+                self.rate_limit_failures -= 1
+                return 429, _error('rate_limit_error', 'Too many requests hit the API too quickly.')
+            if path == '/v1/charges':
+                return self._charge(params, idempotency_key)
+            if path == '/v1/refunds':
+                return self._refund(params, idempotency_key)
+        return 404, _error('invalid_request_error', f'Unrecognized request URL (POST: {path}).')
+
+    def _charge(self, params, idempotency_key):
+        if idempotency_key in self.charges:
+            return 200, self.charges[idempotency_key]
+        if params.get('source') in self.decline_tokens:
+            return 402, _error('card_error', 'Your card was declined.', code='card_declined')
+        charge = {
+            'id': f'ch_{uuid.uuid4().hex[:24]}',
+            'object': 'charge',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'usd'),
+            'status': 'succeeded',
+            'refunded': False,
+        }
+        self.charges[idempotency_key or charge['id']] = charge
+        return 200, charge
+
+    def _refund(self, params, idempotency_key):
+        if idempotency_key in self.refunds:
+            return 200, self.refunds[idempotency_key]
+        refund = {
+            'id': f're_{uuid.uuid4().hex[:24]}',
+            'object': 'refund',
+            'charge': params.get('charge'),
+            'status': 'succeeded',
+        }
+        self.refunds[idempotency_key or refund['id']] = refund
+        return 200, refund
+
+
+def _error(type, message, code=None):
+    return {'error': {'type': type, 'message': message, 'code': code}}
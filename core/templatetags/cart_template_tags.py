@@ -1,13 +1,12 @@
 from django import template
-from core.models import Order
+from core.cart import get_cart_summary
+from core.guest_cart import GuestCart
 
 register = template.Library()
 
 
 @register.filter
-def cart_item_count(user):
-    if user.is_authenticated:
-        qs = Order.objects.filter(user=user, ordered=False)
-        if qs.exists():
-            return qs[0].items.count()
-    return 0
+def cart_item_count(request):
+    if request.user.is_authenticated:
+        return get_cart_summary(request.user)['line_count']
+    return GuestCart.from_request(request).line_count()
@@ -0,0 +1,48 @@
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from core.images import DERIVATIVE_FORMATS, derivative_name
+
+register = template.Library()
+
+
+def _srcset(digest, extension):
+    return ', '.join(
+        '%s %dw' % (default_storage.url(derivative_name(digest, width, extension)), width)
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS
+    )
+
+
+@register.simple_tag
+def responsive_image(item, sizes='100vw', css_class='', alt=''):
+    """
+    Render ``item.image`` as a lazily loaded ``<picture>`` offering the WebP
+    and JPEG derivatives at every width. Falls back to the original upload
+    while the derivatives have not been generated yet.
+    """
+    if not item.image:
+        return ''
+    if not item.image_hash:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="lazy" />',
+            item.image.url, css_class, alt)
+
+    fallback_extension = DERIVATIVE_FORMATS[0][1]
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}" />',
+        ((extension, _srcset(item.image_hash, extension), sizes)
+         for _, extension in reversed(DERIVATIVE_FORMATS)
+         if extension != fallback_extension),
+    )
+    default_width = settings.IMAGE_DERIVATIVE_WIDTHS[0]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" /></picture>',
+        sources,
+        default_storage.url(derivative_name(item.image_hash, default_width, fallback_extension)),
+        _srcset(item.image_hash, fallback_extension),
+        sizes,
+        css_class,
+        alt,
+    )
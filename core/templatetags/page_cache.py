@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.page_cache import HOLE_MARKER, HOLES, is_collecting_holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name):
+    """
+    Render ``template_name`` here, or leave a marker for it when the page is
+    being stored in the page cache (see ``core.page_cache``).
+    """
+    if template_name not in HOLES:
+        raise template.TemplateSyntaxError('%s is not a page cache hole' % template_name)
+    request = context.get('request')
+    if request is not None and is_collecting_holes(request):
+        return mark_safe(HOLE_MARKER.format(template_name))
+    return context.template.engine.get_template(template_name).render(context)
@@ -1,3 +1,1556 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from functools import wraps
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.template import Context, Template
+from django.db.models import F
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import urls
+from .benchmark import CHECKOUT_DATA, RENDER_SCENARIOS, compare, run_benchmark, run_render_benchmark
+from .cart import CART_SUMMARY_KEY, get_cart_summary
+from .catalog import CATALOG_VERSION_KEY, ITEM_VERSION_KEY, get_item
+from .checks import check_shared_cache
+from .coupons import get_coupon
+from .facets import get_facet_counts
+from .images import derivative_name, process_item_image
+from .inventory import extend_reservations, release_expired, reserve_order
+from .middleware import get_request_stats, reset as reset_request_stats
+from .models import BillingAddress, Coupon, Item, Order, OrderItem, Payment, Refund, StockReservation
+from .pagination import encode_cursor, paginate_keyset
+from .payments import create_payment, process_payment
+from .refunds import FAILED, REFUNDED, SKIPPED, RateLimiter, issue_refunds, queue_refunds
+from .reports import sales_report
+from .search import search_items
+from .services import CartService, finalize_order, redeem_coupon, to_cents
+from .stripe_stub import StripeStub
+
+User = get_user_model()
+
+# Upper bound on the queries of a single cart mutation, whatever the cart size.
+CART_MUTATION_QUERY_BUDGET = 8
+
+
+def _begin_immediate(self):
+    # BEGIN IMMEDIATE takes SQLite's write lock up front, where other
+    # databases lock the rows read with SELECT ... FOR UPDATE.
+    self.cursor().execute('BEGIN IMMEDIATE')
+
+
+def concurrent_transactions(test_func):
+    """
+    Run a test of concurrent transactions. On SQLite, which has no
+    SELECT ... FOR UPDATE, every transaction is serialized instead; that
+    needs the test database in a file (see ``DATABASES``).
+    """
+    @wraps(test_func)
+    def wrapped(self):
+        if connection.features.has_select_for_update:
+            return test_func(self)
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest('Concurrent transactions need row locks or a file-backed SQLite database')
+        with mock.patch.object(type(connections[DEFAULT_DB_ALIAS]), '_start_transaction_under_autocommit', _begin_immediate):
+            return test_func(self)
+    return wrapped
+
+
+def make_item(slug, price=10.0, price_discount=None):
+    return Item.objects.create(
+        title=slug.title(),
+        price=price,
+        price_discount=price_discount,
+        category='S',
+        label='P',
+        slug=slug,
+        description='Description',
+        image='',
+    )
+
+
+class CartServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='password')
+        self.item = make_item('shirt', price=10.0, price_discount=8.0)
+        self.cart = CartService(self.user)
+
+    def test_add_creates_order_and_line(self):
+        result = self.cart.add(self.item)
+        self.assertEqual(result.status, CartService.ADDED)
+        order = Order.objects.get(user=self.user, ordered=False)
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [1])
+        self.assertEqual(order.total, 8.0)
+
+    def test_add_existing_line_increments_quantity(self):
+        self.cart.add(self.item)
+        result = self.cart.add(self.item)
+        self.assertEqual(result.status, CartService.UPDATED)
+        self.assertEqual(OrderItem.objects.get().quantity, 2)
+        order = Order.objects.get()
+        self.assertEqual((order.subtotal, order.discount_total, order.total), (20.0, 4.0, 16.0))
+
+    def test_decrement_removes_last_unit(self):
+        self.cart.add(self.item)
+        self.cart.add(self.item)
+        self.assertEqual(self.cart.decrement(self.item).status, CartService.UPDATED)
+        self.assertEqual(self.cart.decrement(self.item).status, CartService.REMOVED)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(Order.objects.get().total, 0.0)
+
+    def test_remove(self):
+        self.assertEqual(self.cart.remove(self.item).status, CartService.NO_ORDER)
+        self.cart.add(self.item, quantity=3)
+        other = make_item('hat')
+        self.assertEqual(self.cart.remove(other).status, CartService.NOT_IN_CART)
+        self.assertEqual(self.cart.remove(self.item).status, CartService.REMOVED)
+        self.assertEqual(Order.objects.get().subtotal, 0.0)
+
+    def test_line_keeps_the_price_it_was_added_at(self):
+        self.cart.add(self.item)
+        self.cart.add(self.item)
+        Item.objects.filter(pk=self.item.pk).update(price=20.0, price_discount=None)
+        self.item.refresh_from_db()
+        self.cart.add(self.item)
+        order = Order.objects.get()
+        self.assertEqual((order.subtotal, order.discount_total, order.total), (30.0, 6.0, 24.0))
+        self.cart.decrement(self.item)
+        self.cart.remove(self.item)
+        order.refresh_from_db()
+        self.assertEqual((order.subtotal, order.discount_total, order.total), (0.0, 0.0, 0.0))
+
+        self.cart.add(self.item)
+        order.refresh_from_db()
+        self.assertEqual(order.total, 20.0)
+        self.assertEqual(order.calculate_totals()['total'], order.total)
+
+    def test_cart_is_locked_while_payment_is_pending(self):
+        self.cart.add(make_item('scarf', price=19.99))
+        order = Order.objects.get()
+        # On-commit hooks never run in a TestCase, so the payment stays pending.
+        payment = create_payment(order, self.user, 'tok_visa')
+        self.assertEqual(payment.amount, 1999)
+        self.assertEqual(self.cart.add(self.item).status, CartService.PAYMENT_PENDING)
+        self.assertEqual(self.cart.remove(make_item('hat')).status, CartService.PAYMENT_PENDING)
+        self.assertEqual(create_payment(order, self.user, 'tok_visa'), payment)
+        self.assertEqual(Order.objects.get().total, 19.99)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('core:api-cart-add', kwargs={'slug': self.item.slug}))
+        self.assertEqual(response.status_code, 409)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for i in range(20):
+            self.cart.add(make_item(f'item-{i}'))
+        self.cart.add(self.item)
+        for operation in (self.cart.add, self.cart.decrement, self.cart.remove):
+            with CaptureQueriesContext(connection) as queries:
+                operation(self.item)
+            self.assertLessEqual(len(queries), CART_MUTATION_QUERY_BUDGET, operation.__name__)
+
+
+@override_settings(PAYMENT_WORKERS=0, PAYMENT_RETRY_BACKOFF=0)
+class CartSummaryTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', password='password')
+        self.shirt, self.hat = make_item('shirt'), make_item('hat')
+        self.client.force_login(self.user)
+
+    def badge(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return Template('{% load cart_template_tags %}{{ request|cart_item_count }}').render(
+            Context({'request': request}))
+
+    def assertInvalidated(self, method, url, data=None, **summary):
+        get_cart_summary(self.user)
+        getattr(self.client, method)(url, data)
+        self.assertIsNone(cache.get(CART_SUMMARY_KEY.format(self.user.pk)), url)
+        self.assertEqual({key: get_cart_summary(self.user)[key] for key in summary}, summary, url)
+
+    def test_second_render_makes_no_queries(self):
+        CartService(self.user).add(self.shirt)
+        self.assertEqual(self.badge(), '1')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.badge(), '1')
+
+    def test_cart_changes_invalidate_the_summary(self):
+        def cart_url(name, item):
+            return reverse('core:%s' % name, kwargs={'slug': item.slug})
+
+        self.assertInvalidated('get', cart_url('add-to-cart', self.shirt), line_count=1, item_count=1)
+        self.assertInvalidated('get', cart_url('add-to-cart', self.shirt), item_count=2, total=20.0)
+        self.assertInvalidated('get', cart_url('add-to-cart', self.hat), line_count=2, item_count=3)
+        self.assertInvalidated('get', cart_url('remove-item-from-cart', self.shirt), item_count=2, total=20.0)
+        self.assertInvalidated('get', cart_url('remove-from-cart', self.hat), line_count=1, item_count=1)
+        Coupon.objects.create(code='SAVE', amount=4.0)
+        self.assertInvalidated('post', reverse('core:add-coupon'), {'code': 'SAVE'}, total=6.0)
+
+        self.client.post(reverse('core:checkout'), CHECKOUT_DATA)
+        with StripeStub() as stub, override_settings(STRIPE_API_BASE=stub.url):
+            self.assertInvalidated('post', reverse('core:payment', kwargs={'payment_option': 'stripe'}),
+                                   {'stripeToken': 'tok_visa'}, line_count=0, total=0.0)
+        self.assertTrue(Order.objects.get().ordered)
+
+
+class CartApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='password')
+        self.item = make_item('shirt', price=10.0, price_discount=8.0)
+
+    def test_add_returns_line_and_cart_totals(self):
+        self.client.force_login(self.user)
+        url = reverse('core:api-cart-add', kwargs={'slug': self.item.slug})
+        self.client.post(url)
+        data = self.client.post(url).json()
+        self.assertEqual(data['status'], CartService.UPDATED)
+        self.assertEqual(data['line'], {
+            'slug': 'shirt', 'quantity': 2, 'total_price': 20.0,
+            'final_price': 16.0, 'amount_saved': 4.0,
+        })
+        self.assertEqual(data['cart']['line_count'], 1)
+        self.assertEqual(data['cart']['total'], 16.0)
+
+    def test_requires_post(self):
+        url = reverse('core:api-cart-add', kwargs={'slug': self.item.slug})
+        self.assertEqual(self.client.get(url).status_code, 405)
+        missing = reverse('core:api-cart-add', kwargs={'slug': 'missing'})
+        self.assertEqual(self.client.post(missing).status_code, 404)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shirt = make_item('shirt', price=10.0, price_discount=8.0)
+        self.hat = make_item('hat', price=5.0)
+
+    def add(self, item):
+        return self.client.post(reverse('core:api-cart-add', kwargs={'slug': item.slug})).json()
+
+    def test_cart_is_kept_in_the_cache(self):
+        self.add(self.shirt)
+        with self.assertNumQueries(0):
+            data = self.add(self.shirt)
+        self.assertEqual(data['line']['quantity'], 2)
+        self.assertEqual((data['cart']['line_count'], data['cart']['total']), (1, 16.0))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+        response = self.client.get(reverse('core:order-summary'))
+        self.assertContains(response, 'data-cart-line="shirt"')
+        self.assertContains(response, '$16.0')
+        self.assertContains(self.client.get(reverse('core:home')), 'data-cart-count> 1 </span>')
+
+        self.client.get(reverse('core:remove-from-cart', kwargs={'slug': 'shirt'}))
+        self.assertRedirects(self.client.get(reverse('core:order-summary')), reverse('core:home'))
+
+    def test_tampered_cookie_starts_a_new_cart(self):
+        self.add(self.shirt)
+        self.client.cookies[settings.GUEST_CART_COOKIE_NAME] = 'forged'
+        self.assertEqual(self.add(self.hat)['cart']['line_count'], 1)
+
+    def test_checkout_requires_login(self):
+        self.add(self.shirt)
+        response = self.client.get(reverse('core:checkout'))
+        self.assertRedirects(response, '%s?next=%s' % (reverse('account_login'), reverse('core:checkout')),
+                             fetch_redirect_response=False)
+
+    def test_login_merges_into_open_order(self):
+        user = User.objects.create_user('shopper', password='password')
+        CartService(user).add(self.shirt)
+        self.add(self.shirt)
+        self.add(self.hat)
+        self.client.post(reverse('account_login'), {'login': 'shopper', 'password': 'password'})
+        order = Order.objects.get(user=user, ordered=False)
+        self.assertEqual(
+            dict(order.items.values_list('item__slug', 'quantity')), {'shirt': 2, 'hat': 1})
+        self.assertEqual(order.total, 21.0)
+        self.assertEqual(self.client.get(reverse('core:home')).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.add(self.hat)['cart']['line_count'], 1)
+
+
+class StartupCheckTests(TestCase):
+    memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                             'LOCATION': '127.0.0.1:11211'}}
+
+    def test_production_requires_a_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(ENVIRONMENT='production'):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['core.E001'])
+        with override_settings(ENVIRONMENT='production', CACHES=self.memcached):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_production_process_refuses_to_start(self):
+        config = apps.get_app_config('core')
+        with override_settings(ENVIRONMENT='production'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'is not shared between processes'):
+                config.ready()
+        with override_settings(ENVIRONMENT='production', CACHES=self.memcached):
+            config.ready()
+
+
+class FinalizeOrderTests(TestCase):
+    def make_order(self, lines):
+        user = User.objects.create_user(f'shopper-{lines}', password='password')
+        # bulk_create() does not set primary keys on every backend, so the
+        # rows are read back.
+        Item.objects.bulk_create(
+            Item(title=f'Item {i}', price=float(i + 1), price_discount=0.5 if i % 2 else None,
+                 category='S', label='P', slug=f'item-{lines}-{i}', description='', image='')
+            for i in range(lines)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(item=item, user=user, quantity=2)
+            for item in Item.objects.filter(slug__startswith=f'item-{lines}-'))
+        order = Order.objects.create(user=user, ordered_date=timezone.now())
+        order.items.add(*OrderItem.objects.filter(user=user))
+        return order
+
+    def pay(self, order):
+        return Payment.objects.create(user=order.user, amount=int(round(order.total * 100)),
+                                      status=Payment.SUCCEEDED, order_version=order.version)
+
+    def finalize(self, lines):
+        order = self.make_order(lines)
+        payment = self.pay(order)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(finalize_order(order, payment))
+        return order, len(queries)
+
+    def test_query_count_does_not_depend_on_order_size(self):
+        _, single_line_queries = self.finalize(1)
+        order, many_line_queries = self.finalize(500)
+        self.assertEqual(single_line_queries, many_line_queries)
+        self.assertFalse(order.items.filter(ordered=False).exists())
+        order.refresh_from_db()
+        self.assertTrue(order.ordered)
+
+    def test_snapshots_line_prices(self):
+        order, _ = self.finalize(2)
+        Item.objects.update(price=99.0, price_discount=None)
+        cheap, discounted = order.items.select_related('item').order_by('unit_price')
+        self.assertEqual((cheap.unit_price, cheap.get_final_price()), (1.0, 2.0))
+        self.assertEqual((discounted.unit_price, discounted.get_final_price()), (2.0, 1.0))
+
+    def test_second_finalization_is_a_no_op(self):
+        order, _ = self.finalize(1)
+        self.assertFalse(finalize_order(order, order.payment))
+
+    def test_placing_clears_the_refund_request(self):
+        order = self.make_order(1)
+        Order.objects.filter(pk=order.pk).update(refund_requested=True)
+        self.assertTrue(finalize_order(order, self.pay(order)))
+        order.refresh_from_db()
+        self.assertFalse(order.refund_requested)
+
+    def test_changed_order_is_flagged_for_refund(self):
+        for lines, change in ((1, {'version': F('version') + 1}), (2, {'total': 12.5})):
+            order = self.make_order(lines)
+            payment = self.pay(order)
+            Order.objects.filter(pk=order.pk).update(**change)
+            with self.assertLogs('core.services', 'ERROR'):
+                self.assertFalse(finalize_order(order, payment))
+            order.refresh_from_db()
+            self.assertEqual((order.ordered, order.refund_requested, order.payment), (False, True, payment))
+            self.assertFalse(order.items.filter(ordered=True).exists())
+            self.assertTrue(Refund.objects.filter(order=order).exists())
+            self.assertEqual(CartService(order.user).add(make_item(f'hat-{order.pk}')).status,
+                             CartService.PAYMENT_PENDING)
+
+    def test_keeps_the_prices_lines_were_charged_at(self):
+        user = User.objects.create_user('shopper', password='password')
+        item = make_item('shirt', price=10.0)
+        CartService(user).add(item)
+        order = Order.objects.get()
+        payment = self.pay(order)
+        Item.objects.update(price=99.0)
+        self.assertTrue(finalize_order(order, payment))
+        self.assertEqual(OrderItem.objects.get().unit_price, 10.0)
+
+
+class RebuildOrderTotalsTests(TestCase):
+    def placed_order(self, username, unit_price, **fields):
+        user = User.objects.create_user(username, password='password')
+        order_item = OrderItem.objects.create(item=make_item(username), user=user, ordered=True,
+                                              unit_price=unit_price)
+        order = Order.objects.create(user=user, ordered=True, ordered_date=timezone.now(), **fields)
+        order.items.add(order_item)
+        return order
+
+    def test_rebuilds_open_orders_by_default(self):
+        user = User.objects.create_user('shopper', password='password')
+        CartService(user).add(make_item('shirt', price=10.0))
+        Order.objects.filter(user=user).update(total=99.0)
+        legacy = self.placed_order('legacy', None, subtotal=5.0, total=5.0)
+        coupon = Coupon.objects.create(code='SAVE', amount=7.0)
+        priced = self.placed_order('priced', 10.0, coupon=coupon, coupon_discount=3.0, total=1.0)
+
+        call_command('rebuild_order_totals', stdout=StringIO())
+        self.assertEqual(Order.objects.get(user=user).total, 10.0)
+        self.assertEqual(Order.objects.get(pk=priced.pk).total, 1.0)
+
+        out = StringIO()
+        call_command('rebuild_order_totals', all=True, stdout=out)
+        self.assertIn('Skipped 1 placed orders', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=legacy.pk).total, 5.0)
+        # Placed orders keep the coupon discount they were charged with.
+        self.assertEqual(Order.objects.get(pk=priced.pk).total, 7.0)
+
+    def test_verify_reports_without_writing(self):
+        user = User.objects.create_user('shopper', password='password')
+        CartService(user).add(make_item('shirt', price=10.0))
+        out = StringIO()
+        call_command('rebuild_order_totals', verify=True, stdout=out)
+        self.assertIn('All 1 orders have correct totals', out.getvalue())
+
+        order = Order.objects.get(user=user)
+        Order.objects.filter(pk=order.pk).update(total=99.0)
+        with self.assertRaisesMessage(CommandError, '1 of 1 orders have wrong totals: %d' % order.pk):
+            call_command('rebuild_order_totals', verify=True, stdout=StringIO())
+        self.assertEqual(Order.objects.get(pk=order.pk).total, 99.0)
+
+    def test_coupon_changes_update_stored_totals(self):
+        user = User.objects.create_user('shopper', password='password')
+        order = CartService(user).add(make_item('shirt', price=10.0, price_discount=8.0), 2).order
+        order.set_coupon(Coupon.objects.create(code='SAVE', amount=5.0))
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((order.subtotal, order.discount_total, order.coupon_discount, order.total),
+                         (20.0, 4.0, 5.0, 11.0))
+        order.set_coupon(Coupon.objects.create(code='HUGE', amount=50.0))
+        self.assertEqual(Order.objects.get(pk=order.pk).total, 0.0)
+        order.set_coupon(None)
+        order = Order.objects.get(pk=order.pk)
+        self.assertEqual((order.coupon_discount, order.total), (0.0, 16.0))
+        self.assertEqual(order.calculate_totals()['total'], order.total)
+
+
+class CouponTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup_is_served_from_the_table(self):
+        Coupon.objects.create(code='SAVE5', amount=5.0)
+        self.assertEqual(get_coupon('SAVE5').amount, 5.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_coupon(' SAVE5 ').code, 'SAVE5')
+            self.assertIsNone(get_coupon('NOPE'))
+
+    def test_saving_a_coupon_reloads_the_table(self):
+        coupon = Coupon.objects.create(code='SAVE5', amount=5.0)
+        get_coupon('SAVE5')
+        coupon.amount = 7.5
+        coupon.save()
+        self.assertEqual(get_coupon('SAVE5').amount, 7.5)
+        coupon.delete()
+        self.assertIsNone(get_coupon('SAVE5'))
+
+    def test_validity_window(self):
+        now = timezone.now()
+        Coupon.objects.create(code='LATER', amount=5.0, valid_from=now + datetime.timedelta(days=1))
+        Coupon.objects.create(code='GONE', amount=5.0, valid_until=now - datetime.timedelta(days=1))
+        Coupon.objects.create(code='NOW', amount=5.0, valid_from=now - datetime.timedelta(days=1),
+                              valid_until=now + datetime.timedelta(days=1))
+        self.assertIsNone(get_coupon('LATER'))
+        self.assertIsNone(get_coupon('GONE'))
+        self.assertIsNotNone(get_coupon('NOW'))
+
+    def test_redemption_limit(self):
+        coupon = Coupon.objects.create(code='ONCE', amount=5.0, max_redemptions=1)
+        self.assertIsNotNone(get_coupon('ONCE'))
+        self.assertTrue(redeem_coupon(coupon.pk))
+        self.assertIsNone(get_coupon('ONCE'))
+        self.assertFalse(redeem_coupon(coupon.pk))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 1)
+
+    def test_payments_cannot_over_redeem(self):
+        coupon = Coupon.objects.create(code='ONCE', amount=5.0, max_redemptions=1)
+        item = make_item('shirt', price=20.0)
+        orders = []
+        for username in ('first', 'second'):
+            user = User.objects.create_user(username, password='password')
+            CartService(user).add(item)
+            order = Order.objects.get(user=user)
+            order.set_coupon(coupon)
+            orders.append(order)
+        # On-commit hooks never run in a TestCase, so payments stay pending.
+        payment = create_payment(orders[0], orders[0].user, 'tok_chargeDeclined')
+        self.assertEqual((payment.amount, payment.coupon), (1500, coupon))
+        self.assertIsNone(create_payment(orders[1], orders[1].user, 'tok_visa'))
+        orders[1].refresh_from_db()
+        self.assertEqual((orders[1].coupon, orders[1].total), (None, 20.0))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 1)
+
+        # A declined charge gives the redemption back.
+        stub = StripeStub().start()
+        self.addCleanup(stub.stop)
+        with override_settings(STRIPE_API_BASE=stub.url):
+            self.assertEqual(process_payment(payment.pk).status, Payment.FAILED)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.redemption_count, 0)
+        self.assertIsNotNone(get_coupon('ONCE'))
+
+    def test_add_coupon_rejects_expired_code(self):
+        user = User.objects.create_user('shopper', password='password')
+        Order.objects.create(user=user, ordered_date=timezone.now())
+        Coupon.objects.create(code='GONE', amount=5.0, valid_until=timezone.now() - datetime.timedelta(days=1))
+        self.client.force_login(user)
+        response = self.client.post(reverse('core:add-coupon'), {'code': 'GONE'}, follow=True)
+        self.assertContains(response, 'Coupon code is not valid.')
+        self.assertIsNone(Order.objects.get(user=user).coupon)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.shirt = make_item('shirt')
+        self.hat = make_item('hat')
+        Item.objects.update(stock=5)
+
+    def cart(self, name, **quantities):
+        user = User.objects.create_user(name, password='password')
+        for slug, quantity in quantities.items():
+            result = CartService(user).add(Item.objects.get(slug=slug), quantity)
+        return result.order
+
+    def stock(self, slug):
+        item = Item.objects.get(slug=slug)
+        return item.stock, item.reserved
+
+    def test_reservations_hold_stock(self):
+        self.assertEqual(reserve_order(self.cart('first', shirt=3, hat=1)), [])
+        self.assertEqual(self.stock('shirt'), (5, 3))
+        # Reserving again replaces the order's reservations.
+        first = Order.objects.get(user__username='first')
+        self.assertEqual(reserve_order(first), [])
+        self.assertEqual(self.stock('shirt'), (5, 3))
+
+        second = self.cart('second', shirt=3, hat=1)
+        self.assertEqual(reserve_order(second), [Item.objects.get(slug='shirt')])
+        # Nothing is reserved when one line is short.
+        self.assertEqual(self.stock('hat'), (5, 1))
+        self.assertFalse(StockReservation.objects.filter(order=second).exists())
+
+    def test_reservations_are_extended_until_the_cart_changes(self):
+        order = self.cart('first', shirt=2, hat=1)
+        reserve_order(order)
+        StockReservation.objects.update(expires_at=timezone.now() + datetime.timedelta(seconds=1))
+        with self.assertNumQueries(2):
+            self.assertTrue(extend_reservations(order))
+        self.assertFalse(StockReservation.objects.filter(
+            expires_at__lt=timezone.now() + datetime.timedelta(seconds=settings.STOCK_RESERVATION_TTL - 60)).exists())
+
+        CartService(order.user).add(self.hat)
+        self.assertFalse(extend_reservations(order))
+        StockReservation.objects.update(expires_at=timezone.now())
+        CartService(order.user).decrement(self.hat)
+        self.assertFalse(extend_reservations(order))
+
+    def test_finalize_takes_stock(self):
+        order = self.cart('first', shirt=2)
+        reserve_order(order)
+        payment = Payment.objects.create(user=order.user, amount=int(round(order.total * 100)),
+                                         status=Payment.SUCCEEDED)
+        self.assertTrue(finalize_order(order, payment))
+        self.assertEqual(self.stock('shirt'), (3, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        reserve_order(self.cart('first', shirt=2))
+        reserve_order(self.cart('second', hat=1))
+        StockReservation.objects.filter(item__slug='shirt').update(expires_at=timezone.now())
+        out = StringIO()
+        call_command('release_reservations', batch_size=1, stdout=out)
+        self.assertIn('Released 1 expired reservations', out.getvalue())
+        self.assertEqual((self.stock('shirt'), self.stock('hat')), ((5, 0), (5, 1)))
+        self.assertEqual(release_expired(), 0)
+
+    def test_saving_an_item_keeps_reservations(self):
+        item = Item.objects.get(slug='shirt')
+        reserve_order(self.cart('first', shirt=2))
+        item.stock = 10
+        item.save()
+        self.assertEqual(self.stock('shirt'), (10, 2))
+
+    def test_checkout_reports_missing_stock(self):
+        order = self.cart('first', shirt=6)
+        self.client.force_login(order.user)
+        response = self.client.post(reverse('core:checkout'), CHECKOUT_DATA, follow=True)
+        self.assertRedirects(response, reverse('core:order-summary'))
+        self.assertContains(response, 'Sorry, only 5 of Shirt are left.')
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    buyers = 200
+
+    @concurrent_transactions
+    def test_concurrent_buyers_of_one_item(self):
+        item = make_item('shirt')
+        Item.objects.filter(pk=item.pk).update(stock=50)
+        orders = []
+        for n in range(self.buyers):
+            # No password: hashing 200 of them would take most of the test.
+            user = User.objects.create(username='buyer%d' % n)
+            orders.append(CartService(user).add(item).order)
+        results = []
+
+        def buy(order):
+            try:
+                results.append(reserve_order(order) == [])
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(order,)) for order in orders]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results.count(True), 50)
+        self.assertEqual(Item.objects.get(pk=item.pk).reserved, 50)
+        self.assertEqual(StockReservation.objects.count(), 50)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.shirt = make_item('blue-shirt')
+        self.shirt.description = 'A blue cotton shirt'
+        self.shirt.save()
+        self.jacket = make_item('rain-jacket')
+        self.jacket.description = 'Keeps the rain out, goes well with a shirt'
+        self.jacket.category = 'OW'
+        self.jacket.save()
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(search_items('shirt'), [self.shirt, self.jacket])
+        self.assertEqual(search_items('outwear'), [self.jacket])
+        self.assertEqual(search_items('blu'), [self.shirt])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.shirt.title = 'Green Polo'
+        self.shirt.save()
+        self.assertEqual(search_items('polo'), [self.shirt])
+        self.jacket.delete()
+        self.assertEqual(search_items('rain'), [])
+
+    def test_view_pages_results(self):
+        response = self.client.get(reverse('core:search'), {'q': 'shirt'})
+        self.assertEqual(list(response.context['object_list']), [self.shirt, self.jacket])
+        self.assertFalse(response.context['has_next'])
+
+
+class FacetTests(TestCase):
+    def counts(self, facet):
+        return {value: count for value, _, count in get_facet_counts()[facet]}
+
+    def test_counts_follow_item_changes(self):
+        shirt = make_item('shirt')
+        make_item('polo')
+        self.assertEqual(self.counts('category'), {'S': 2, 'SW': 0, 'OW': 0})
+        shirt.category = 'OW'
+        shirt.save()
+        shirt.save()
+        self.assertEqual(self.counts('category'), {'S': 1, 'SW': 0, 'OW': 1})
+        shirt.delete()
+        self.assertEqual(self.counts('category'), {'S': 1, 'SW': 0, 'OW': 0})
+        self.assertEqual(self.counts('label'), {'P': 1, 'S': 0, 'D': 0})
+
+    def test_home_filters_by_facet(self):
+        make_item('shirt')
+        jacket = make_item('jacket')
+        jacket.category = 'OW'
+        jacket.save()
+        response = self.client.get(reverse('core:home'), {'category': 'OW', 'label': 'bogus'})
+        self.assertEqual(list(response.context['object_list']), [jacket])
+        self.assertEqual(response.context['filter_query'], 'category=OW')
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        # Three items share a price, so pages split ties by id.
+        self.items = [make_item('item-%d' % n, price=price) for n, price in enumerate([30, 20, 20, 20, 10])]
+        self.expected = [self.items[n] for n in (0, 3, 2, 1, 4)]
+
+    def test_after_and_before_walk_the_catalog(self):
+        pages = []
+        page = paginate_keyset(Item.objects.all(), 2)
+        while True:
+            pages.append(list(page))
+            if not page.has_next():
+                break
+            page = paginate_keyset(Item.objects.all(), 2, after=page.next_cursor)
+        self.assertEqual(pages, [self.expected[0:2], self.expected[2:4], self.expected[4:]])
+        self.assertTrue(page.has_previous())
+
+        page = paginate_keyset(Item.objects.all(), 2, before=page.previous_cursor)
+        self.assertEqual(list(page), self.expected[2:4])
+        page = paginate_keyset(Item.objects.all(), 2, before=page.previous_cursor)
+        self.assertEqual(list(page), self.expected[0:2])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_home_links_pages_without_counting(self):
+        Item.objects.bulk_create(
+            Item(title='Extra %d' % n, price=5.0, category='S', label='P', slug='extra-%d' % n, description='')
+            for n in range(10))
+        home = reverse('core:home')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(home, {'category': 'S'})
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        page = response.context['page_obj']
+        self.assertEqual(list(page)[:5], self.expected)
+        self.assertContains(response, 'href="?category=S&after=%s"' % page.next_cursor)
+        self.assertNotContains(response, 'before=')
+
+        response = self.client.get(home, {'category': 'S', 'after': page.next_cursor})
+        self.assertEqual(len(response.context['object_list']), 5)
+        self.assertContains(response, 'before=%s' % response.context['page_obj'].previous_cursor)
+        self.assertNotContains(response, 'after=')
+
+    def test_invalid_cursor_is_not_found(self):
+        home = reverse('core:home')
+        for cursor in ('bogus', 'Zm9vOmJhcg==', '%%%'):
+            self.assertEqual(self.client.get(home, {'after': cursor}).status_code, 404, cursor)
+            self.assertEqual(self.client.get(home, {'before': cursor}).status_code, 404, cursor)
+
+    def test_cursors_combine_with_filters(self):
+        Item.objects.filter(pk__in=[self.items[1].pk, self.items[4].pk]).update(category='OW')
+        home = reverse('core:home')
+        cursor = encode_cursor(self.items[3])
+        response = self.client.get(home, {'category': 'S', 'after': cursor})
+        self.assertEqual(list(response.context['object_list']), [self.items[2]])
+        response = self.client.get(home, {'category': 'OW', 'after': cursor})
+        self.assertEqual(list(response.context['object_list']), [self.items[1], self.items[4]])
+        response = self.client.get(home, {'category': 'OW', 'before': encode_cursor(self.items[4])})
+        self.assertEqual(list(response.context['object_list']), [self.items[1]])
+
+
+class CatalogCacheTests(TestCase):
+    def test_item_is_cached_until_saved(self):
+        item = make_item('shirt')
+        get_item('shirt')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_item('shirt').title, 'Shirt')
+        item.title = 'Blue shirt'
+        item.save()
+        self.assertEqual(get_item('shirt').title, 'Blue shirt')
+
+    def test_deleted_item_is_not_served(self):
+        item = make_item('shirt')
+        get_item('shirt')
+        item.delete()
+        with self.assertRaises(Item.DoesNotExist):
+            get_item('shirt')
+
+    def test_detail_view_renders_new_price(self):
+        item = make_item('shirt', price=10.0)
+        url = reverse('core:product', kwargs={'slug': 'shirt'})
+        self.assertContains(self.client.get(url), '$10.0')
+        item.price = 12.5
+        item.save()
+        self.assertContains(self.client.get(url), '$12.5')
+        self.assertEqual(self.client.get(reverse('core:product', kwargs={'slug': 'missing'})).status_code, 404)
+
+
+class FragmentCacheTests(TestCase):
+    def test_product_cards_are_cached_by_item_version(self):
+        item = make_item('shirt')
+        self.assertContains(self.client.get(reverse('core:home')), 'Shirt')
+        # Writes that bypass the signals are not seen...
+        Item.objects.filter(pk=item.pk).update(title='Blue shirt')
+        self.assertNotContains(self.client.get(reverse('core:search'), {'q': 'shirt'}), 'Blue shirt')
+        # ...until the item's version is bumped.
+        item.refresh_from_db()
+        item.save()
+        self.assertContains(self.client.get(reverse('core:home')), 'Blue shirt')
+        self.assertContains(self.client.get(reverse('core:search'), {'q': 'shirt'}), 'Blue shirt')
+
+    def test_cart_snippet_is_cached_by_order_version(self):
+        user = User.objects.create_user('shopper', password='password')
+        shirt = make_item('shirt', price=10.0)
+        CartService(user).add(shirt)
+        self.client.force_login(user)
+        url = reverse('core:checkout')
+        with CaptureQueriesContext(connection) as cold:
+            self.assertContains(self.client.get(url), '1 x Shirt')
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url)
+        reads_lines = [any('core_orderitem' in query['sql'] for query in queries.captured_queries)
+                       for queries in (cold, warm)]
+        self.assertEqual(reads_lines, [True, False])
+
+        CartService(user).add(shirt)
+        self.assertContains(self.client.get(url), '2 x Shirt')
+        shirt.title = 'Blue shirt'
+        shirt.save()
+        self.assertContains(self.client.get(url), '2 x Blue shirt')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = make_item('shirt')
+        self.home = reverse('core:home')
+
+    def test_pages_are_shared_between_visitors(self):
+        self.assertContains(self.client.get(self.home), 'Shirt')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.home)
+        self.assertContains(response, 'Signup')
+        self.assertContains(response, 'name="csrf-token"')
+        self.assertNotContains(response, 'page-cache-hole')
+
+        user = User.objects.create_user('shopper', password='password')
+        CartService(user).add(self.item)
+        self.client.force_login(user)
+        response = self.client.get(self.home)
+        self.assertContains(response, 'Logout')
+        self.assertContains(response, 'data-cart-count> 1 </span>')
+
+    def test_messages_are_filled_in(self):
+        self.client.get(self.home)
+        self.client.get(reverse('core:add-to-cart', kwargs={'slug': 'shirt'}))
+        response = self.client.get(self.home)
+        self.assertContains(response, 'This item was added to your cart.')
+        self.assertContains(response, 'data-cart-count> 1 </span>')
+        self.assertNotContains(self.client.get(self.home), 'This item was added to your cart.')
+
+    def test_only_catalog_query_strings_are_cached(self):
+        self.client.get(self.home, {'category': 'S'})
+        with self.assertNumQueries(0):
+            self.client.get(self.home, {'category': 'S'})
+        for params in ({'category': 'S', 'utm_source': 'mail'}, {'utm_source': 'feed'}):
+            self.client.get(self.home, params)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertContains(self.client.get(self.home, params), 'Shirt')
+            self.assertTrue(queries.captured_queries, params)
+
+    def test_item_changes_invalidate_pages(self):
+        product = reverse('core:product', kwargs={'slug': 'shirt'})
+        self.client.get(self.home)
+        self.client.get(product)
+        Item.objects.filter(pk=self.item.pk).update(title='Blue shirt', description='Now in blue')
+        self.assertNotContains(self.client.get(self.home), 'Blue shirt')
+        self.assertNotContains(self.client.get(product), 'Now in blue')
+        self.item.refresh_from_db()
+        self.item.save()
+        self.assertContains(self.client.get(self.home), 'Blue shirt')
+        self.assertContains(self.client.get(product), 'Now in blue')
+
+
+class ConditionalGetTests(TestCase):
+    def revalidate(self, url):
+        # The first visit sets the CSRF cookie the ETag depends on.
+        self.client.get(url)
+        response = self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_catalog_changes_invalidate_etag(self):
+        item = make_item('shirt')
+        home = reverse('core:home')
+        product = reverse('core:product', kwargs={'slug': 'shirt'})
+        self.assertEqual(self.revalidate(home), 304)
+        self.assertEqual(self.revalidate(product), 304)
+        etags = self.client.get(home)['ETag'], self.client.get(product)['ETag']
+        item.price = 12.0
+        item.save()
+        self.assertEqual(self.client.get(home, HTTP_IF_NONE_MATCH=etags[0]).status_code, 200)
+        self.assertEqual(self.client.get(product, HTTP_IF_NONE_MATCH=etags[1]).status_code, 200)
+
+    def test_not_modified_does_not_set_csrf_cookie(self):
+        make_item('shirt')
+        home = reverse('core:home')
+        self.assertNotIn('ETag', self.client.get(home))
+        etag = self.client.get(home)['ETag']
+        response = self.client.get(home, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+    def test_cart_changes_invalidate_etag(self):
+        item = make_item('shirt')
+        user = get_user_model().objects.create_user('buyer', password='secret')
+        self.client.force_login(user)
+        home = reverse('core:home')
+        self.client.get(home)
+        etag = self.client.get(home)['ETag']
+        self.assertEqual(self.client.get(home, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        CartService(user).add(item)
+        self.assertEqual(self.client.get(home, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotIn('Last-Modified', self.client.get(home))
+
+
+@override_settings(REQUEST_STATS_ENABLED=True)
+class RequestStatsTests(TestCase):
+    def setUp(self):
+        reset_request_stats()
+        self.addCleanup(reset_request_stats)
+
+    def test_records_queries_per_view(self):
+        make_item('shirt')
+        for _ in range(3):
+            self.client.get(reverse('core:product', kwargs={'slug': 'shirt'}))
+        self.client.get(reverse('core:home'))
+        stats = {row['view']: row for row in get_request_stats()}
+        self.assertEqual(stats['core:product']['requests'], 3)
+        self.assertEqual(stats['core:home']['requests'], 1)
+        self.assertGreater(stats['core:home']['queries_p50'], 0)
+        self.assertGreater(stats['core:home']['template_p50'], 0)
+
+    def test_endpoint_is_staff_only(self):
+        url = reverse('core:api-request-stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = get_user_model().objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('core:home'))
+        response = self.client.get(url, {'sort': 'queries_p95'})
+        self.assertEqual(response.json()['views'][0]['view'], 'core:home')
+        self.assertEqual(self.client.get(url, {'sort': 'bogus'}).status_code, 400)
+
+
+class ImportCatalogTests(TestCase):
+    def write_rows(self, rows):
+        f = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            for row in rows:
+                f.write(row if isinstance(row, str) else json.dumps(row))
+                f.write('\n')
+        return f.name
+
+    def row(self, slug, **fields):
+        return dict({'slug': slug, 'title': slug.title(), 'price': 10, 'category': 'S', 'label': 'P'}, **fields)
+
+    def test_upserts_by_slug(self):
+        shirt = make_item('shirt')
+        get_item('shirt')
+        path = self.write_rows([
+            self.row('shirt', price=12.5, category='OW'),
+            self.row('jacket'),
+            self.row('jacket', title='Rain jacket'),
+            self.row('polo', category='bogus'),
+            '{not json',
+        ])
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', path, batch_size=2, skip_images=True, stdout=stdout, stderr=stderr)
+        self.assertIn('1 created, 2 updated, 0 unchanged, 2 skipped', stdout.getvalue())
+        self.assertIn('Line 5:', stderr.getvalue())
+
+        shirt.refresh_from_db()
+        self.assertEqual((shirt.price, shirt.category), (12.5, 'OW'))
+        self.assertEqual(get_item('shirt').price, 12.5)
+        self.assertEqual(Item.objects.get(slug='jacket').title, 'Rain jacket')
+        self.assertEqual([item.slug for item in search_items('rain')], ['jacket'])
+        counts = {value: count for value, _, count in get_facet_counts()['category']}
+        self.assertEqual(counts, {'S': 1, 'SW': 0, 'OW': 1})
+
+    def test_unchanged_rows_are_not_written(self):
+        path = self.write_rows([self.row('shirt'), self.row('polo')])
+        call_command('import_catalog', path, skip_images=True, stdout=StringIO())
+        stdout = StringIO()
+        call_command('import_catalog', path, skip_images=True, stdout=stdout)
+        self.assertIn('0 created, 0 updated, 2 unchanged', stdout.getvalue())
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_DERIVATIVE_WIDTHS=(320, 640))
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_item_with_image(self, slug, width=500):
+        buffer = BytesIO()
+        Image.new('RGB', (width, width // 2), 'red').save(buffer, 'PNG')
+        item = make_item(slug)
+        item.image.save(slug + '.png', ContentFile(buffer.getvalue()), save=False)
+        Item.objects.filter(pk=item.pk).update(image=item.image.name)
+        return item
+
+    def render(self, item):
+        return Template('{% load image_tags %}{% responsive_image item sizes="50vw" %}').render(
+            Context({'item': item}))
+
+    def test_derivatives_are_generated_without_upscaling(self):
+        item = self.make_item_with_image('shirt')
+        self.assertIn('<img src="%s"' % item.image.url, self.render(item))
+
+        digest = process_item_image(item.pk)
+        for width, expected in [(320, 320), (640, 500)]:
+            for extension in ('jpg', 'webp'):
+                with default_storage.open(derivative_name(digest, width, extension)) as f:
+                    self.assertEqual(Image.open(f).width, expected)
+
+        item.refresh_from_db()
+        self.assertEqual(item.image_hash, digest)
+        html = self.render(item)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(default_storage.url(derivative_name(digest, 640, 'webp')) + ' 640w', html)
+        self.assertIn('sizes="50vw"', html)
+
+    def test_new_derivatives_change_last_modified(self):
+        item = self.make_item_with_image('shirt')
+        Item.objects.filter(pk=item.pk).update(modified=timezone.now() - datetime.timedelta(days=1))
+        product = reverse('core:product', kwargs={'slug': 'shirt'})
+        last_modified = self.client.get(product)['Last-Modified']
+        self.assertEqual(self.client.get(product, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        process_item_image(item.pk)
+        self.assertEqual(self.client.get(product, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_command_retires_the_cached_items(self):
+        item = self.make_item_with_image('shirt')
+        cache.set(ITEM_VERSION_KEY.format('shirt'), 1, None)
+        catalog_version = cache.get(CATALOG_VERSION_KEY)
+
+        call_command('build_image_derivatives', workers=1, stdout=StringIO())
+        item.refresh_from_db()
+        self.assertNotEqual(item.image_hash, '')
+        self.assertTrue(default_storage.exists(derivative_name(item.image_hash, 320, 'jpg')))
+        self.assertNotEqual(cache.get(ITEM_VERSION_KEY.format('shirt')), 1)
+        self.assertNotEqual(cache.get(CATALOG_VERSION_KEY), catalog_version)
+
+
+@override_settings(STATICFILES_STORAGE='core.staticfiles.CompressedManifestStaticFilesStorage',
+                   STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'])
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        source, root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, root)
+        for name, content in [('css/site.css', 'body { color: red; }\n' * 50),
+                              ('scss/site.scss', '$red: red;'),
+                              ('js/tiny.js', ';')]:
+            os.makedirs(os.path.join(source, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(content)
+        settings_override = override_settings(STATICFILES_DIRS=[source], STATIC_ROOT=root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('build_static', no_sass=True, stdout=StringIO())
+        self.root = root
+
+    def test_assets_are_fingerprinted_and_precompressed(self):
+        manifest = staticfiles_storage.hashed_files
+        css = manifest['css/site.css']
+        self.assertNotEqual(css, 'css/site.css')
+        with open(os.path.join(self.root, css + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), ('body { color: red; }\n' * 50).encode())
+        # Not worth compressing, and sources are not published.
+        self.assertFalse(os.path.exists(os.path.join(self.root, manifest['js/tiny.js'] + '.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'scss')))
+
+    def test_serves_precompressed_variant_with_far_future_headers(self):
+        css = staticfiles_storage.hashed_files['css/site.css']
+        response = self.client.get('/static/' + css, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=%d' % settings.STATIC_MAX_AGE, response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode().count('red'), 50)
+
+        response = self.client.get('/static/' + css)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        with open(os.path.join(self.root, css + '.br'), 'wb') as f:
+            f.write(b'brotli')
+        for accept_encoding, encoding in [('gzip, br', 'br'), ('br;q=0, gzip', 'gzip'),
+                                          ('br;q=0.5, gzip;q=0.8', 'gzip'), ('*', 'br'),
+                                          ('gzip;q=0, *;q=0.1', 'br'), ('identity, *;q=0', None)]:
+            response = self.client.get('/static/' + css, HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response.get('Content-Encoding'), encoding, accept_encoding)
+        response = self.client.get('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret', is_staff=True)
+        shirt = make_item('shirt', price=20.0)
+        for n, day in enumerate((datetime.datetime(2019, 1, 1, 12), datetime.datetime(2019, 2, 1, 12))):
+            order = Order.objects.create(user=self.user, ordered=True, ref_code='ref-%d' % n,
+                                         ordered_date=timezone.make_aware(day), total=20.0)
+            order.items.add(OrderItem.objects.create(user=self.user, item=shirt, ordered=True, unit_price=20.0))
+
+    def test_command_exports_date_range(self):
+        stdout = StringIO()
+        call_command('export_orders', 'order-items', start=datetime.date(2019, 2, 1), stdout=stdout)
+        rows = list(csv.DictReader(StringIO(stdout.getvalue())))
+        self.assertEqual([(row['ref_code'], row['item'], row['unit_price']) for row in rows],
+                         [('ref-1', 'shirt', '20.0')])
+
+    def test_staff_view_streams_jsonl(self):
+        url = reverse('core:export', kwargs={'kind': 'orders'})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+        response = self.client.get(url, {'format': 'jsonl', 'end': '2019-01-31'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['ref_code'], row['username'], row['total']) for row in rows],
+                         [('ref-0', 'buyer', 20.0)])
+        self.assertEqual(self.client.get(url, {'start': '2019-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('core:export', kwargs={'kind': 'bogus'})).status_code, 404)
+
+
+class SalesReportTests(TestCase):
+    def test_report_aggregates_in_database(self):
+        staff = User.objects.create_superuser('staff', 'staff@example.com', 'secret')
+        shirt = make_item('shirt', price=20.0, price_discount=15.0)
+        jacket = make_item('jacket', price=100.0)
+        jacket.category = 'OW'
+        jacket.save()
+        coupon = Coupon.objects.create(code='SAVE5', amount=5.0)
+        day = timezone.make_aware(datetime.datetime(2019, 3, 1, 12))
+        for n, (item, quantity, order_coupon) in enumerate([(shirt, 2, coupon), (jacket, 1, None), (shirt, 1, None)]):
+            order = Order.objects.create(user=staff, ordered=True, ref_code=str(n), coupon=order_coupon,
+                                         ordered_date=day + datetime.timedelta(days=n // 2), total=10.0)
+            order.items.add(OrderItem.objects.create(user=staff, item=item, quantity=quantity, ordered=True))
+
+        self.client.force_login(staff)
+        url = reverse('admin:core_order_sales_report')
+        with self.assertNumQueries(6):
+            response = self.client.get(url, {'start': '2019-03-01', 'end': '2019-03-02'})
+        report = response.context['report']
+        self.assertEqual(report['totals']['orders'], 3)
+        self.assertEqual([(row['day'], row['orders']) for row in report['days']],
+                         [(datetime.date(2019, 3, 1), 2), (datetime.date(2019, 3, 2), 1)])
+        self.assertEqual([(row['name'], row['items_sold'], row['revenue']) for row in report['categories']],
+                         [('Outwear', 1, 100.0), ('Shirt', 3, 45.0)])
+        self.assertEqual([(row['coupon__code'], row['orders']) for row in report['coupons']], [('SAVE5', 1)])
+
+
+    def test_zero_discount_prices_are_not_discounts(self):
+        user = User.objects.create_user('shopper', password='password')
+        shirt = make_item('shirt', price=20.0, price_discount=0.0)
+        hat = make_item('hat', price=10.0, price_discount=0.0)
+        day = timezone.make_aware(datetime.datetime(2019, 3, 1, 12))
+        order = Order.objects.create(user=user, ordered=True, ordered_date=day, total=50.0)
+        lines = [OrderItem.objects.create(user=user, item=shirt, quantity=2, ordered=True,
+                                          unit_price=20.0, unit_price_discount=0.0),
+                 OrderItem.objects.create(user=user, item=hat, quantity=1, ordered=True)]
+        order.items.add(*lines)
+        [category] = sales_report(day.date(), day.date())['categories']
+        self.assertEqual(category['revenue'], sum(line.get_final_price() for line in lines))
+        self.assertEqual(category['revenue'], 50.0)
+
+class CartServiceConcurrencyTests(TransactionTestCase):
+    threads = 8
+    adds_per_thread = 10
+
+    @concurrent_transactions
+    def test_concurrent_adds_to_one_cart(self):
+        user = User.objects.create_user('shopper', password='password')
+        item = make_item('shirt', price=10.0)
+        errors = []
+
+        def hammer():
+            try:
+                for _ in range(self.adds_per_thread):
+                    CartService(user).add(item)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=hammer) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        expected = self.threads * self.adds_per_thread
+        order = Order.objects.get(user=user, ordered=False)
+        self.assertEqual(OrderItem.objects.get(user=user, ordered=False).quantity, expected)
+        self.assertEqual(order.subtotal, expected * item.price)
+        self.assertEqual(order.calculate_totals()['total'], order.total)
+
+
+@override_settings(PAYMENT_WORKERS=0, PAYMENT_RETRY_BACKOFF=0)
+class PaymentQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='password')
+        CartService(self.user).add(make_item('shirt', price=12.5))
+        self.client.force_login(self.user)
+        self.stub = StripeStub().start()
+        self.addCleanup(self.stub.stop)
+
+    def pay(self, token='tok_visa'):
+        url = reverse('core:payment', kwargs={'payment_option': 'stripe'})
+        with override_settings(STRIPE_API_BASE=self.stub.url):
+            return self.client.post(url, {'stripeToken': token})
+
+    def test_successful_charge_finalizes_order(self):
+        response = self.pay()
+        payment = Payment.objects.get()
+        self.assertRedirects(response, reverse('core:payment-status', kwargs={'key': payment.idempotency_key}),
+                             fetch_redirect_response=False)
+        self.assertContains(self.client.get(response.url), 'data-status-url')
+        self.assertEqual(payment.status, Payment.SUCCEEDED)
+        self.assertEqual(payment.amount, 1250)
+        self.assertTrue(Order.objects.get().ordered)
+        self.assertTrue(OrderItem.objects.get().ordered)
+        (path, params, key), = self.stub.requests
+        self.assertEqual((path, params['amount'], key), ('/v1/charges', '1250', str(payment.idempotency_key)))
+
+        status_url = reverse('core:api-payment-status', kwargs={'key': payment.idempotency_key})
+        self.assertEqual(self.client.get(status_url).json()['redirect'], reverse('core:home'))
+
+    def test_declined_charge_leaves_order_open(self):
+        self.pay(token='tok_chargeDeclined')
+        payment = Payment.objects.get()
+        self.assertEqual((payment.status, payment.error), (Payment.FAILED, 'Your card was declined.'))
+        order = Order.objects.get()
+        self.assertFalse(order.ordered)
+        self.assertIsNone(order.payment)
+
+    def test_rate_limited_charge_is_retried(self):
+        self.stub.rate_limit_failures = 2
+        self.pay()
+        payment = Payment.objects.get()
+        self.assertEqual((payment.status, payment.attempts), (Payment.SUCCEEDED, 3))
+        self.assertEqual({key for _, _, key in self.stub.requests}, {str(payment.idempotency_key)})
+
+    def test_charge_for_a_changed_order_is_refunded(self):
+        order = Order.objects.get()
+        with self.assertLogs('core.services', 'ERROR'), override_settings(STRIPE_API_BASE=self.stub.url), \
+                transaction.atomic():
+            # Charged once the transaction commits, after the change.
+            create_payment(order, self.user, 'tok_visa')
+            Order.objects.filter(pk=order.pk).update(version=F('version') + 1)
+        order.refresh_from_db()
+        unused = order.payment
+        self.assertEqual((order.ordered, order.refund_requested), (False, True))
+        status_url = reverse('core:api-payment-status', kwargs={'key': unused.idempotency_key})
+        self.assertEqual(self.client.get(status_url).json()['redirect'], reverse('core:order-summary'))
+
+        # Paying again leads to the unused charge rather than a second one.
+        response = self.pay()
+        self.assertRedirects(response, reverse('core:payment-status', kwargs={'key': unused.idempotency_key}),
+                             fetch_redirect_response=False)
+        self.assertEqual(Payment.objects.count(), 1)
+
+        with override_settings(STRIPE_API_BASE=self.stub.url, REFUND_WORKERS=1):
+            call_command('issue_refunds', stdout=StringIO())
+        self.assertEqual([refund['charge'] for refund in self.stub.refunds.values()], [unused.stripe_charge_id])
+        order.refresh_from_db()
+        self.assertEqual((order.payment, order.refund_requested), (None, False))
+
+        self.pay()
+        order.refresh_from_db()
+        self.assertEqual((order.ordered, order.refund_requested), (True, False))
+        self.assertNotEqual(order.payment, unused)
+        with override_settings(STRIPE_API_BASE=self.stub.url, REFUND_WORKERS=1):
+            call_command('issue_refunds', stdout=StringIO())
+        self.assertEqual(len(self.stub.refunds), 1)
+        self.assertEqual(CartService(self.user).add(make_item('hat')).status, CartService.ADDED)
+
+    def test_processing_twice_charges_once(self):
+        self.pay()
+        with override_settings(STRIPE_API_BASE=self.stub.url):
+            process_payment(Payment.objects.get().pk)
+        self.assertEqual(len(self.stub.requests), 1)
+
+
+# One worker, except in the tests of concurrent refunds (see concurrent_transactions).
+@override_settings(PAYMENT_RETRY_BACKOFF=0, REFUND_WORKERS=1, REFUND_RATE_LIMIT=0)
+class RefundTests(TransactionTestCase):
+    def setUp(self):
+        self.stub = StripeStub().start()
+        self.addCleanup(self.stub.stop)
+        self.settings = override_settings(STRIPE_API_BASE=self.stub.url)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def make_order(self, n, charged=True):
+        user = User.objects.create_user(f'shopper-{n}', password='password')
+        payment = Payment.objects.create(
+            user=user, amount=1000, status=Payment.SUCCEEDED if charged else Payment.FAILED,
+            stripe_charge_id=f'ch_{n}' if charged else '')
+        order = Order.objects.create(user=user, ref_code=f'ref-{n}', ordered=True, ordered_date=timezone.now(),
+                                     payment=payment, refund_requested=True)
+        Refund.objects.create(order=order, reason='Too small', email='shopper@example.com')
+        return order
+
+    def refund_all(self, workers):
+        orders = [self.make_order(n) for n in range(20)]
+        results = issue_refunds([order.pk for order in orders], workers=workers)
+        self.assertEqual({result.status for result in results}, {REFUNDED})
+        self.assertEqual([result.ref_code for result in results], [order.ref_code for order in orders])
+        self.assertEqual(len(self.stub.refunds), 20)
+        self.assertFalse(Order.objects.filter(refund_granted=False).exists())
+        self.assertFalse(Refund.objects.filter(accepted=False).exists())
+        self.assertFalse(Payment.objects.filter(stripe_refund_id='').exists())
+
+        results = issue_refunds([order.pk for order in orders], workers=workers)
+        self.assertEqual({result.status for result in results}, {SKIPPED})
+        self.assertEqual(len(self.stub.requests), 20)
+
+    def test_refunds_each_order_once(self):
+        self.refund_all(workers=1)
+
+    @concurrent_transactions
+    def test_concurrent_refunds(self):
+        self.refund_all(workers=8)
+
+    def test_reports_failures_per_order(self):
+        refunded, uncharged = self.make_order(1), self.make_order(2, charged=False)
+        self.stub.rate_limit_failures = 100
+        with override_settings(PAYMENT_MAX_RETRIES=1):
+            failed, skipped = issue_refunds([refunded.pk, uncharged.pk])
+        self.assertEqual((failed.ref_code, failed.status, failed.message), ('ref-1', FAILED, 'Rate limit error.'))
+        self.assertEqual((skipped.ref_code, skipped.status), ('ref-2', SKIPPED))
+        self.assertFalse(Order.objects.filter(refund_granted=True).exists())
+
+    def test_refunds_lost_by_the_pool_are_left_to_the_command(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        order, uncharged = self.make_order(1), self.make_order(2, charged=False)
+        Order.objects.update(refund_requested=False)
+        self.client.force_login(admin_user)
+        # The process restarts before the pool gets to the orders.
+        with mock.patch('core.admin.queue_refunds') as queue:
+            self.client.post(reverse('admin:core_order_changelist'), {
+                'action': 'accept_refund', '_selected_action': [order.pk, uncharged.pk]})
+        self.assertEqual(sorted(queue.call_args[0][0]), [order.pk, uncharged.pk])
+        self.assertEqual(list(Order.objects.filter(refund_requested=True)), [order])
+
+        call_command('issue_refunds', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual((order.refund_requested, order.refund_granted), (False, True))
+        self.assertEqual(len(self.stub.refunds), 1)
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_admin_action_and_command(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        first, second = self.make_order(1), self.make_order(2)
+        self.client.force_login(admin_user)
+        futures = []
+        with mock.patch('core.admin.queue_refunds', lambda order_ids: futures.extend(queue_refunds(order_ids))):
+            response = self.client.post(reverse('admin:core_order_changelist'), {
+                'action': 'accept_refund', '_selected_action': [first.pk]}, follow=True)
+        self.assertContains(response, 'Queued 1 orders for refund.')
+        self.assertEqual([future.result().status for future in futures], [REFUNDED])
+
+        out = StringIO()
+        call_command('issue_refunds', stdout=out)
+        self.assertIn('Processed 1 orders', out.getvalue())
+        self.assertIn('1 refunded', out.getvalue())
+        self.assertEqual(len(self.stub.refunds), 2)
+        second.refresh_from_db()
+        self.assertTrue(second.refund_granted)
+
+
+@override_settings(PAYMENT_WORKERS=0, PAYMENT_RETRY_BACKOFF=0)
+class BenchmarkTests(TransactionTestCase):
+    def test_seeded_shop_checks_out_without_errors(self):
+        call_command('seed_data', items=30, users=2, orders=10, coupons=2, random_seed=1, stdout=StringIO())
+        self.assertEqual(Order.objects.filter(ordered=True).count(), 10)
+        order = Order.objects.filter(ordered=True).first()
+        self.assertAlmostEqual(order.total, order.calculate_totals()['total'])
+        for order in Order.objects.filter(ordered=True).select_related('payment'):
+            self.assertEqual(order.payment.amount, to_cents(order.total))
+
+        users = list(get_user_model().objects.filter(username__startswith='seed-user-')[:1])
+        with StripeStub() as stub, override_settings(STRIPE_API_BASE=stub.url):
+            results = run_benchmark(users, iterations=1, warmup=0)
+        self.assertEqual(results['errors'], 0, results['error_samples'])
+        self.assertEqual(len(stub.charges), 1)
+        self.assertEqual(compare(results, results), [])
+
+        slower = dict(results, routes=dict(results['routes']))
+        slower['routes']['home'] = dict(results['routes']['home'], p95=results['routes']['home']['p95'] * 2 + 1)
+        self.assertEqual(len(compare(results, slower)), 1)
+
+    def test_render_benchmark(self):
+        results = run_render_benchmark(sizes=(3,), repeat=2)
+        self.assertEqual(set(results[3]), {name for name, _, _ in RENDER_SCENARIOS})
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every route of ``core.urls`` and every admin changelist has an upper
+    bound on its queries, which must not depend on the size of the cart or
+    the number of orders. Caches are cleared before each request, so the
+    budgets hold for the cold path.
+    """
+    # Shop sizes (see make_shop): 1, 5 and 20 past orders, payments and
+    # refund requests, with carts of 3, 7 and 22 lines.
+    SIZES = (1, 5, 20)
+
+    # Keyed by URL name, plus the method when it is not GET.
+    BUDGETS = {
+        'home': 6,
+        'search': 6,
+        'product': 5,
+        'order-summary': 7,
+        'checkout': 7,
+        'payment': 8,
+        'payment-status': 5,
+        'request-refund': 4,
+        'api-payment-status': 3,
+        'api-request-stats': 2,
+        'checkout POST': 11,
+        'add-coupon POST': 5,
+        'request-refund POST': 3,
+        'add-to-cart': 9,
+        'api-cart-add POST': 10,
+        'remove-item-from-cart': 9,
+        'api-cart-decrement POST': 10,
+        'remove-from-cart': 10,
+        'api-cart-remove POST': 11,
+        'payment POST': 12,
+        'export': 3,
+    }
+
+    # Keyed by model name.
+    ADMIN_BUDGETS = {
+        'item': 5,
+        'orderitem': 5,
+        'order': 7,
+        'payment': 7,
+        'coupon': 5,
+        'stockreservation': 5,
+        'refund': 5,
+    }
+
+    def make_shop(self, size):
+        """
+        A staff user with ``size`` items in their cart plus two more, a
+        coupon, a billing address, ``size`` past orders with payments and
+        refund requests, and a pending payment.
+        """
+        user = User.objects.create_user('shopper%d' % size, password='secret', is_staff=True, is_superuser=True)
+        items = [make_item('item-%d-%d' % (size, n), price=10.0 + n, price_discount=5.0 if n % 2 else None)
+                 for n in range(size + 2)]
+        Item.objects.filter(pk__in=[item.pk for item in items]).update(stock=100)
+        cart = CartService(user)
+        for item in items:
+            cart.add(item, 2)
+        address = BillingAddress.objects.create(
+            user=user, street_address='1 Main St', apartment_address='', country='US', zip='10001')
+        coupon = Coupon.objects.create(code='SAVE%d' % size, amount=5.0)
+        Order.objects.filter(user=user, ordered=False).update(billing_address=address)
+        for n in range(size):
+            payment = Payment.objects.create(user=user, amount=1000, status=Payment.SUCCEEDED)
+            order = Order.objects.create(
+                user=user, ordered=True, ordered_date=timezone.now(), ref_code='ref-%d-%d' % (size, n),
+                billing_address=address, coupon=coupon, payment=payment)
+            order.items.add(OrderItem.objects.create(user=user, item=items[n], ordered=True))
+            Refund.objects.create(order=order, reason='Too small', email='shopper@example.com')
+        pending = Payment.objects.create(user=user, amount=1000)
+        return user, items, coupon, pending
+
+    def shop_requests(self, size, items, coupon, pending):
+        """
+        (label, method, url, data) of every route, reads before writes and
+        the payment right after the checkout, as a customer makes them.
+        """
+        first, last = items[0].slug, items[-1].slug
+        return [
+            ('home', 'get', reverse('core:home'), None),
+            ('search', 'get', reverse('core:search'), {'q': 'item'}),
+            ('product', 'get', reverse('core:product', kwargs={'slug': first}), None),
+            ('order-summary', 'get', reverse('core:order-summary'), None),
+            ('checkout', 'get', reverse('core:checkout'), None),
+            ('payment', 'get', reverse('core:payment', kwargs={'payment_option': 'stripe'}), None),
+            ('payment-status', 'get', reverse('core:payment-status', kwargs={'key': pending.idempotency_key}), None),
+            ('request-refund', 'get', reverse('core:request-refund'), None),
+            ('api-payment-status', 'get', reverse('core:api-payment-status', kwargs={'key': pending.idempotency_key}), None),
+            ('api-request-stats', 'get', reverse('core:api-request-stats'), None),
+            ('export', 'get', reverse('core:export', kwargs={'kind': 'orders'}), None),
+            ('add-coupon POST', 'post', reverse('core:add-coupon'), {'code': coupon.code}),
+            ('request-refund POST', 'post', reverse('core:request-refund'),
+             {'ref_code': 'ref-%d-0' % size, 'message': 'Too small', 'email': 'shopper@example.com'}),
+            ('add-to-cart', 'get', reverse('core:add-to-cart', kwargs={'slug': first}), None),
+            ('api-cart-add POST', 'post', reverse('core:api-cart-add', kwargs={'slug': first}), None),
+            ('remove-item-from-cart', 'get', reverse('core:remove-item-from-cart', kwargs={'slug': first}), None),
+            ('api-cart-decrement POST', 'post', reverse('core:api-cart-decrement', kwargs={'slug': first}), None),
+            ('remove-from-cart', 'get', reverse('core:remove-from-cart', kwargs={'slug': first}), None),
+            ('api-cart-remove POST', 'post', reverse('core:api-cart-remove', kwargs={'slug': last}), None),
+            ('checkout POST', 'post', reverse('core:checkout'), CHECKOUT_DATA),
+            ('payment POST', 'post', reverse('core:payment', kwargs={'payment_option': 'stripe'}),
+             {'stripeToken': 'tok_visa'}),
+        ]
+
+    def admin_requests(self):
+        return [
+            (model._meta.model_name, 'get',
+             reverse('admin:%s_%s_changelist' % (model._meta.app_label, model._meta.model_name)), None)
+            for model in admin.site._registry if model._meta.app_label == 'core'
+        ]
+
+    def measure(self, requests):
+        """Run ``requests`` and return ``{label: captured queries}``."""
+        captured = {}
+        for label, method, url, data in requests:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, label)
+            captured[label] = queries.captured_queries
+        return captured
+
+    def assertWithinBudgets(self, budgets, measurements):
+        for label, budget in budgets.items():
+            runs = {size: captured[label] for size, captured in measurements.items()}
+            counts = {size: len(queries) for size, queries in runs.items()}
+            largest = max(runs, key=counts.get)
+            sql = '\n'.join('  %s' % query['sql'] for query in runs[largest])
+            self.assertLessEqual(counts[largest], budget, '%s ran %d queries (budget %d) at size %d:\n%s' % (
+                label, counts[largest], budget, largest, sql))
+            self.assertEqual(len(set(counts.values())), 1, '%s ran %s queries by size, at size %d:\n%s' % (
+                label, counts, largest, sql))
+
+    def test_every_route_has_a_budget(self):
+        routes = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(routes, {label.split()[0] for label in self.BUDGETS})
+        models = {model._meta.model_name for model in admin.site._registry if model._meta.app_label == 'core'}
+        self.assertEqual(models, set(self.ADMIN_BUDGETS))
+
+    def test_shop_routes(self):
+        measurements = {}
+        for size in self.SIZES:
+            user, *fixture = self.make_shop(size)
+            self.client.force_login(user)
+            measurements[size] = self.measure(self.shop_requests(size, *fixture))
+        self.assertWithinBudgets(self.BUDGETS, measurements)
+
+    def test_admin_changelists(self):
+        measurements = {}
+        for size in self.SIZES:
+            user, *_ = self.make_shop(size)
+            self.client.force_login(user)
+            measurements[size] = self.measure(self.admin_requests())
+        self.assertWithinBudgets(self.ADMIN_BUDGETS, measurements)
@@ -1,12 +1,16 @@
 from django.urls import path
+from . import api
 from .views import (
     HomeView,
+    SearchView,
     CheckoutView,
     ItemDetailView,
     OrderItemView,
     PaymentView,
+    PaymentStatusView,
     AddCouponView,
     RequestRefundView,
+    export,
     add_to_cart,
     remove_from_cart,
     remove_item_from_cart,
@@ -16,6 +20,7 @@ app_name = 'core'
 
 urlpatterns = [
     path('', HomeView.as_view(), name='home'),
+    path('search/', SearchView.as_view(), name='search'),
     path('checkout/', CheckoutView.as_view(), name='checkout'),
     path('product/<slug>/', ItemDetailView.as_view(), name='product'),
     path('add-to-cart/<slug>/', add_to_cart, name='add-to-cart'),
@@ -24,5 +29,12 @@ urlpatterns = [
     path('order-summary/', OrderItemView.as_view(), name='order-summary'),
     path('remove-item-from-cart/<slug>', remove_item_from_cart, name='remove-item-from-cart'),
     path('payment/<payment_option>/', PaymentView.as_view(), name='payment'),
+    path('payment/status/<uuid:key>/', PaymentStatusView.as_view(), name='payment-status'),
     path('request-refund/', RequestRefundView.as_view(), name='request-refund'),
+    path('exports/<kind>/', export, name='export'),
+    path('api/cart/add/<slug>/', api.cart_add, name='api-cart-add'),
+    path('api/cart/decrement/<slug>/', api.cart_decrement, name='api-cart-decrement'),
+    path('api/cart/remove/<slug>/', api.cart_remove, name='api-cart-remove'),
+    path('api/payment/<uuid:key>/', api.payment_status, name='api-payment-status'),
+    path('api/stats/requests/', api.request_stats, name='api-request-stats'),
 ]
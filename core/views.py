@@ -1,47 +1,228 @@
-import uuid
+import hashlib
+
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.exceptions import ObjectDoesNotExist
-from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import DetailView, ListView, View
-from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.views.decorators.http import condition
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib import messages
-from .models import Item, OrderItem, Order, BillingAddress, Payment, Coupon, Refund
+from .cart import get_cart_summary, invalidate_cart_summary
+from .catalog import get_catalog_version, get_item, get_item_version, set_item_versions
+from .coupons import get_coupon
+from .exports import EXPORTS, FORMATS, parse_export_date, stream_export
+from .guest_cart import GuestCart, get_cart, set_guest_cart_cookie
+from .inventory import extend_reservations, reserve_order
+from .page_cache import cache_page_with_holes
+from .payments import create_payment
+from .services import CartService
+from .facets import get_facet_counts, get_facet_filters
+from .pagination import paginate_keyset
+from .search import search_items
+from .models import Item, Order, BillingAddress, Payment, Refund
 from .forms import CheckoutForm, CouponForm, RefundForm
-import stripe
 
 
+def _user_etag(request):
+    """
+    The per-visitor part of a catalog page's ETag: who is logged in, their
+    (or the guest's) cart badge and their CSRF cookie. Returns None while
+    messages are waiting to be shown, or before the visitor has a CSRF
+    cookie, so such a page is always rendered.
+    """
+    # Reading the cookie rather than calling get_token() keeps a 304 from
+    # setting one; the token in a page stays valid as long as the cookie.
+    csrf_cookie = request.META.get('CSRF_COOKIE')
+    if csrf_cookie is None or len(messages.get_messages(request)):
+        return None
+    user = request.user
+    if user.is_authenticated:
+        line_count = get_cart_summary(user)['line_count']
+    else:
+        line_count = GuestCart.from_request(request).line_count()
+    state = '%s-%s-%s' % (user.pk, line_count, csrf_cookie)
+    return hashlib.md5(state.encode()).hexdigest()
+
+
+def _user_last_modified(request, last_modified):
+    # The navbar shows the visitor's cart, which Last-Modified cannot
+    # account for; browsers with a cart revalidate with the ETag instead.
+    if request.user.is_authenticated or len(messages.get_messages(request)):
+        return None
+    if GuestCart.from_request(request).line_count():
+        return None
+    return last_modified
+
+
+def _catalog_etag(request, *args, **kwargs):
+    user_etag = _user_etag(request)
+    if user_etag is None:
+        return None
+    return 'catalog-%s-%s' % (get_catalog_version()[0], user_etag)
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return _user_last_modified(request, get_catalog_version()[1])
+
+
+def _item_etag(request, slug):
+    user_etag = _user_etag(request)
+    if user_etag is None:
+        return None
+    return 'item-%s-%s' % (get_item_version(slug), user_etag)
+
+
+def _item_last_modified(request, slug):
+    try:
+        modified = get_item(slug).modified
+    except Item.DoesNotExist:
+        return None
+    return _user_last_modified(request, modified)
+
+
+def _catalog_page_version(request, *args, **kwargs):
+    return get_catalog_version()[0]
+
+
+def _item_page_version(request, slug):
+    return get_item_version(slug)
 
+
+@method_decorator(condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified), name='dispatch')
+@method_decorator(cache_page_with_holes(_catalog_page_version), name='dispatch')
 class HomeView(ListView):
     model = Item
     paginate_by = 10
     template_name = 'home-page.html'
 
-class OrderItemView(LoginRequiredMixin, View):
+    def get_queryset(self):
+        self.filters = get_facet_filters(self.request.GET)
+        return super().get_queryset().filter(**self.filters)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['facets'] = get_facet_counts()
+        context['filters'] = self.filters
+        context['filter_query'] = urlencode(self.filters)
+        context['fragment_timeout'] = settings.CATALOG_CACHE_TIMEOUT
+        set_item_versions(context['object_list'])
+        return context
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(
+            queryset,
+            page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return None, page, page.object_list, page.has_other_pages()
+
+@method_decorator(cache_page_with_holes(_catalog_page_version), name='dispatch')
+class SearchView(View):
+    paginate_by = 10
+
     def get(self, *args, **kwargs):
+        query = self.request.GET.get('q', '').strip()
         try:
-            order = Order.objects.get(user=self.request.user, ordered=False)
-            context = {'object': order}
+            page = max(1, int(self.request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        # One extra result tells whether there is a next page, so no count
+        # of the matches is needed.
+        items = search_items(query, offset=(page - 1) * self.paginate_by, limit=self.paginate_by + 1)
+        context = {
+            'query': query,
+            'object_list': set_item_versions(items[:self.paginate_by]),
+            'page': page,
+            'has_next': len(items) > self.paginate_by,
+            'fragment_timeout': settings.CATALOG_CACHE_TIMEOUT,
+        }
+        return render(self.request, 'search.html', context)
+
+class OrderItemView(View):
+    def get(self, *args, **kwargs):
+        if not self.request.user.is_authenticated:
+            return self.get_guest_cart()
+        try:
+            order = (Order.objects
+                     .select_related('coupon')
+                     .prefetch_related('items__item')
+                     .get(user=self.request.user, ordered=False))
+            context = {'object': order, 'order_items': order.items.all()}
         except ObjectDoesNotExist:
             messages.warning(self.request ,"You do not have an active order.")
             return redirect('core:home')
         return render(self.request, 'order-summary.html', context)
 
+    def get_guest_cart(self):
+        cart = GuestCart.from_request(self.request)
+        order_items = cart.get_order_items()
+        if not order_items:
+            messages.warning(self.request ,"You do not have an active order.")
+            return redirect('core:home')
+        context = {'object': cart.get_order(order_items), 'order_items': order_items}
+        return render(self.request, 'order-summary.html', context)
+
+def _get_item_or_404(slug):
+    try:
+        return get_item(slug)
+    except Item.DoesNotExist:
+        raise Http404('No item found matching the query')
+
+@method_decorator(condition(etag_func=_item_etag, last_modified_func=_item_last_modified), name='dispatch')
+@method_decorator(cache_page_with_holes(_item_page_version), name='dispatch')
 class ItemDetailView(DetailView):
     model = Item
     template_name = 'product.html'
 
-class CheckoutView(View):
+    def get_object(self, queryset=None):
+        return _get_item_or_404(self.kwargs['slug'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['item_version'] = get_item_version(self.object.slug)
+        context['fragment_timeout'] = settings.CATALOG_CACHE_TIMEOUT
+        return context
+
+def _order_snippet_context(order):
+    # The snippet is cached by order and catalog version, so its lines are
+    # only read (lazily, by the template) when it is rendered.
+    return {
+        'order_items': order.items.select_related('item'),
+        'catalog_version': get_catalog_version()[0],
+        'fragment_timeout': settings.CATALOG_CACHE_TIMEOUT,
+    }
+
+def _reserve_stock(request, order):
+    """
+    Hold the stock of ``order`` until it is paid for, or tell the customer
+    which items ran out. Returns whether the order can go ahead.
+    """
+    missing = reserve_order(order)
+    for item in missing:
+        if item.available:
+            messages.warning(request, "Sorry, only %d of %s are left." % (item.available, item.title))
+        else:
+            messages.warning(request, "Sorry, %s is out of stock." % item.title)
+    return not missing
+
+class CheckoutView(LoginRequiredMixin, View):
     def get(self, *args, **kwargs):
         try:
-            order = Order.objects.get(user=self.request.user, ordered=False)
+            order = (Order.objects
+                     .select_related('coupon')
+                     .get(user=self.request.user, ordered=False))
             form = CheckoutForm()
             context = {
                 'form': form,
                 'couponForm': CouponForm(),
                 'order':order,
                 'display_coupon_form': True,
+                **_order_snippet_context(order),
             }
             return render(self.request, 'checkout-page.html', context)
         except ObjectDoesNotExist:
@@ -53,6 +234,8 @@ class CheckoutView(View):
         try:
             order = Order.objects.get(user=self.request.user, ordered=False)
             if form.is_valid():
+                if not _reserve_stock(self.request, order):
+                    return redirect('core:order-summary')
                 street_address = form.cleaned_data.get('street_address')
                 apartment_address = form.cleaned_data.get('apartment_address')
                 country = form.cleaned_data.get('country')
@@ -70,7 +253,7 @@ class CheckoutView(View):
                 )
                 billing_address.save()
                 order.billing_address = billing_address
-                order.save()
+                order.save(update_fields=['billing_address'])
 
                 if payment_option == 'S':
                     return redirect('core:payment', payment_option='stripe')
@@ -83,46 +266,35 @@ class CheckoutView(View):
             messages.warning(self.request ,"You do not have an active order.")
             return redirect('core:order-summary')
 
-@login_required()
+def _payment_pending(request, result):
+    if result.status != CartService.PAYMENT_PENDING:
+        return False
+    messages.warning(request, "Your cart cannot be changed while your payment is being processed.")
+    return True
+
 def add_to_cart(request, slug):
-    item = get_object_or_404(Item, slug=slug)
-    order_item, created = OrderItem.objects.get_or_create(
-        item=item,
-        user=request.user,
-        ordered=False
-    )
-    order_qs = Order.objects.filter(user=request.user, ordered=False)
-    if order_qs.exists():
-        order = order_qs[0]
-        # check if the order item is in the order
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item.quantity += 1
-            order_item.save()
-            messages.info(request, "This item quantity was updated.")
-        else:
-            order.items.add(order_item)
-            messages.info(request, "This item was added to your cart.")
+    item = _get_item_or_404(slug)
+    result = get_cart(request).add(item)
+    if _payment_pending(request, result):
+        return redirect("core:order-summary")
+    if result.status == CartService.UPDATED:
+        messages.info(request, "This item quantity was updated.")
     else:
-        ordered_date = timezone.now()
-        order = Order.objects.create(
-            user=request.user, ordered_date=ordered_date)
-        order.items.add(order_item)
         messages.info(request, "This item was added to your cart.")
-    return redirect("core:order-summary")
-
-
-def _create_ref_code():
-    return str(uuid.uuid4())
+    return set_guest_cart_cookie(request, redirect("core:order-summary"))
 
 
-class PaymentView(View):
+class PaymentView(LoginRequiredMixin, View):
     def get(self, *args, **kwargs):
-        order = Order.objects.get(user=self.request.user, ordered=False)
+        order = (Order.objects
+                 .select_related('coupon')
+                 .get(user=self.request.user, ordered=False))
         if order.billing_address:
             context = {
                 'order': order,
                 'couponForm': CouponForm(),
                 'display_coupon_form': False,
+                **_order_snippet_context(order),
             }
             return render(self.request, 'payment.html', context)
         else:
@@ -131,120 +303,53 @@ class PaymentView(View):
 
     def post(self, *args, **kwargs):
         order = Order.objects.get(user=self.request.user, ordered=False)
-        amount = int(order.get_total_price() * 100) # x100 since it's in cents
+        # The stock was reserved at checkout; it is only reserved again if
+        # the cart changed or the reservation ran out since.
+        if not extend_reservations(order) and not _reserve_stock(self.request, order):
+            return redirect('core:order-summary')
         token = self.request.POST.get('stripeToken')
+        # The charge itself is made by a payment worker, the customer
+        # waits for it on the status page.
+        payment = create_payment(order, self.request.user, token)
+        if payment is None:
+            messages.warning(self.request, "Your coupon has been used up and was removed from your order.")
+            return redirect('core:checkout')
+        return redirect('core:payment-status', key=payment.idempotency_key)
 
-        try:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
-            charge = stripe.Charge.create(
-                amount=amount,
-                currency="usd",
-                source=token,
-            )
-
-            # Create the payment
-            payment = Payment()
-            payment.stripe_charge_id = charge.id
-            payment.user = self.request.user
-            payment.amount = amount
-            payment.save()
-
-            # Assign the payment to the order
-
-            order_items = order.items.all()
-            order_items.update(ordered=True)
-            for item in order_items:
-                item.save()
-
-            order.ordered = True
-            order.payment = payment
-            order.ref_code = _create_ref_code()
-            order.save()
-
-            messages.success(self.request, "Your order was successful.")
-        except stripe.error.CardError as e:
-            # Since it's a decline, stripe.error.CardError will be caught
-
-            messages.warning(self.request, f'{e.error.message}')
-
-            print('Status is: %s' % e.http_status)
-            print('Type is: %s' % e.error.type)
-            print('Code is: %s' % e.error.code)
-            # param is '' in this case
-            print('Param is: %s' % e.error.param)
-            print('Message is: %s' % e.error.message)
-        except stripe.error.RateLimitError as e:
-            messages.warning(self.request, "Rate limit error.")
-        except stripe.error.InvalidRequestError as e:
-            messages.warning(self.request, "Invalid parameters.")
-        except stripe.error.AuthenticationError as e:
-            # Authentication with Stripe's API failed
-            # (maybe you changed API keys recently)
-            messages.warning(self.request, "Authentication error.")
-        except stripe.error.APIConnectionError as e:
-            # Network communication with Stripe failed
-            messages.warning(self.request, "Network error.")
-        except stripe.error.StripeError as e:
-            # Display a very generic error to the user, and maybe send
-            # yourself an email
-            messages.warning(self.request, "Something went wrong. You were not charged. Please try again.")
-        except Exception as e:
-            # Something else happened, completely unrelated to Stripe
-            # Send email to admin
-            messages.warning(self.request, "A system error occured. We have been notified.")
-        finally:
-            return redirect('core:home')
 
-@login_required()
+class PaymentStatusView(LoginRequiredMixin, View):
+    def get(self, *args, **kwargs):
+        payment = get_object_or_404(Payment, idempotency_key=kwargs['key'], user=self.request.user)
+        return render(self.request, 'payment-status.html', {'payment': payment})
+
 def remove_from_cart(request, slug):
-    item = get_object_or_404(Item, slug=slug)
-    order_qs = Order.objects.filter(user=request.user, ordered=False)
-    if order_qs.exists():
-        order = order_qs[0]
-        # check if the order item is in the order
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item = OrderItem.objects.filter(
-                item=item,
-                user=request.user,
-                ordered=False
-            )[0]
-            order.items.remove(order_item)
-            messages.info(request, "This item was removed from your cart.")
-            return redirect("core:order-summary")
-        else:
-            # add a message that the user doesnt have an order
-            messages.info(request, "This item was not in your cart.")
-            return redirect("core:product", slug=slug)
+    item = _get_item_or_404(slug)
+    result = get_cart(request).remove(item)
+    if _payment_pending(request, result):
+        return redirect("core:order-summary")
+    if result.status == CartService.REMOVED:
+        messages.info(request, "This item was removed from your cart.")
+        return redirect("core:order-summary")
+    elif result.status == CartService.NOT_IN_CART:
+        messages.info(request, "This item was not in your cart.")
+        return redirect("core:product", slug=slug)
     else:
         # add a message that the user doesnt have an order
         messages.warning(request, "You do not have an order.")
         return redirect("core:product", slug=slug)
 
 
-@login_required()
 def remove_item_from_cart(request, slug):
-    item = get_object_or_404(Item, slug=slug)
-    order_qs = Order.objects.filter(user=request.user, ordered=False)
-    if order_qs.exists():
-        order = order_qs[0]
-        # check if the order item is in the order
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item = OrderItem.objects.filter(
-                item=item,
-                user=request.user,
-                ordered=False
-            )[0]
-            if order_item.quantity > 1:
-                order_item.quantity -= 1
-                order_item.save()
-            else:
-                order.items.remove(order_item)
-            messages.info(request, "This item quantity was updated.")
-            return redirect("core:order-summary")
-        else:
-            # add a message that the user doesnt have an order
-            messages.info(request, "This item was not in your cart.")
-            return redirect("core:order-summary", slug=slug)
+    item = _get_item_or_404(slug)
+    result = get_cart(request).decrement(item)
+    if _payment_pending(request, result):
+        return redirect("core:order-summary")
+    if result.status in (CartService.UPDATED, CartService.REMOVED):
+        messages.info(request, "This item quantity was updated.")
+        return redirect("core:order-summary")
+    elif result.status == CartService.NOT_IN_CART:
+        messages.info(request, "This item was not in your cart.")
+        return redirect("core:order-summary")
     else:
         # add a message that the user doesnt have an order
         messages.warning(request, "You do not have an order.")
@@ -252,11 +357,10 @@ def remove_item_from_cart(request, slug):
 
 
 def _get_coupon(request, code):
-    try:
-        return Coupon.objects.get(code=code)
-    except ObjectDoesNotExist:
+    coupon = get_coupon(code)
+    if coupon is None:
         messages.info(request, "Coupon code is not valid.")
-        return None
+    return coupon
 
 
 class AddCouponView(View):
@@ -267,9 +371,11 @@ class AddCouponView(View):
                 code = form.cleaned_data.get('code')
                 order = Order.objects.get(user=self.request.user, ordered=False)
                 coupon = _get_coupon(self.request, code)
-                if coupon:
-                    order.coupon = coupon
-                    order.save()
+                if coupon and order.payment_id is not None:
+                    messages.warning(self.request, "Your cart cannot be changed while your payment is being processed.")
+                elif coupon:
+                    order.set_coupon(coupon)
+                    invalidate_cart_summary(self.request.user)
                     messages.success(self.request, "Successfully added coupon.")
             except ObjectDoesNotExist:
                 messages.info(self.request, "You do not have an active order.")
@@ -294,7 +400,7 @@ class RequestRefundView(View):
             try:
                 order = Order.objects.get(ref_code=ref_code)
                 order.refund_requested = True
-                order.save()
+                order.save(update_fields=['refund_requested'])
 
                 refund = Refund()
                 refund.order = order
@@ -306,3 +412,24 @@ class RequestRefundView(View):
                 messages.info(self.request, "This order does not exist")
             finally:
                 return redirect('core:request-refund')
+
+
+@staff_member_required
+def export(request, kind):
+    """
+    Stream an export for accounting, e.g.
+    ``/exports/orders/?format=jsonl&start=2019-01-01&end=2019-12-31``.
+    """
+    if kind not in EXPORTS:
+        raise Http404('Unknown export')
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest('Unknown format')
+    try:
+        start, end = (parse_export_date(request.GET.get(name)) for name in ('start', 'end'))
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be formatted YYYY-MM-DD')
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(stream_export(kind, format, start, end), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (kind, format)
+    return response
@@ -24,7 +24,10 @@ DATABASES = {
     }
 }
 
-STATICFILES_STORAGE = 'storages.backends.azure_storage.AzureStorage'
+# Fingerprinted and gzipped by the build_static command; the blobs' names
+# change with their content, so browsers may cache them for a year.
+STATICFILES_STORAGE = 'core.azure_storage.AzureManifestStorage'
+AZURE_CACHE_CONTROL = 'public, max-age=%d, immutable' % STATIC_MAX_AGE
 AZURE_ACCOUNT_NAME = os.getenv('AZ_STORAGE_ACCOUNT_NAME')
 AZURE_CONTAINER = os.getenv('AZ_STORAGE_CONTAINER')
 AZURE_ACCOUNT_KEY = os.getenv('AZ_STORAGE_KEY')
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -34,6 +35,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware'
 ]
 
+# Per-view query counts and timings, served to staff as JSON at
+# /api/stats/requests/. Off unless REQUEST_STATS_ENABLED is set; each view
+# keeps its last REQUEST_STATS_SAMPLES requests.
+REQUEST_STATS_ENABLED = os.getenv('REQUEST_STATS_ENABLED', '').lower() in ('1', 'true')
+REQUEST_STATS_SAMPLES = 1000
+
 ROOT_URLCONF = 'djecommerce.urls'
 
 TEMPLATES = [
@@ -67,15 +74,49 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
-#STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Stylesheets compiled by the build_static command go to STATIC_BUILD_DIR,
+# which is searched before static/ and so takes the place of the committed
+# copies without overwriting them.
+STATIC_BUILD_DIR = os.path.join(BASE_DIR, 'build')
+STATICFILES_DIRS = [STATIC_BUILD_DIR, os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# SCSS entry points compiled by build_static (when libsass is installed)
+# before collecting, as {source: target} static paths.
+SCSS_ENTRY_POINTS = {
+    'scss/mdb.scss': 'css/mdb.min.css',
+    'scss/style.scss': 'css/style.min.css',
+}
+# Seconds browsers may cache fingerprinted static files, whose names change
+# with their content.
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resized copies of product images, generated in the background on upload
+# by IMAGE_WORKERS threads (0 generates them inline, during the save).
+IMAGE_DERIVATIVE_DIR = 'derivatives'
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960)
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_WORKERS = 2
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, 'db.sqlite3')
+        "NAME": os.path.join(BASE_DIR, 'db.sqlite3'),
+        # In a file rather than in memory, so the concurrency tests can
+        # write to it from several threads.
+        "TEST": {
+            "NAME": os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
+    }
+}
+
+# Guest carts, cart summaries and the catalog, coupon and page versions are
+# kept in the cache, so every process must share it in production (checked
+# at startup, see core.checks). The per-process cache is for development.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -90,6 +131,22 @@ if ENVIRONMENT == 'production':
     SECURE_REDIRECT_EXEMPT = []
     SECURE_SSL_REDIRECT = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.getenv('MEMCACHED_LOCATION', '127.0.0.1:11211').split(','),
+        }
+    }
+    # Fingerprinted and precompressed by the build_static command.
+    STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+    # Compile each template once per process instead of on every render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 
 SITE_ID = 1
@@ -99,6 +156,50 @@ LOGIN_REDIRECT_URL = '/'
 # Crispy forms
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Cart
+# Seconds a user's cart summary (navbar badge) stays cached. Cart views
+# invalidate it on every change, so this only bounds staleness from
+# changes made outside of them (e.g. the admin).
+CART_SUMMARY_TIMEOUT = 60 * 60
+
+# Carts of anonymous visitors are kept in the shared cache (see CACHES)
+# under an id in a signed cookie, and merged into the user's order on
+# login. Seconds an untouched guest cart and its cookie are kept:
+GUEST_CART_TIMEOUT = 60 * 60 * 24 * 14
+GUEST_CART_COOKIE_NAME = 'guest_cart'
+
+# Seconds stock reserved for an order at checkout and payment is held.
+# Expired reservations are released by the release_reservations command,
+# which should run every few minutes.
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Seconds catalog items and rendered product fragments stay cached. Entries
+# are versioned and replaced as soon as an item is saved, so this only
+# bounds how long unused entries occupy the cache.
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds a rendered catalog page stays in the page cache. Pages are keyed
+# by the version of the items they show, so this only bounds how long a
+# page keeps its HTML after a template change.
+PAGE_CACHE_TIMEOUT = 60 * 60
+
 STRIPE_SECRET_KEY = "sk_test_4eC39HqLyjWDarjtT1zdp7dc"
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+
+# Payments
+# Charges run on a pool of worker threads (0 charges inline, in the
+# request). Rate limit and network errors are retried with exponential
+# backoff: PAYMENT_RETRY_BACKOFF, then twice that, and so on.
+PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', 4))
+PAYMENT_MAX_RETRIES = 3
+PAYMENT_RETRY_BACKOFF = 0.5
+
+# Refunds
+# Granted refunds are issued on REFUND_WORKERS threads, sending at most
+# REFUND_RATE_LIMIT requests per second to Stripe (0 for no limit) so a
+# large batch stays under the API rate limit. Errors are retried like
+# charges.
+REFUND_WORKERS = int(os.getenv('REFUND_WORKERS', 8))
+REFUND_RATE_LIMIT = float(os.getenv('REFUND_RATE_LIMIT', 20))
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -0,0 +1,71 @@
+// Progressive enhancement for the cart links: when JavaScript is available,
+// links carrying data-cart-url call the JSON cart API and update the page in
+// place instead of following the href (which redirects to the order summary).
+(function ($) {
+  function getCookie(name) {
+    var match = document.cookie.match(new RegExp('(^|;\\s*)' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[2]) : null;
+  }
+
+  // Formats amounts the way the templates render Python floats.
+  function money(value) {
+    var amount = Number(value);
+    return '$' + (Number.isInteger(amount) ? amount.toFixed(1) : String(amount));
+  }
+
+  function csrfToken() {
+    return $('meta[name="csrf-token"]').attr('content') || getCookie('csrftoken');
+  }
+
+  function showMessage(text) {
+    var alert = $(
+      '<div class="alert alert-info alert-dismissible fade show" role="alert">' +
+        '<span></span>' +
+        '<button type="button" class="close" data-dismiss="alert" aria-label="Close">' +
+        '<span aria-hidden="true">&times;</span></button></div>'
+    );
+    alert.find('span').first().text(text);
+    $('[data-cart-messages]').empty().append(alert);
+  }
+
+  function updateLine(line) {
+    var row = $('[data-cart-line="' + line.slug + '"]');
+    if (!row.length) {
+      return;
+    }
+    if (line.quantity === 0) {
+      row.remove();
+      return;
+    }
+    row.find('[data-line-quantity]').text(line.quantity);
+    row.find('[data-line-total]').text(money(line.final_price));
+    row.find('[data-line-saved]').text(money(line.amount_saved));
+  }
+
+  function updateCart(cart) {
+    $('[data-cart-count]').text(cart.line_count);
+    $('[data-cart-total]').text(money(cart.total));
+    if (cart.line_count === 0 && $('[data-cart-line]').length === 0 && $('[data-cart-summary]').length) {
+      // Let the server render the empty cart state.
+      window.location.reload();
+    }
+  }
+
+  $(document).on('click', 'a[data-cart-url]', function (event) {
+    var link = $(this);
+    event.preventDefault();
+    $.ajax({
+      url: link.data('cart-url'),
+      method: 'POST',
+      headers: {'X-CSRFToken': csrfToken()},
+      dataType: 'json'
+    }).done(function (data) {
+      updateLine(data.line);
+      updateCart(data.cart);
+      showMessage(data.message);
+    }).fail(function () {
+      // Fall back to the plain link, which handles every error case.
+      window.location.href = link.attr('href');
+    });
+  });
+})(jQuery);